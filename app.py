@@ -1,19 +1,294 @@
 #!/usr/bin/python3
 
+import base64
+import bisect
+import json
+import os
 from datetime import datetime
 from flask import Flask, jsonify, request, abort
+from werkzeug.exceptions import Conflict
 from models.city import City
 from models.country import Country
 from models.user import User
 from models.review import Review
 from models.amenity import Amenity
 from models.place import Place
-from data.file_storage import FileStorage
-from data import country_data, place_data, amenity_data, place_to_amenity_data, review_data, user_data, city_data
+from data import UniqueConstraintError, change_bus, save_record, delete_record, get_records, index_manager, country_code_index, city_country_index, review_place_index, review_user_index, place_host_index, place_city_index, place_location_index, place_price_index, place_city_price_index, place_text_index, review_text_index, place_amenity_index, created_at_indexes, model_data, country_data, place_data, amenity_data, place_to_amenity_data, review_data, user_data, city_data
 
 app = Flask(__name__)
 
-storage = FileStorage()
+# check for HBNB_ADMIN=1 from command line to answer the /api/v1/admin routes, only from this machine
+# command to use: HBNB_ADMIN=1 python3 app.py
+admin_enabled = "HBNB_ADMIN" in os.environ and os.environ['HBNB_ADMIN'] == "1"
+ADMIN_ADDRESSES = ("127.0.0.1", "::1")
+
+
+@app.errorhandler(UniqueConstraintError)
+def unique_constraint_error(exc):
+    """ 409 when save_record finds another record with the same unique values """
+    return Conflict(str(exc))
+
+
+# ?limit= when only ?cursor= is given, and the most a page can have
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# characters of JSON collected before a chunk of a streamed list is sent
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def encode_cursor(key):
+    """ Returns the opaque cursor for the (created_at, id) of the last record of a page """
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii').rstrip("=")
+
+
+def decode_cursor(cursor):
+    """ Returns the (created_at, id) in a cursor. Aborts with 400 when it isn't one of ours """
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if isinstance(value, (int, float)) and isinstance(row_id, str):
+            return float(value), row_id
+    except (ValueError, TypeError):
+        pass
+    abort(400, "Invalid cursor")
+
+
+def page_of(model, ids=None):
+    """ Returns the (id, row) pairs of the page asked for with ?limit= and ?cursor=, and the
+    cursor of the next page or None on the last page
+
+    Pages are in the order the records were created, then by id, and start right after the
+    record in the cursor, so each costs O(page size) and records added or deleted in the
+    meantime don't shift them. Without limit or cursor every record is returned.
+    ids limits the records to those e.g. the ones matching a filter.
+    """
+    data = model_data[model]
+    if "limit" not in request.args and "cursor" not in request.args:
+        if ids is None and isinstance(data, dict):
+            # the response is streamed after the view returns, so the ids are copied
+            # for a dict that other requests may add to or delete from in the meantime
+            ids = list(data)
+        if ids is None:
+            return data.items(), None
+        return existing_rows(data, ids), None
+
+    try:
+        limit = int(request.args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        abort(400, "Invalid limit")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        abort(400, "limit must be between 1 and {}".format(MAX_PAGE_SIZE))
+    after = decode_cursor(request.args["cursor"]) if "cursor" in request.args else None
+
+    # one more than the page tells if there is a next page
+    index = created_at_indexes[model]
+    if ids is None:
+        found = index.range(after_key=after, limit=limit + 1)
+    else:
+        keys = sorted((index.value(row_id), row_id) for row_id in ids if index.value(row_id) is not None)
+        start = bisect.bisect_right(keys, after) if after is not None else 0
+        found = keys[start:start + limit + 1]
+
+    rows = existing_rows(data, [row_id for _, row_id in found[:limit]])
+    return rows, encode_cursor(found[limit - 1]) if len(found) > limit else None
+
+
+def existing_rows(data, ids):
+    """ Yields (id, row) for the ids, skipping records deleted since the ids were taken """
+    for row_id in ids:
+        row = data.get(row_id)
+        if row is not None:
+            yield row_id, row
+
+
+def stream_json_list(items):
+    """ Yields a JSON array of the items in chunks of about STREAM_CHUNK_SIZE characters
+
+    Only one chunk is held at a time, and the first is sent before the rest is encoded.
+    The items are encoded like jsonify does, e.g. datetimes as HTTP dates and without spaces.
+    """
+    chunk = ["["]
+    size = 1
+    for i, item in enumerate(items):
+        encoded = app.json.dumps(item, separators=(",", ":"))
+        chunk.append("," + encoded if i else encoded)
+        size += len(encoded) + 1
+        if size >= STREAM_CHUNK_SIZE:
+            yield "".join(chunk)
+            chunk = []
+            size = 0
+    chunk.append("]\n")
+    yield "".join(chunk)
+
+
+def page_response(items, next_cursor):
+    """ Returns a streamed JSON response of a page, with the cursor of the next page in the X-Next-Cursor header
+
+    The items are made while the response is sent, so a whole list is never in memory at once.
+    Works with the Flask development server and gunicorn, which send it with chunked encoding.
+    """
+    response = app.response_class(stream_json_list(items), mimetype="application/json")
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+
+# the fields returned for a record of each model when ?fields= isn't given
+MODEL_FIELDS = {
+    "User": ("id", "first_name", "last_name", "email", "password", "created_at", "updated_at"),
+    "Country": ("id", "name", "code", "created_at", "updated_at"),
+    "City": ("id", "name", "country_id", "created_at", "updated_at"),
+    "Amenity": ("id", "name", "created_at", "updated_at"),
+    "Place": ("id", "host_user_id", "city_id", "name", "description", "address", "latitude", "longitude",
+              "number_of_rooms", "bathrooms", "price_per_night", "max_guests", "created_at", "updated_at"),
+    "Review": ("id", "feedback", "commentor_user_id", "place_id", "rating", "created_at", "updated_at")
+}
+
+# timestamps in the data that are returned as readable datetimes
+DATETIME_FIELDS = ("created_at", "updated_at")
+
+
+def requested_fields(model, extra=(), exclude=()):
+    """ Returns the fields of a model asked for with ?fields= e.g. ?fields=id,name,price_per_night,
+    or all of them when it isn't given. Aborts with 400 on a field the route doesn't return
+
+    extra are the fields a route adds to the record e.g. distance_km, and exclude the
+    fields of the model it never returns.
+    """
+    return parse_fields([field for field in MODEL_FIELDS[model] + tuple(extra) if field not in exclude])
+
+
+def parse_fields(available):
+    """ Returns the fields asked for with ?fields=, or available when it isn't given.
+    Aborts with 400 on a field that isn't available
+    """
+    if "fields" not in request.args:
+        return available
+
+    fields = []
+    for field in request.args["fields"].split(","):
+        field = field.strip()
+        if not field or field in fields:
+            continue
+        if field not in available:
+            abort(400, "Invalid field: {}".format(field))
+        fields.append(field)
+    if not fields:
+        abort(400, "fields must name at least one field")
+    return fields
+
+
+def serialize(row, fields, extra=None):
+    """ Returns the fields of a record, with the timestamps as datetimes
+
+    Only the fields asked for are read and converted, so leaving out e.g. the
+    timestamps skips making their datetimes. extra has the values of the fields
+    the route adds. Fields the row doesn't have e.g. the password of a user
+    loaded without one are left out.
+    """
+    result = {}
+    for field in fields:
+        if extra is not None and field in extra:
+            result[field] = extra[field]
+        elif field not in row:
+            continue
+        elif field in DATETIME_FIELDS:
+            result[field] = datetime.fromtimestamp(row[field])
+        else:
+            result[field] = row[field]
+    return result
+
+
+# the records related to a place that ?include= can add to it
+PLACE_INCLUDES = ("city", "country", "host", "amenities", "reviews")
+
+# places of a streamed list whose related records are looked up together
+INCLUDE_BATCH_SIZE = 100
+
+
+def requested_includes():
+    """ Returns the related records asked for with ?include= e.g. ?include=city,host.
+    Aborts with 400 on one a place doesn't have
+    """
+    includes = []
+    for name in request.args.get("include", "").split(","):
+        name = name.strip()
+        if not name or name in includes:
+            continue
+        if name not in PLACE_INCLUDES:
+            abort(400, "Invalid include: {}".format(name))
+        includes.append(name)
+    return includes
+
+
+def include_related(places, includes):
+    """ Returns the serialized places with the related records in includes added e.g. place["city"]
+
+    places are (row, serialized place) pairs. The ids wanted by all the places are
+    gathered first, then each model is looked up once for all of them and every
+    record is serialized once, however many places share it. A related record that
+    no longer exists is null, or left out of the amenities and reviews.
+    """
+    found = {}
+
+    def look_up(model, ids, fields):
+        rows = get_records(model, ids)
+        for row_id in ids:
+            found[(model, row_id)] = serialize(rows[row_id], fields) if row_id in rows else None
+
+    place_ids = [row["id"] for row, _ in places]
+    if "city" in includes or "country" in includes:
+        look_up("City", {row["city_id"] for row, _ in places}, MODEL_FIELDS["City"])
+    if "country" in includes:
+        # the countries are found through the cities
+        cities = [found[("City", row["city_id"])] for row, _ in places]
+        look_up("Country", {city["country_id"] for city in cities if city is not None}, MODEL_FIELDS["Country"])
+    if "host" in includes:
+        # like /api/v1/places/<place_id>/user the host's password is never returned
+        look_up("User", {row["host_user_id"] for row, _ in places},
+                [field for field in MODEL_FIELDS["User"] if field != "password"])
+
+    amenity_ids = place_to_amenity_data.amenities_of(place_ids) if "amenities" in includes else {}
+    if amenity_ids:
+        look_up("Amenity", {amenity_id for ids in amenity_ids.values() for amenity_id in ids},
+                MODEL_FIELDS["Amenity"])
+    review_ids = review_place_index.ids_of(place_ids) if "reviews" in includes else {}
+    if review_ids:
+        look_up("Review", {review_id for ids in review_ids.values() for review_id in ids}, MODEL_FIELDS["Review"])
+
+    result = []
+    for row, place in places:
+        city = found.get(("City", row["city_id"]))
+        if "city" in includes:
+            place["city"] = city
+        if "country" in includes:
+            place["country"] = found.get(("Country", city["country_id"])) if city is not None else None
+        if "host" in includes:
+            place["host"] = found.get(("User", row["host_user_id"]))
+        if "amenities" in includes:
+            amenities = (found[("Amenity", amenity_id)] for amenity_id in amenity_ids[row["id"]])
+            place["amenities"] = [amenity for amenity in amenities if amenity is not None]
+        if "reviews" in includes:
+            reviews = (found[("Review", review_id)] for review_id in review_ids[row["id"]])
+            place["reviews"] = [review for review in reviews if review is not None]
+        result.append(place)
+    return result
+
+
+def include_related_in_batches(places, includes):
+    """ Yields the serialized places with their related records, looked up for INCLUDE_BATCH_SIZE
+    places at a time so a streamed list never holds more than a batch
+    """
+    batch = []
+    for place in places:
+        batch.append(place)
+        if len(batch) == INCLUDE_BATCH_SIZE:
+            yield from include_related(batch, includes)
+            batch = []
+    if batch:
+        yield from include_related(batch, includes)
+
+
 
 @app.route('/')
 def hello_world():
@@ -31,7 +306,7 @@ def hello_world_post():
 @app.route('/example/country_data')
 def example_country_data():
     """ Example to show that we can view data loaded in the data module's init """
-    return jsonify(country_data)
+    return jsonify(dict(country_data))
 
 @app.route('/example/cities')
 def example_cities():
@@ -67,7 +342,7 @@ def example_cities():
 @app.route('/example/places_amenties_raw')
 def example_places_amenities_raw():
     """ Prints out the raw data for relationships between places and their amenities """
-    return jsonify(place_to_amenity_data)
+    return jsonify(dict(place_to_amenity_data))
 
 @app.route('/example/places_amenties_prettified_example')
 def example_places_amenties_prettified():
@@ -162,30 +437,22 @@ def example_users_places():
     """ prints out places owned by certain users"""
 
     output = {}
-    
-    # Iterate through place data
-    for key in place_data:
-        row = place_data[key]
-        # Extract host user id of current row
-        host_user_id = row['host_user_id']
-        # Initialize user_name to None
-        user_name = None
-
-        # Iterate through user_data
-        for user_key in user_data:
-            row_user = user_data[user_key]
-            # If id in current row matches host_user_id in place
-            if row_user["id"] == host_user_id:
-                # Extract id of user who owns current place
-                user = user_data[host_user_id]
-                # formatted this way to include both first and last name of user
-                user_name = f"{user['first_name']} {user['last_name']}"
-                break
+
+    # Iterate through the users and look up only the places each one hosts
+    for user_key in user_data:
+        place_ids = place_host_index.ids(user_key)
+        if not place_ids:
+            continue
+
+        user = user_data[user_key]
+        # formatted this way to include both first and last name of user
+        user_name = f"{user['first_name']} {user['last_name']}"
 
         if user_name not in output:
             output[user_name] = []
-        
-        output[user_name].append(row['name'])
+
+        for place_id in place_ids:
+            output[user_name].append(place_data[place_id]['name'])
 
     return jsonify(output)
 
@@ -195,27 +462,26 @@ def example_users_places_toilets():
 
     output = {}
 
-    # Loop through each entry in place_data
-    for key in place_data:
-        # Get the current place's data (a dictionary) using the current key
-        row = place_data[key]
+    # Loop through each user and the places they host
+    for user_key in user_data:
+        for place_id in place_host_index.ids(user_key):
+            # Get the current place's data (a dictionary) using the current key
+            row = place_data[place_id]
 
-        # Extract the number of bathrooms from current place_data
-        bathrooms = row['bathrooms']
-        
-        if bathrooms > 0:
-            # Extract user_id from the current place
-            host_user_id = row['host_user_id']
-            # Get user name from user_id
-            user = user_data[host_user_id]
-            user_name = f"{user['first_name']} {user['last_name']}"
-
-            # if user name is not already a key in the output dicitonary, add it
-            if user_name not in output:
-                output[user_name] = []
-            
-            # Append the place name to the list of places for the current user
-            output[user_name].append(row['name'])
+            # Extract the number of bathrooms from current place_data
+            bathrooms = row['bathrooms']
+
+            if bathrooms > 0:
+                # Get user name from user_id
+                user = user_data[user_key]
+                user_name = f"{user['first_name']} {user['last_name']}"
+
+                # if user name is not already a key in the output dicitonary, add it
+                if user_name not in output:
+                    output[user_name] = []
+
+                # Append the place name to the list of places for the current user
+                output[user_name].append(row['name'])
     
     return jsonify(output)
 
@@ -224,22 +490,19 @@ def example_users_places_toilets():
 @app.route('/api/v1/users', methods=["GET"])
 def users_get():
     """returns Users"""
-    data = []
+    # -- Usage example --
+    # curl "[URL]/api/v1/users?limit=50"
+    # the X-Next-Cursor header of the response has the cursor of the next page e.g. &cursor=[cursor]
+    # ?fields= limits the fields of each user e.g. ?fields=id,email, on every GET route
+    fields = requested_fields("User")
+    rows, next_cursor = page_of("User")
 
-    for k, v in user_data.items():
-        user_info = {
-            "id": v['id'],
-            "first_name": v['first_name'],
-            "last_name": v['last_name'],
-            "email": v['email'],
-            "created_at": datetime.fromtimestamp(v['created_at']),
-            "updated_at": datetime.fromtimestamp(v['updated_at'])
-        }
-        if 'password' in v:  # Check if 'password' key exists
-            user_info['password'] = v['password']
-        data.append(user_info)
-    
-    return jsonify(data)
+    def users():
+        for k, v in rows:
+            # the password is only there for users that have one
+            yield serialize(v, fields)
+
+    return page_response(users(), next_cursor)
 
 
 @app.route('/api/v1/users/<user_id>', methods=["GET"])
@@ -252,15 +515,7 @@ def users_specific_get(user_id):
         return "User not found!"
 
     v = user_data[user_id]
-    data.append({
-        "id": v['id'],
-        "first_name": v['first_name'],
-        "last_name": v['last_name'],
-        "email": v['email'],
-        "password": v['password'],
-        "created_at": datetime.fromtimestamp(v['created_at']),
-        "updated_at": datetime.fromtimestamp(v['updated_at'])
-    })
+    data.append(serialize(v, requested_fields("User")))
     return jsonify(data)
 
 @app.route('/api/v1/users', methods=["POST"])
@@ -289,7 +544,7 @@ def users_post():
 
     # add new user data to user_data
     # note that the created_at and updated_at are using timestamps
-    user_data[u.id] = {
+    row = {
         "id": u.id,
         "first_name": u.first_name,
         "last_name": u.last_name,
@@ -298,6 +553,8 @@ def users_post():
         "created_at": u.created_at,
         "updated_at": u.updated_at
     }
+    # emails are unique. save_record answers 409 when they are taken
+    save_record("User", u.id, row)
 
     # note that the created_at and updated_at are using readable datetimes
     attribs = {
@@ -327,21 +584,20 @@ def users_put(user_id):
     if user_id not in user_data:
         abort(400, "User not found for id {}".format(user_id))
 
-    u = user_data[user_id]
+    # changed on a copy so nothing is changed when the request is rejected
+    u = dict(user_data[user_id])
 
-    # modify the values
-    for k, v in data.items():
-        # only first_name and last_name are allowed to be modified
-        if k in ["first_name", "last_name"]:
-            u[k] = v
-        else:
+    # only first_name and last_name are allowed to be modified
+    for k in data:
+        if k not in ["first_name", "last_name"]:
             abort(400, f"Invalid field: {k}")
 
-    # update user_data with the new name - print user_data out to confirm it if you want
-    user_data[user_id] = u
+    # modify the values
+    u.update(data)
 
-    # Save updated user_data back to file
-    # save_success = storage.update_and_save_model_data(user_data, 'data/user.json')
+    # update user_data with the new name - print user_data out to confirm it if you want
+    # The storage saves the change in the background
+    save_record("User", user_id, u)
 
     attribs = {
         "id": u["id"],
@@ -361,13 +617,43 @@ def delete_user(user_id):
     if user_id not in user_data:
         abort(404, "User not found for id {}".format(user_id))
     
-    del user_data[user_id]
-
-    # Save updated user_data back to file
-    # save_success = storage.update_and_save_model_data(user_data, 'data/user.json')
+    # The storage saves the change in the background
+    delete_record("User", user_id)
 
     return jsonify({'message': 'User id {} deleted successfully'.format(user_id)})
 
+@app.route('/api/v1/users/<user_id>/reviews', methods=["GET"])
+def user_specific_reviews_get(user_id):
+    """ returns the reviews written by the specified user """
+    if user_id not in user_data:
+        abort(404, "User not found for id {}".format(user_id))
+
+    data = []
+    fields = requested_fields("Review")
+
+    # Look up only the reviews of the user
+    for review_id in review_user_index.ids(user_id):
+        v = review_data[review_id]
+        data.append(serialize(v, fields))
+
+    return jsonify(data)
+
+@app.route('/api/v1/users/<user_id>/places', methods=["GET"])
+def user_specific_places_get(user_id):
+    """ returns the places hosted by the specified user """
+    if user_id not in user_data:
+        abort(404, "User not found for id {}".format(user_id))
+
+    data = []
+    fields = requested_fields("Place")
+
+    # Look up only the places of the host
+    for place_id in place_host_index.ids(user_id):
+        v = place_data[place_id]
+        data.append(serialize(v, fields))
+
+    return jsonify(data)
+
 # --- COUNTRY ---
 @app.route('/api/v1/countries', methods=["POST"])
 def countries_post():
@@ -393,13 +679,15 @@ def countries_post():
 
     # add new user data to user_data
     # note that the created_at and updated_at are using timestamps
-    country_data[c.id] = {
+    row = {
         "id": c.id,
         "name": c.name,
         "code": c.code,
         "created_at": c.created_at,
         "updated_at": c.updated_at
     }
+    # country codes are unique. save_record answers 409 when they are taken
+    save_record("Country", c.id, row)
 
     # note that the created_at and updated_at are using readable datetimes
     attribs = {
@@ -415,33 +703,26 @@ def countries_post():
 @app.route('/api/v1/countries', methods=["GET"])
 def countries_get():
     """ returns countires data """
-    data = []
+    # pages with ?limit= and ?cursor= as for /api/v1/users
+    fields = requested_fields("Country")
+    rows, next_cursor = page_of("Country")
 
-    for k, v in country_data.items():
-        data.append({
-            "id": v['id'],
-            "name": v['name'],
-            "code": v['code'],
-            "created_at": datetime.fromtimestamp(v['created_at']),
-            "updated_at": datetime.fromtimestamp(v['updated_at'])
-        })
+    def countries():
+        for k, v in rows:
+            yield serialize(v, fields)
 
-    return jsonify(data)
+    return page_response(countries(), next_cursor)
 
 @app.route('/api/v1/countries/<country_code>', methods=["GET"])
 def countries_specific_get(country_code):
     """ returns specific country data """
-    for k, v in country_data.items():
-        if v['code'] == country_code:
-            data = v
-
-    c = {
-        "id": data['id'],
-        "name": data['name'],
-        "code": data['code'],
-        "created_at": datetime.fromtimestamp(data['created_at']),
-        "updated_at": datetime.fromtimestamp(data['updated_at'])
-    }
+    country_id = country_code_index.find(country_code)
+    if country_id is None:
+        abort(404, "Country not found for code {}".format(country_code))
+
+    data = country_data[country_id]
+
+    c = serialize(data, requested_fields("Country"))
 
     return jsonify(c)
 
@@ -459,9 +740,10 @@ def countries_put(country_code):
         abort(400, "Not a JSON")
 
     data = request.get_json()
-    for k, v in country_data.items():
-        if v['code'] == country_code:
-            c = v
+    country_id = country_code_index.find(country_code)
+    if country_id is not None:
+        # changed on a copy so nothing is changed if the new code is taken
+        c = dict(country_data[country_id])
 
     if not c:
         abort(400, "Country not found for code {}".format(country_code))
@@ -475,7 +757,7 @@ def countries_put(country_code):
             abort(400, f"Invalid field: {k}")
 
     # update country_data with the new name - print country_data out to confirm it if you want
-    country_data[c['id']] = c
+    save_record("Country", c['id'], c)
 
     attribs = {
         "id": c["id"],
@@ -494,27 +776,21 @@ def countries_specific_cities_get(country_code):
 
     # Initialize empty list to store cities data
     data = []
+    fields = requested_fields("City")
     
     # Initialize a variable to store the country ID we are looking for
     wanted_country_id = ""
 
-    # Iterate through the country_data dictionary to find the country with the provided country code
-    for k, v in country_data.items():
-        if v['code'] == country_code:
-            # Once the country with the specified code is found, store its ID
-            wanted_country_id = v['id']
-
-    # Iterate through the city_data dictionary to find cities belonging to the country with the wanted_country_id
-    for k, v in city_data.items():
-        if v['country_id'] == wanted_country_id:
-            # If the city belongs to the country, construct a dictionary containing city details and append it to the data list
-            data.append({
-                "id": v['id'],
-                "name": v['name'],
-                "country_id": v['country_id'],
-                "created_at": datetime.fromtimestamp(v['created_at']),
-                "updated_at": datetime.fromtimestamp(v['updated_at'])
-            })
+    # Look up the ID of the country with the provided country code
+    country_id = country_code_index.find(country_code)
+    if country_id is not None:
+        wanted_country_id = country_id
+
+    # Look up only the cities belonging to the country with the wanted_country_id
+    for city_id in city_country_index.ids(wanted_country_id):
+        v = city_data[city_id]
+        # construct a dictionary containing city details and append it to the data list
+        data.append(serialize(v, fields))
 
     return jsonify(data)
 
@@ -530,18 +806,15 @@ def countries_specific_cities_get(country_code):
 @app.route('/api/v1/cities', methods=["GET"])
 def cities_get():
     """returns Cities"""
-    data = []
+    # pages with ?limit= and ?cursor= as for /api/v1/users
+    fields = requested_fields("City")
+    rows, next_cursor = page_of("City")
 
-    for k, v in city_data.items():
-        data.append({
-            "id": v['id'],
-            "name": v['name'],
-            "country_id": v['country_id'],
-            "created_at": datetime.fromtimestamp(v['created_at']),
-            "updated_at": datetime.fromtimestamp(v['updated_at'])
-        })
+    def cities():
+        for k, v in rows:
+            yield serialize(v, fields)
 
-    return jsonify(data)
+    return page_response(cities(), next_cursor)
 
 @app.route('/api/v1/city/<city_id>', methods=["GET"])
 def city_specific_get(city_id):
@@ -553,13 +826,7 @@ def city_specific_get(city_id):
         return "City not found!"
 
     v = city_data[city_id]
-    data.append({
-        "id": v['id'],
-            "name": v['name'],
-            "country_id": v['country_id'],
-            "created_at": datetime.fromtimestamp(v['created_at']),
-            "updated_at": datetime.fromtimestamp(v['updated_at'])
-    })
+    data.append(serialize(v, requested_fields("City")))
     return jsonify(data)
 
 @app.route('/api/v1/cities', methods=["POST"])
@@ -584,13 +851,15 @@ def city_post():
     # add new user data to user_data
     # note that the created_at and updated_at are using timestamps
     
-    city_data[city.id] = {
+    row = {
         "id": city.id,
         "name": city.name,
         "country_id": city.country_id,
         "created_at": city.created_at,
         "updated_at": city.updated_at
     }
+    # city names are unique within their country. save_record answers 409 when they are taken
+    save_record("City", city.id, row)
 
     # note that the created_at and updated_at are using readable datetimes
     attribs = {
@@ -614,9 +883,9 @@ def cities_put(city_id):
         abort(400, "Not a JSON")
 
     data = request.get_json()
-    for k, v in city_data.items():
-        if v['id'] == city_id:
-            C = v
+    if city_id in city_data:
+        # changed on a copy so nothing is changed if the new name is taken
+        C = dict(city_data[city_id])
 
     if not C:
         abort(400, "City not found for id {}".format(city_id))
@@ -633,7 +902,7 @@ def cities_put(city_id):
     C["updated_at"] = datetime.now().timestamp()
 
     # update city_data - print city_data out to confirm it if you want
-    city_data[C['id']] = C
+    save_record("City", C['id'], C)
 
     attribs = {
         "id": C["id"],
@@ -670,13 +939,7 @@ def cities_specific_country_get(city_id):
     c = country_data[country_id]
     
     # Construct country details dictionary with required information
-    country_details = {
-        "id": c['id'],
-        "name": c['name'],
-        "code": c['code'],
-        "created_at": datetime.fromtimestamp(c['created_at']),
-        "updated_at": datetime.fromtimestamp(c['updated_at'])
-    }
+    country_details = serialize(c, requested_fields("Country"))
 
     # Return the country details as JSON response
     return jsonify(country_details)
@@ -687,26 +950,38 @@ def delete_city(city_id):
     if city_id not in city_data:
         abort(404, "City not found for id {}".format(city_id))
     
-    del city_data[city_id]
+    delete_record("City", city_id)
     return jsonify({'message': 'City id {} deleted successfully'.format(city_id)})
 
+@app.route('/api/v1/cities/<city_id>/places', methods=["GET"])
+def city_specific_places_get(city_id):
+    """ returns the places in the specified city """
+    if city_id not in city_data:
+        abort(404, "City not found for id {}".format(city_id))
+
+    data = []
+    fields = requested_fields("Place")
+
+    # Look up only the places of the city
+    for place_id in place_city_index.ids(city_id):
+        v = place_data[place_id]
+        data.append(serialize(v, fields))
+
+    return jsonify(data)
+
 # --- REVIEW ---
 @app.route('/api/v1/reviews', methods=["GET"])
 def reviews_get():
     """Return Reviews"""
-    data = []
+    # pages with ?limit= and ?cursor= as for /api/v1/users
+    fields = requested_fields("Review")
+    rows, next_cursor = page_of("Review")
 
-    for k, v in review_data.items():
-        data.append({
-            "id": v['id'],
-            "feedback": v['feedback'],
-            "commentor_user_id": v["commentor_user_id"],
-            "place_id": v["place_id"],
-            "rating": v["rating"],
-            "created_at": datetime.fromtimestamp(v['created_at']),
-            "updated_at": datetime.fromtimestamp(v['updated_at'])
-        })
-    return jsonify(data)
+    def reviews():
+        for k, v in rows:
+            yield serialize(v, fields)
+
+    return page_response(reviews(), next_cursor)
 
 @app.route('/api/v1/reviews/<review_id>', methods=["GET"])
 def reviews_specific_get(review_id):
@@ -718,15 +993,7 @@ def reviews_specific_get(review_id):
         return "Review not found!"
     
     v = review_data[review_id]
-    data.append({
-            "id": v['id'],
-            "feedback": v['feedback'],
-            "commentor_user_id": v["commentor_user_id"],
-            "place_id": v["place_id"],
-            "rating": v["rating"],
-            "created_at": datetime.fromtimestamp(v['created_at']),
-            "updated_at": datetime.fromtimestamp(v['updated_at'])
-    })
+    data.append(serialize(v, requested_fields("Review")))
     return jsonify(data)
 
 @app.route('/api/v1/reviews', methods=["POST"])
@@ -759,7 +1026,7 @@ def review_post():
     # add new review data to review_data
     # note that the created_at and updated_at are using timestamps
 
-    review_data[r.id] = {
+    save_record("Review", r.id, {
         "id": r.id,
         "feedback": r.feedback,
         "commentor_user_id": r.commentor_user_id,
@@ -767,7 +1034,7 @@ def review_post():
         "rating": r.rating,
         "created_at": r.created_at,
         "updated_at": r.updated_at
-    }
+    })
 
     attribs = {
         "id": r.id,
@@ -795,26 +1062,35 @@ def review_put(review_id):
         abort(400, "Not a JSON")
 
     data = request.get_json()
-    for k, v in review_data.items():
-        if v['id'] == review_id:
-            r = v
+    if review_id in review_data:
+        # changed on a copy so nothing is changed when the request is rejected
+        r = dict(review_data[review_id])
 
     if not r:
         abort(400, "Review not found for id {}".format(review_id))
 
-    # modify the values
-    # only name is allowed to be modified
-    for k, v in data.items():
-        if k in ["feedback", "commentor_user_id", "place_id", "rating"]:
-            r[k]: v
-        else:
+    for k in data:
+        if k not in ["feedback", "commentor_user_id", "place_id", "rating"]:
             abort(400, f"Invalid field: {k}")
 
+    for k in ["feedback", "commentor_user_id", "place_id"]:
+        if k in data and not isinstance(data[k], str):
+            abort(400, f"Invalid {k}: must be a string")
+
+    # the model setters check that the user and place exist and that the rating is valid
+    try:
+        Review(**data)
+    except ValueError as exc:
+        abort(400, str(exc))
+
+    # modify the values
+    r.update(data)
+
      # update 'updated_at' timestamp
     r["updated_at"] = datetime.now().timestamp()
 
     # update review_data - print review data out to confirm if needed
-    review_data[r['id']] = r
+    save_record("Review", r['id'], r)
 
     attribs = {
         "id": r["id"],
@@ -851,22 +1127,7 @@ def review_specific_place_get(review_id):
     p = place_data[place_id]
 
     # Counstruct place details dictionary with required information
-    place_details = {
-        "id": p['id'],
-        "host_user_id": p["host_user_id"],
-        "city_id": p["city_id"],
-        "name": p["name"],
-        "description": p["description"],
-        "address": p["address"],
-        "longitude": p["longitude"],
-        "latitude": p["latitude"],
-        "number_of_rooms": p["number_of_rooms"],
-        "bathrooms": p["bathrooms"],
-        "price_per_night": p["price_per_night"],
-        "max_guests": p["max_guests"],
-        "created_at": datetime.fromtimestamp(p["created_at"]),
-        "updated_at": datetime.fromtimestamp(p["updated_at"])
-    }
+    place_details = serialize(p, requested_fields("Place"))
 
     # Return the place details as JSON response
     return jsonify(place_details)
@@ -895,15 +1156,7 @@ def review_specific_user_get(review_id):
     u = user_data[user_id]
 
     # Counstruct user details dictionary with required information
-    user_details = {
-        "id": u['id'],
-        "first_name": u["first_name"],
-        "last_name": u["last_name"],
-        "email": u["email"],
-        "password": u["password"],
-        "created_at": datetime.fromtimestamp(u["created_at"]),
-        "updated_at": datetime.fromtimestamp(u["updated_at"])
-    }
+    user_details = serialize(u, requested_fields("User"))
 
     # Return the user details as JSON response
     return jsonify(user_details)
@@ -914,7 +1167,7 @@ def delete_review(review_id):
     if review_id not in review_data:
         abort(404, "Review not found for id {}".format(review_id))
     
-    del review_data[review_id]
+    delete_record("Review", review_id)
     return jsonify({'message': 'Review id {} deleted successfully'.format(review_id)})
 
 
@@ -922,16 +1175,15 @@ def delete_review(review_id):
 @app.route('/api/v1/amenities', methods=["GET"])
 def amenity_get():
     """Return Amenities"""
-    data = []
+    # pages with ?limit= and ?cursor= as for /api/v1/users
+    fields = requested_fields("Amenity")
+    rows, next_cursor = page_of("Amenity")
 
-    for k, v in amenity_data.items():
-        data.append({
-            "id": v['id'],
-            "name": v['name'],
-            "created_at": datetime.fromtimestamp(v['created_at']),
-            "updated_at": datetime.fromtimestamp(v['updated_at'])
-        })
-    return jsonify(data)
+    def amenities():
+        for k, v in rows:
+            yield serialize(v, fields)
+
+    return page_response(amenities(), next_cursor)
 
 
 @app.route('/api/v1/amenities/<amenity_id>', methods=["GET"])
@@ -944,12 +1196,7 @@ def amenity_specific_get(amenity_id):
         return "Amenity not found!"
     
     v = amenity_data[amenity_id]
-    data.append({
-            "id": v['id'],
-            "name": v['name'],
-            "created_at": datetime.fromtimestamp(v['created_at']),
-            "updated_at": datetime.fromtimestamp(v['updated_at'])
-    })
+    data.append(serialize(v, requested_fields("Amenity")))
     return jsonify(data)
 
 @app.route('/api/v1/amenities', methods=["POST"])
@@ -975,12 +1222,14 @@ def amenity_post():
     # add new amenity data to amenity_data
     # note that the created_at and updated_at are using timestamps
 
-    amenity_data[a.id] = {
+    row = {
         "id": a.id,
         "name": a.name,
         "created_at": a.created_at,
         "updated_at": a.updated_at
     }
+    # amenity names are unique. save_record answers 409 when they are taken
+    save_record("Amenity", a.id, row)
 
     attribs = {
         "id": a.id,
@@ -1006,9 +1255,9 @@ def amenity_put(amenity_id):
         abort(400, "Not a JSON")
 
     data = request.get_json()
-    for k, v in amenity_data.items():
-        if v['id'] == amenity_id:
-            a = v
+    if amenity_id in amenity_data:
+        # changed on a copy so nothing is changed if the new name is taken
+        a = dict(amenity_data[amenity_id])
 
     if not a:
         abort(400, "Amenity not found for id {}".format(amenity_id))
@@ -1017,7 +1266,7 @@ def amenity_put(amenity_id):
     # only name is allowed to be modified
     for k, v in data.items():
         if k in ["name"]:
-            a[k]: v
+            a[k] = v
         else:
             abort(400, f"Invalid field: {k}")
 
@@ -1025,7 +1274,7 @@ def amenity_put(amenity_id):
     a["updated_at"] = datetime.now().timestamp()
 
     # update amenity_data - print amenity data out to confirm if needed
-    amenity_data[a['id']] = a
+    save_record("Amenity", a['id'], a)
 
     attribs = {
         "id": a["id"],
@@ -1048,13 +1297,11 @@ def amenity_specific_places_get(amenity_id):
         # raise IndexError("Review not found!")
         return "Amenity not found!"
 
-    # Iterate through the city_data dictionary to find cities belonging to the country with the wanted_country_id
-    for k, v in place_to_amenity_data.items():
-        if 'amenity_id' in v and v['amenity_id'] == amenity_id:
-            # If the city belongs to the country, construct a dictionary containing city details and append it to the data list
-            data.append({
-                "place_id": v['place_id'],
-            })
+    # Look up the places linked to the amenity
+    for place_id in place_to_amenity_data.places(amenity_id):
+        data.append({
+            "place_id": place_id,
+        })
 
     return jsonify(data)
 
@@ -1064,7 +1311,7 @@ def delete_amenity(amenity_id):
     if amenity_id not in amenity_data:
         abort(404, "Amenity not found for id {}".format(amenity_id))
 
-    del amenity_data[amenity_id]
+    delete_record("Amenity", amenity_id)
     return jsonify({'message': 'Amenity id {} deleted successfully'.format(amenity_id)})
 
 
@@ -1072,30 +1319,116 @@ def delete_amenity(amenity_id):
 @app.route('/api/v1/places', methods=["GET"])
 def place_get():
     """Returns Place"""
+    # -- Usage example --
+    # curl "[URL]/api/v1/places?amenities=[wifi_id],[pool_id]&exclude_amenities=[smoking_id]"
+    # Only the places with every amenity in amenities and none in exclude_amenities are listed.
+    # pages with ?limit= and ?cursor= as for /api/v1/users
+    # ?include= adds the related records to each place as for /api/v1/places/<place_id>
+
+    all_of = [amenity_id for amenity_id in request.args.get("amenities", "").split(",") if amenity_id]
+    none_of = [amenity_id for amenity_id in request.args.get("exclude_amenities", "").split(",") if amenity_id]
+    for amenity_id in all_of + none_of:
+        if amenity_id not in amenity_data:
+            abort(400, "Amenity not found for id {}".format(amenity_id))
+
+    # the amenity bitmaps give the matching places without looking at every place
+    matching = place_amenity_index.matching(all_of, none_of) if all_of or none_of else None
+
+    fields = requested_fields("Place")
+    includes = requested_includes()
+    rows, next_cursor = page_of("Place", matching)
+
+    def places():
+        for k, v in rows:
+            yield serialize(v, fields)
+
+    def places_with_related():
+        return include_related_in_batches(((v, serialize(v, fields)) for k, v in rows), includes)
+
+    return page_response(places_with_related() if includes else places(), next_cursor)
+
+@app.route('/api/v1/places/nearby', methods=["GET"])
+def places_nearby_get():
+    """Returns the places near a point, nearest first"""
+    # -- Usage example --
+    # curl "[URL]/api/v1/places/nearby?lat=-37.81&lon=144.96&radius_km=10&k=5"
+    # radius_km limits the distance and k the number of places. With neither, the 10 nearest are returned.
+
+    try:
+        lat = float(request.args["lat"])
+        lon = float(request.args["lon"])
+        radius_km = float(request.args["radius_km"]) if "radius_km" in request.args else None
+        k = int(request.args["k"]) if "k" in request.args else None
+    except KeyError:
+        abort(400, "Missing lat or lon")
+    except ValueError:
+        abort(400, "Invalid lat, lon, radius_km or k")
+
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        abort(400, "lat must be within -90 to 90 and lon within -180 to 180")
+    if radius_km is not None and not radius_km > 0:
+        abort(400, "radius_km must be greater than 0")
+    if k is not None and k < 1:
+        abort(400, "k must be at least 1")
+
+    # the grid index only looks at the cells around the point
+    if k is None and radius_km is not None:
+        found = place_location_index.within(lat, lon, radius_km)
+    else:
+        found = place_location_index.nearest(lat, lon, k or 10, radius_km)
+
     data = []
+    fields = requested_fields("Place", extra=("distance_km",))
+    for distance, place_id in found:
+        v = place_data[place_id]
+        data.append(serialize(v, fields, {"distance_km": round(distance, 3)}))
+    return jsonify(data)
 
-    for k, v in place_data.items():
-        data.append({
-            "id": v['id'],
-            "host_user_id": v['host_user_id'],
-            "city_id": v['city_id'],
-            "name": v['name'],
-            "description": v['description'],
-            "address": v['address'],
-            "latitude": v['latitude'],
-            "longitude": v['longitude'],
-            "number_of_rooms": v['number_of_rooms'],
-            "bathrooms": v['bathrooms'],
-            "price_per_night": v['price_per_night'],
-            "max_guests": v['max_guests'],
-            "created_at": datetime.fromtimestamp(v['created_at']),
-            "updated_at": datetime.fromtimestamp(v['updated_at'])
-        })
+@app.route('/api/v1/places/by_price', methods=["GET"])
+def places_by_price_get():
+    """Returns the places ordered by price, cheapest first"""
+    # -- Usage example --
+    # curl "[URL]/api/v1/places/by_price?min_price=50&max_price=150&city_id=[city_id]&limit=20"
+    # For the next page pass the id of the last place returned e.g. &after=[place_id]
+
+    try:
+        min_price = float(request.args["min_price"]) if "min_price" in request.args else None
+        max_price = float(request.args["max_price"]) if "max_price" in request.args else None
+        limit = int(request.args["limit"]) if "limit" in request.args else None
+    except ValueError:
+        abort(400, "Invalid min_price, max_price or limit")
+
+    if limit is not None and limit < 1:
+        abort(400, "limit must be at least 1")
+
+    city_id = request.args.get("city_id")
+    if city_id is not None and city_id not in city_data:
+        abort(404, "City not found for id {}".format(city_id))
+
+    # the sorted index only looks at the places within the range
+    try:
+        if city_id is None:
+            found = place_price_index.range(min_price, max_price, after=request.args.get("after"), limit=limit)
+        else:
+            found = place_city_price_index.range(min_price, max_price, group=city_id,
+                                                 after=request.args.get("after"), limit=limit)
+    except KeyError:
+        abort(400, "Place {} is not in the listing".format(request.args.get("after")))
+
+    data = []
+    fields = requested_fields("Place")
+    for _, place_id in found:
+        v = place_data[place_id]
+        data.append(serialize(v, fields))
     return jsonify(data)
 
 @app.route('/api/v1/places/<place_id>', methods=["GET"])
 def places_specific_get(place_id):
     """Returns specific place"""
+    # -- Usage example --
+    # curl "[URL]/api/v1/places/[place_id]?include=city,country,host,amenities,reviews"
+    # include adds the related records to the place e.g. "city": {...}, "reviews": [...],
+    # all looked up at once instead of with a request to each of the place's routes
     data = []
 
     if place_id not in place_data:
@@ -1103,22 +1436,11 @@ def places_specific_get(place_id):
         return "Place not found!"
 
     v = place_data[place_id]
-    data.append({
-            "id": v['id'],
-            "host_user_id": v['host_user_id'],
-            "city_id": v['city_id'],
-            "name": v['name'],
-            "description": v['description'],
-            "address": v['address'],
-            "latitude": v['latitude'],
-            "longitude": v['longitude'],
-            "number_of_rooms": v['number_of_rooms'],
-            "bathrooms": v['bathrooms'],
-            "price_per_night": v['price_per_night'],
-            "max_guests": v['max_guests'],
-            "created_at": datetime.fromtimestamp(v['created_at']),
-            "updated_at": datetime.fromtimestamp(v['updated_at'])
-            })
+    place = serialize(v, requested_fields("Place"))
+    includes = requested_includes()
+    if includes:
+        place, = include_related([(v, place)], includes)
+    data.append(place)
     return jsonify(data)
 
 @app.route('/api/v1/places', methods=["POST"])
@@ -1175,7 +1497,7 @@ def place_post():
     # add new place data to place_data
     # note that the created_at and updated_at are using timestamps
 
-    place_data[p.id] = {
+    save_record("Place", p.id, {
         "id": p.id,
         "host_user_id": p.host_user_id,
         "city_id": p.city_id,
@@ -1190,7 +1512,7 @@ def place_post():
         "max_guests": p.max_guests,
         "created_at": p.created_at,
         "updated_at": p.updated_at
-    }
+    })
 
     attribs = {
         "id": p.id,
@@ -1227,28 +1549,41 @@ def place_put(place_id):
         abort(400, "Not a JSON")
 
     data = request.get_json()
-    for k, v in place_data.items():
-        if v['id'] == place_id:
-            p = v
+    if place_id in place_data:
+        # changed on a copy so nothing is changed when the request is rejected
+        p = dict(place_data[place_id])
 
     if not p:
         abort(400, "Place not found for id {}".format(place_id))
 
-    # modify the values
-    # only name is allowed to be modified
-    for k, v in data.items():
-        if k in ["description","address", "latitude", "longitude",
-                 "number_of_rooms", "bathrooms", "price_per_night",
-                 "max_guests", "name", "host_user_id", "city_id"]:
-            p[k]: v
-        else:
+    for k in data:
+        if k not in ["description","address", "latitude", "longitude",
+                     "number_of_rooms", "bathrooms", "price_per_night",
+                     "max_guests", "name", "host_user_id", "city_id"]:
             abort(400, f"Invalid field: {k}")
 
+    # the setters of the model expect strings and it has none for the numbers, so the types are checked here
+    for k in ["description", "address", "name", "host_user_id", "city_id"]:
+        if k in data and not isinstance(data[k], str):
+            abort(400, f"Invalid {k}: must be a string")
+    for k in ["latitude", "longitude", "number_of_rooms", "bathrooms", "price_per_night", "max_guests"]:
+        if k in data and (isinstance(data[k], bool) or not isinstance(data[k], (int, float))):
+            abort(400, f"Invalid {k}: must be a number")
+
+    # the model setters check the name and that the host and city exist
+    try:
+        Place(**data)
+    except ValueError as exc:
+        abort(400, str(exc))
+
+    # modify the values
+    p.update(data)
+
     # update 'updated_at' timestamp
     p["updated_at"] = datetime.now().timestamp()
 
     # update palce_data - print place data out to confirm if needed
-    place_data[p['id']] = p
+    save_record("Place", p['id'], p)
 
     attribs = {
         "id": p["id"],
@@ -1293,14 +1628,7 @@ def place_specific_user_get(place_id):
     u = user_data[user_id]
 
     # Construct user details dictionary with required information
-    user_details = {
-        "id": u["id"],
-        "first_name": u["first_name"],
-        "last_name": u["last_name"],
-        "email": u["email"],
-        "created_at": datetime.fromtimestamp(u["created_at"]),
-        "updated_at": datetime.fromtimestamp(u["updated_at"])
-    }
+    user_details = serialize(u, requested_fields("User", exclude=("password",)))
 
     # Return the user details as JSON response
     return jsonify(user_details)
@@ -1329,13 +1657,7 @@ def place_specific_city_get(place_id):
     C = city_data[city_id]
 
     # Construct city details dictionary with required information
-    city_details = {
-        "id": C['id'],
-        "name": C['name'],
-        "country_id": C['country_id'],
-        "created_at": datetime.fromtimestamp(C['created_at']),
-        "updated_at": datetime.fromtimestamp(C['updated_at'])
-    }
+    city_details = serialize(C, requested_fields("City"))
 
     # Return the city details as JSON response
     return jsonify(city_details)
@@ -1348,28 +1670,17 @@ def place_specific_reviews_get(place_id):
     # Initialize empty list to store reviews data
     data = []
     
-    # Initialize a variable to store the place ID we are looking for
-    wanted_place_id = ""
-
-    # Iterate through the place_data dictionary to find the place with the provided place ID
-    for k, v in place_data.items():
-        if v['id'] == place_id:
-            # Once the place with the specified code is found, store its ID
-            wanted_place_id = v['id']
-
-    # Iterate through the city_data dictionary to find cities belonging to the country with the wanted_country_id
-    for k, v in review_data.items():
-        if v['place_id'] == wanted_place_id:
-            # If the review belongs to the place, construct a dictionary containing review details and append it to the data list
-            data.append({
-                "id": v['id'],
-                "feedback": v['feedback'],
-                "commentor_user_id": v["commentor_user_id"],
-                "place_id": v["place_id"],
-                "rating": v["rating"],
-                "created_at": datetime.fromtimestamp(v['created_at']),
-                "updated_at": datetime.fromtimestamp(v['updated_at'])
-            })
+    # A place that doesn't exist has no reviews
+    if place_id not in place_data:
+        return jsonify(data)
+
+    fields = requested_fields("Review")
+
+    # Look up only the reviews of the place
+    for review_id in review_place_index.ids(place_id):
+        v = review_data[review_id]
+        # construct a dictionary containing review details and append it to the data list
+        data.append(serialize(v, fields))
 
     return jsonify(data)
 
@@ -1378,7 +1689,7 @@ def place_specific_reviews_get(place_id):
 def place_specific_amenities_get(place_id):
     
     if place_id in place_to_amenity_data:
-        return jsonify({place_id: place_to_amenity_data[place_id]}), 200
+        return jsonify({place_id: place_to_amenity_data.amenities(place_id)}), 200
     else:
         return jsonify({"error": "Place ID not found"}), 404
 
@@ -1388,9 +1699,59 @@ def delete_place(place_id):
     if place_id not in place_data:
         abort(404, "Place not found for id {}".format(place_id))
     
-    del place_data[place_id]
+    delete_record("Place", place_id)
     return jsonify({'message': 'Place id {} deleted successfully'.format(place_id)})
 
+@app.route('/api/v1/search', methods=["GET"])
+def search_get():
+    """Returns the places and reviews that match some words, best match first"""
+    # -- Usage example --
+    # curl "[URL]/api/v1/search?q=quiet+beach+house&limit=10"
+    # limit is the number of places and of reviews. The scores are only comparable within each list.
+
+    q = request.args.get("q", "")
+    if not q.strip():
+        abort(400, "Missing q")
+    try:
+        limit = int(request.args["limit"]) if "limit" in request.args else 20
+    except ValueError:
+        abort(400, "Invalid limit")
+    if limit < 1:
+        abort(400, "limit must be at least 1")
+
+    # ?fields= applies to both lists, each leaving out the fields its model doesn't have
+    fields = parse_fields(MODEL_FIELDS["Place"] + MODEL_FIELDS["Review"] + ("score",))
+    place_fields = [field for field in fields if field in MODEL_FIELDS["Place"] or field == "score"]
+    review_fields = [field for field in fields if field in MODEL_FIELDS["Review"] or field == "score"]
+
+    places = []
+    for score, place_id in place_text_index.search(q, limit):
+        v = place_data[place_id]
+        places.append(serialize(v, place_fields, {"score": round(score, 4)}))
+
+    reviews = []
+    for score, review_id in review_text_index.search(q, limit):
+        v = review_data[review_id]
+        reviews.append(serialize(v, review_fields, {"score": round(score, 4)}))
+
+    return jsonify({"places": places, "reviews": reviews})
+
+@app.route('/api/v1/admin/indexes', methods=["GET"])
+def admin_indexes_get():
+    """Returns the stats of every index of this worker, the drift found between them and its data
+    and the metrics of its change bus, null when it has none"""
+    # -- Usage example --
+    # curl [URL]/api/v1/admin/indexes
+    # or: python3 -m data.check_indexes [URL]
+    # Each worker has its own indexes, this checks the one that answers.
+    # The check reads every record, so it is only answered with HBNB_ADMIN=1 and from this machine.
+
+    if not admin_enabled or request.remote_addr not in ADMIN_ADDRESSES:
+        abort(404)
+
+    return jsonify({"indexes": index_manager.stats(), "problems": index_manager.check(),
+                    "change_bus": change_bus.stats() if change_bus is not None else None})
+
 # Set debug=True for the server to auto-reload when there are changes
 if __name__ == '__main__':
     app.run(host='localhost', port=5000, debug=True)
@@ -2,20 +2,294 @@
 """ initialize the storage used by models """
 
 import os
+import socket
+import threading
+import time
+from pathlib import Path
+from data.change_bus import ChangeBus
 from data.file_storage import FileStorage
-
-storage = FileStorage()
+from data.index_manager import IndexManager
+from data.indexes import UNIQUE_CONSTRAINTS, UniqueConstraintError, AmenityBitmapIndex, GridIndex, HashIndex, PlaceAmenityIndex, SortedIndex, TextIndex, UniqueIndex
+from data.place_columns import ColumnarPlaceData, PlaceColumns
+from data.sqlite_storage import SQLiteStorage
+from data.tracked_dict import TrackedDict
 
 # check for TESTING=1 from command line
 # command to use: TESTING=1 python3 -m unittest discover
 is_testing = "TESTING" in os.environ and os.environ['TESTING'] == "1"
 
-country_data = storage.load_model_data('data/country_testing.json') if is_testing \
-    else storage.load_model_data('data/country.json')
+# check for STORAGE=sqlite from command line to keep the data in SQLite instead of the JSON files
+# command to use: STORAGE=sqlite python3 app.py
+use_sqlite = "STORAGE" in os.environ and os.environ['STORAGE'] == "sqlite"
+
+country_filename = 'data/country_testing.json' if is_testing else 'data/country.json'
+
+# place and review can be split into shards with: python3 -m data.shards data/review.json 8
+# the manifest is used instead of the single file once it exists
+place_filename = 'data/place.manifest.json' if Path('data/place.manifest.json').is_file() \
+    else 'data/place.json'
+review_filename = 'data/review.manifest.json' if Path('data/review.manifest.json').is_file() \
+    else 'data/review.json'
+
+data_files = {
+    "Country": (country_filename, "model"),
+    "City": ('data/city.json', "model"),
+    "Amenity": ('data/amenity.json', "model"),
+    "Place": (place_filename, "model"),
+    "User": ('data/user.json', "model"),
+    "Review": (review_filename, "model"),
+    "Place_to_Amenity": ('data/place_to_amenity.json', "many_to_many")
+}
+
+
+if use_sqlite:
+    # Tests get a fresh in-memory database. The JSON files are only imported into empty tables.
+    storage = SQLiteStorage('file:hbnb_testing?mode=memory&cache=shared' if is_testing else 'data/hbnb.db')
+    storage.import_files(data_files)
+
+    country_data = storage.table("Country")
+    city_data = storage.table("City")
+    amenity_data = storage.table("Amenity")
+    place_data = storage.table("Place")
+    user_data = storage.table("User")
+    review_data = storage.table("Review")
+    place_to_amenity_data = storage.many_to_many()
+
+    # lookups by other fields use the indexes of the tables
+    country_code_index = storage.index("Country", "code")
+    city_country_index = storage.index("City", "country_id")
+    review_place_index = storage.index("Review", "place_id")
+    review_user_index = storage.index("Review", "commentor_user_id")
+    place_host_index = storage.index("Place", "host_user_id")
+    place_city_index = storage.index("Place", "city_id")
+    place_location_index = storage.geo_index("Place")
+    place_price_index = storage.sorted_index("Place", "price_per_night")
+    place_city_price_index = storage.sorted_index("Place", "price_per_night", group_by="city_id")
+    place_text_index = storage.text_index("Place", ("name", "description", "address"))
+    review_text_index = storage.text_index("Review", ("feedback",))
+    place_amenity_index = storage.amenity_index()
+
+    unique_indexes = {model: [storage.unique_index(model, fields) for fields in constraints]
+                      for model, constraints in UNIQUE_CONSTRAINTS.items()}
+else:
+    # changes are journaled so that they survive a restart. Tests never write to the journal.
+    # the parsed JSON files are cached in data/.snapshots to make startup faster
+    storage = FileStorage(journal_filename=None if is_testing else 'data/journal.log',
+                          snapshot_dir='data/.snapshots')
+
+    # another worker's changes saved after this are picked up by the change bus below
+    loaded_at = time.time()
+
+    # The places are read from a memory-mapped columns file that every worker shares
+    # instead of each one keeping its own copy. It is rewritten whenever place.json changes.
+    place_columns_filename = 'data/.snapshots/place.columns'
+    if not PlaceColumns.is_fresh(place_columns_filename, place_filename):
+        PlaceColumns.write(place_columns_filename,
+                           storage.load_model_data(place_filename).values(), place_filename)
+
+    # all the other files are loaded at the same time
+    loaded = storage.load_all({name: spec for name, spec in data_files.items() if name != "Place"})
+
+    # the model data is tracked so that only the changed records need to be saved
+    country_data = TrackedDict("Country", loaded["Country"])
+    city_data = TrackedDict("City", loaded["City"])
+    amenity_data = TrackedDict("Amenity", loaded["Amenity"])
+    place_data = ColumnarPlaceData(PlaceColumns(place_columns_filename))
+    user_data = TrackedDict("User", loaded["User"])
+    review_data = TrackedDict("Review", loaded["Review"])
+    # the links are looked up from both the place and the amenity side
+    place_to_amenity_data = PlaceAmenityIndex(loaded["Place_to_Amenity"])
+
+    # bring the data up to date with the changes made since the JSON files were written
+    tracked_data = [country_data, city_data, amenity_data, place_data, user_data, review_data]
+    storage.replay_journal({collection.model: collection for collection in tracked_data})
+
+    # the replayed changes are already on disk
+    for collection in tracked_data:
+        collection.clear_changes()
+
+    # lookups by other fields than the id, built below by the index manager
+    country_code_index = HashIndex("code")
+    city_country_index = HashIndex("country_id")
+    review_place_index = HashIndex("place_id")
+    review_user_index = HashIndex("commentor_user_id")
+    place_host_index = HashIndex("host_user_id")
+    place_city_index = HashIndex("city_id")
+    # places bucketed by their coordinates for the nearby search
+    place_location_index = GridIndex()
+    # a bitmap of places per amenity for filtering by several amenities at once.
+    # place_to_amenity_data passes on the links added and removed.
+    place_amenity_index = AmenityBitmapIndex(place_to_amenity_data)
+    # places ordered by price, overall and within each city
+    place_price_index = SortedIndex("price_per_night")
+    place_city_price_index = SortedIndex("price_per_night", group_by="city_id")
+    # the words of the places and reviews for the search
+    place_text_index = TextIndex(("name", "description", "address"))
+    review_text_index = TextIndex(("feedback",))
+
+    # the values that have to be unique e.g. User.email, see UNIQUE_CONSTRAINTS
+    unique_indexes = {model: [UniqueIndex(model, fields) for fields in constraints]
+                      for model, constraints in UNIQUE_CONSTRAINTS.items()}
+
+    # changes are saved in the background by the storage's flusher thread
+    storage.register(country_data, country_filename)
+    storage.register(city_data, 'data/city.json')
+    storage.register(amenity_data, 'data/amenity.json')
+    storage.register(place_data, place_filename)
+    storage.register(user_data, 'data/user.json')
+    storage.register(review_data, review_filename)
+
+    if not is_testing:
+        storage.start_flusher()
+
+# the data of each model by name
+model_data = {
+    "Country": country_data,
+    "City": city_data,
+    "Amenity": amenity_data,
+    "Place": place_data,
+    "User": user_data,
+    "Review": review_data
+}
+
+
+# every list is paged through in the order the records were created, then by id
+created_at_indexes = {model: storage.sorted_index(model, "created_at") if use_sqlite else SortedIndex("created_at")
+                      for model in model_data}
+
+# every index registers with the manager under its model and field(s)
+index_manager = IndexManager()
+for model, collection in model_data.items():
+    index_manager.add_collection(model, collection)
+index_manager.register("Country", "code", country_code_index)
+index_manager.register("City", "country_id", city_country_index)
+index_manager.register("Review", "place_id", review_place_index)
+index_manager.register("Review", "commentor_user_id", review_user_index)
+index_manager.register("Review", "feedback", review_text_index)
+index_manager.register("Place", "host_user_id", place_host_index)
+index_manager.register("Place", "city_id", place_city_index)
+index_manager.register("Place", ("latitude", "longitude"), place_location_index)
+index_manager.register("Place", "amenities", place_amenity_index)
+index_manager.register("Place", "price_per_night", place_price_index)
+index_manager.register("Place", ("city_id", "price_per_night"), place_city_price_index)
+index_manager.register("Place", ("name", "description", "address"), place_text_index)
+for model, index in created_at_indexes.items():
+    index_manager.register(model, "created_at", index)
+for model, indexes in unique_indexes.items():
+    for index in indexes:
+        index_manager.register(model, index.fields, index, unique=True)
+
+# SQLite keeps its own indexes, the in-memory ones are all built with one read of each model
+if not use_sqlite:
+    index_manager.rebuild()
+
+
+# held while a record and its indexes change, by the routes and by the change bus applying the
+# changes of other workers, so an index is never changed by two threads at once
+write_lock = threading.RLock()
+
+
+def save_record(model, row_id, row):
+    """ Store a new or changed record, update its indexes and have the storage save it
+
+    Every change app.py makes goes through here or delete_record()
+    Raises UniqueConstraintError, and changes nothing, when the record would have the
+    unique values of another. It is checked under the write lock so two requests can't
+    both take a value, though only against the data of this worker (see UNIQUE_CONSTRAINTS).
+    """
+    data = model_data[model]
+    with write_lock:
+        for index in index_manager.unique(model):
+            other_id = index.conflict(row_id, row)
+            if other_id is not None:
+                raise UniqueConstraintError(model, index.fields, other_id)
+
+        exists = row_id in data
+        data[row_id] = row
+        if exists:
+            index_manager.updated(model, row_id, row)
+        else:
+            index_manager.inserted(model, row_id, row)
+    # outside the lock as the storage may take its own locks, which the change bus holds while reloading
+    storage.mark_dirty(data)
+    return row
+
+
+def get_records(model, ids):
+    """ Returns {id: row} for the records with the ids, leaving out the ones that don't exist
+
+    With SQLite they are read with one query instead of one per record.
+    """
+    data = model_data[model]
+    if use_sqlite:
+        return data.get_many(ids)
+    return {row_id: data[row_id] for row_id in ids if row_id in data}
+
+
+def delete_record(model, row_id):
+    """ Delete a record, take it out of its indexes and have the storage save it
+
+    The Place_to_Amenity links of a deleted place or amenity go with it.
+    """
+    data = model_data[model]
+    with write_lock:
+        remove_links(model, row_id)
+        del data[row_id]
+        index_manager.deleted(model, row_id)
+    storage.mark_dirty(data)
+
+
+def remove_links(model, row_id):
+    """ Remove the Place_to_Amenity links of a place or amenity. Other models have none """
+    if model == "Place":
+        for amenity_id in place_to_amenity_data.amenities(row_id):
+            place_to_amenity_data.remove(row_id, amenity_id)
+    elif model == "Amenity":
+        for place_id in place_to_amenity_data.places(row_id):
+            place_to_amenity_data.remove(place_id, row_id)
+
+
+def remove_dangling_links():
+    """ Remove the Place_to_Amenity links of places and amenities that no longer exist
+
+    The links file isn't rewritten when a place or amenity is deleted, so the links of
+    the ones deleted since it was written are dropped when the data is loaded.
+    """
+    for place_id in list(place_to_amenity_data):
+        for amenity_id in place_to_amenity_data.amenities(place_id):
+            if place_id not in place_data or amenity_id not in amenity_data:
+                place_to_amenity_data.remove(place_id, amenity_id)
+
+
+def unlink_deleted(model, row_id, row):
+    """ Change bus listener removing the links of a place or amenity another worker deleted """
+    if row is None:
+        remove_links(model, row_id)
+
+
+def check_unique_constraints():
+    """ Returns the problems found with the unique constraints, e.g. duplicate values or an index
+    that drifted from the data. An empty list means everything is consistent.
+    """
+    problems = []
+    for model, indexes in unique_indexes.items():
+        for index in indexes:
+            problems.extend(index.check(model_data[model].items()))
+    return problems
+
+
+# SQLite deletes the links with the place or amenity
+if not use_sqlite:
+    remove_dangling_links()
 
-city_data = storage.load_model_data('data/city.json')
-amenity_data = storage.load_model_data('data/amenity.json')
-place_data = storage.load_model_data('data/place.json')
-user_data = storage.load_model_data('data/user.json')
-review_data = storage.load_model_data('data/review.json')
-place_to_amenity_data = storage.load_many_to_many_data('data/place_to_amenity.json')
+# every gunicorn worker has its own copy of the data, so the changes of each
+# worker are passed on to the others. SQLite doesn't need this as it is shared.
+change_bus = None
+if not use_sqlite and not is_testing and hasattr(socket, "AF_UNIX"):
+    change_bus = ChangeBus('data/.bus', storage, write_lock=write_lock)
+    for collection in tracked_data:
+        change_bus.register(collection)
+    change_bus.listeners.append(unlink_deleted)
+    change_bus.listeners.append(index_manager.apply)
+    change_bus.start(synced_at=loaded_at)
+    storage.change_bus = change_bus
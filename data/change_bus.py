@@ -0,0 +1,324 @@
+#!/usr/bin/python3
+"""This module passes the changes made by one worker process to all the others
+
+Every gunicorn worker keeps its own copy of the data in memory. Each one binds a
+Unix datagram socket in a shared directory e.g. data/.bus/<pid>.sock, sends its
+changes to every other socket in there and applies the changes it receives to
+its own collections. A message looks like:
+    {"origin": 1234, "sequence": 42, "sent_at": 1700000000.5, "previous_sent_at": 1699999999.8,
+     "changes": [{"model": "User", "op": "put", "id": "...", "row": {...}},
+                 {"model": "User", "op": "delete", "id": "..."}]}
+The rows are sent whole so nothing has to be read back from the JSON files.
+
+Datagrams can be dropped when a worker falls behind. The messages of each worker
+are numbered, so a worker that sees a number skipped, or a first message from a
+worker whose previous one was sent after its data was loaded, knows it missed
+changes. It then reloads its collections from the files and the journal. The
+storage only publishes changes once they are in the journal, so the reload
+includes everything it missed.
+"""
+
+import atexit
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# datagrams bigger than this are split so they stay under the socket buffer size
+MAX_MESSAGE_SIZE = 64 * 1024
+
+
+class ChangeBus():
+    """ Publishes the changes of this worker and applies the changes of the other workers """
+
+    def __init__(self, directory, storage=None, send_timeout=0.05, write_lock=None):
+        """ constructor """
+
+        # every worker using the same directory sees the changes of the others
+        self.directory = directory
+
+        # the FileStorage of this worker
+        self.storage = storage
+
+        # a peer that doesn't read its socket for this many seconds misses the message
+        self.send_timeout = send_timeout
+
+        self.pid = os.getpid()
+        self.collections = {}
+
+        # the number and send time of the last message this worker sent
+        self._sequence = 0
+        self._last_sent_at = None
+
+        # origin -> number of the last message received from that worker
+        self._received = {}
+        # the time the collections were last loaded from disk. Nothing sent before then can be missing.
+        self._synced_at = time.time()
+
+        # functions called with (model, id, row) after a remote change is applied, e.g. to
+        # keep indexes up to date. row is None when the record was deleted.
+        self.listeners = []
+
+        # held while a change is applied and the listeners run, so that they never run at the
+        # same time as a change of this worker. The write path in data/__init__.py passes its own.
+        self.write_lock = write_lock if write_lock is not None else threading.RLock()
+
+        self._socket = None
+        self._sender = None
+        self._receiver = None
+        self._send_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._stats = {"sent": 0, "dropped": 0, "received": 0, "applied": 0, "missed": 0, "reloads": 0,
+                       "last_lag": 0.0, "max_lag": 0.0, "total_lag": 0.0}
+
+    @property
+    def socket_filename(self):
+        """ Returns the socket file of this worker """
+        return os.path.join(self.directory, "{}.sock".format(self.pid))
+
+    def register(self, data):
+        """ Register a TrackedDict so its changes are sent and remote ones applied to it """
+        data.publish_changes = True
+        self.collections[data.model] = data
+
+    def start(self, synced_at=None):
+        """ Bind the socket of this worker and start applying the changes of the others
+
+        synced_at is the time the collections were loaded from disk. A message another
+        worker sent since then and this one never got is noticed by the next one it gets.
+        """
+        if self._receiver is not None:
+            return
+        if synced_at is not None:
+            self._synced_at = synced_at
+
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.socket_filename):
+            # left behind by an earlier process with the same pid
+            os.remove(self.socket_filename)
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self.socket_filename)
+
+        # sent from a separate socket so that only sending has a timeout
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.settimeout(self.send_timeout)
+
+        self._receiver = threading.Thread(target=self._run_receiver, name="ChangeBus-receiver", daemon=True)
+        self._receiver.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """ Stop receiving and remove the socket of this worker """
+        if self._receiver is None:
+            return
+
+        # closing the socket would leave the receiver blocked in recv, so wake it up first
+        try:
+            self._sender.sendto(b"", self.socket_filename)
+        except OSError:
+            pass
+        self._receiver.join()
+        self._receiver = None
+
+        self._socket.close()
+        self._socket = None
+        self._sender.close()
+        self._sender = None
+        if os.path.exists(self.socket_filename):
+            os.remove(self.socket_filename)
+
+    # --- Sending ---
+
+    def publish(self, data):
+        """ Send the records of a collection that changed since it was last published """
+        if self._sender is None or not data.publish_changes:
+            return 0
+
+        changes = []
+        for key in data.take_unpublished():
+            row = data.get(key)
+            if row is None:
+                changes.append({"model": data.model, "op": "delete", "id": key})
+            else:
+                changes.append({"model": data.model, "op": "put", "id": key, "row": row})
+
+        if changes:
+            self._send(changes)
+        return len(changes)
+
+    def _encode(self, changes):
+        """ Returns the numbered messages carrying the changes, split to stay under MAX_MESSAGE_SIZE.
+        The caller must hold the send lock
+        """
+        sent_at = time.time()
+        message = json.dumps({"origin": self.pid, "sequence": self._sequence + 1, "sent_at": sent_at,
+                              "previous_sent_at": self._last_sent_at, "changes": changes},
+                             separators=(',', ':')).encode('utf-8')
+        if len(message) <= MAX_MESSAGE_SIZE or len(changes) == 1:
+            # only the messages that are sent take a number, so the numbers have no gaps
+            self._sequence += 1
+            self._last_sent_at = sent_at
+            return [message]
+
+        half = len(changes) // 2
+        return self._encode(changes[:half]) + self._encode(changes[half:])
+
+    def _peers(self):
+        """ Returns the socket files of the other workers """
+        own = os.path.basename(self.socket_filename)
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, name) for name in names
+                if name.endswith(".sock") and name != own]
+
+    def _send(self, changes):
+        """ Send the changes to every other worker """
+        with self._send_lock:
+            messages = self._encode(changes)
+            for peer in self._peers():
+                for message in messages:
+                    try:
+                        self._sender.sendto(message, peer)
+                    except (ConnectionRefusedError, FileNotFoundError):
+                        # the worker has gone away without removing its socket
+                        self._remove_stale(peer)
+                        break
+                    except OSError:
+                        # the worker is too far behind to take any more. It misses this message
+                        # and reloads when the next one arrives.
+                        self._count("dropped")
+                    else:
+                        self._count("sent")
+
+    def _remove_stale(self, peer):
+        """ Remove the socket of a worker that no longer exists """
+        try:
+            os.remove(peer)
+        except FileNotFoundError:
+            pass
+
+    # --- Receiving ---
+
+    def _run_receiver(self):
+        """ Receiver thread main loop """
+        while True:
+            message = self._socket.recv(MAX_MESSAGE_SIZE * 2)
+            if not message:
+                # the wake up sent by stop()
+                return
+            try:
+                self.apply(json.loads(message))
+            except (ValueError, KeyError, TypeError) as exc:
+                logger.warning("Ignoring malformed change bus message: %r", exc)
+
+    def apply(self, message):
+        """ Apply a message from another worker to the registered collections """
+        if message["origin"] == self.pid:
+            return 0
+
+        if self._missed_before(message):
+            self._count("missed")
+            self.reload()
+
+        applied = 0
+        for change in message["changes"]:
+            data = self.collections.get(change["model"])
+            if data is None:
+                continue
+
+            # the other worker saves its own changes so they are not tracked here
+            row = change.get("row") if change["op"] == "put" else None
+            with self.write_lock:
+                with data.untracked():
+                    if row is not None:
+                        data[change["id"]] = row
+                    else:
+                        data.pop(change["id"], None)
+
+                for listener in self.listeners:
+                    listener(change["model"], change["id"], row)
+            applied += 1
+
+        lag = max(time.time() - message["sent_at"], 0.0)
+        with self._stats_lock:
+            self._stats["received"] += 1
+            self._stats["applied"] += applied
+            self._stats["last_lag"] = lag
+            self._stats["max_lag"] = max(self._stats["max_lag"], lag)
+            self._stats["total_lag"] += lag
+
+        return applied
+
+    def _missed_before(self, message):
+        """ True when a message of the same worker sent before this one never arrived """
+        origin = message["origin"]
+        last = self._received.get(origin)
+        self._received[origin] = message["sequence"]
+        if last is not None:
+            return message["sequence"] != last + 1
+
+        # the first message from that worker. The one before it was missed if it was sent after the data was loaded.
+        previous_sent_at = message.get("previous_sent_at")
+        return previous_sent_at is not None and previous_sent_at >= self._synced_at
+
+    def reload(self):
+        """ Bring the collections up to date with what is saved on disk, after missing a message
+
+        Records with local changes that aren't saved yet are left alone. Listeners hear
+        about every record that changed.
+        """
+        if self.storage is None:
+            logger.warning("Changes from another worker were missed and there is no storage to reload from")
+            return
+
+        synced_at = time.time()
+        self.storage.reload(self._apply_saved)
+        self._synced_at = synced_at
+        self._count("reloads")
+
+    def _apply_saved(self, saved):
+        """ Apply the differences between the saved data, {model: data}, and the collections """
+        changed = []
+        with self.write_lock:
+            for model, rows in saved.items():
+                data = self.collections.get(model)
+                if data is None:
+                    continue
+
+                with data.untracked():
+                    pending = data.inserted | data.updated | data.deleted
+                    for row_id, row in rows.items():
+                        if row_id not in pending and data.get(row_id) != row:
+                            data[row_id] = row
+                            changed.append((model, row_id, row))
+                    for row_id in [row_id for row_id in data if row_id not in rows and row_id not in pending]:
+                        del data[row_id]
+                        changed.append((model, row_id, None))
+
+            for model, row_id, row in changed:
+                for listener in self.listeners:
+                    listener(model, row_id, row)
+        logger.info("Reloaded %d records changed by other workers", len(changed))
+
+    # --- Metrics ---
+
+    def _count(self, name):
+        """ Add one to a counter """
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        """ Returns the metrics of this worker. The lags are in seconds from sending to applying """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["pid"] = self.pid
+        stats["mean_lag"] = stats.pop("total_lag") / stats["received"] if stats["received"] else 0.0
+        return stats
@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+"""This module checks the indexes of a running worker against its data and reports what each one costs
+
+    python3 -m data.check_indexes [http://localhost:5000]
+
+Asks the worker for /api/v1/admin/indexes and prints the entries, memory and build
+time of every index, then any drift found between the indexes and the data the
+worker has in memory, then how far behind the other workers its change bus is.
+Exits with 1 when there is drift.
+The worker only answers when it was started with HBNB_ADMIN=1, and only to
+requests from the same machine.
+
+The check runs inside the worker because indexes only drift from the data as
+changes are made to both. Loading the data here would build fresh indexes from
+it, which always match.
+"""
+
+import json
+import sys
+from urllib.request import urlopen
+
+DEFAULT_URL = "http://localhost:5000"
+
+
+class WorkerIndexes():
+    """ The stats and the problems of the indexes of a running worker, read once from its admin route """
+
+    def __init__(self, url=DEFAULT_URL):
+        """ constructor """
+        with urlopen(url.rstrip("/") + "/api/v1/admin/indexes") as response:
+            found = json.load(response)
+        self._stats = found["indexes"]
+        self._problems = found["problems"]
+        # the ChangeBus.stats() of the worker, None when it has no change bus
+        self.change_bus = found.get("change_bus")
+
+    def stats(self):
+        """ Returns the stats of every index, as IndexManager.stats() does """
+        return self._stats
+
+    def check(self):
+        """ Returns the problems found, as IndexManager.check() does """
+        return self._problems
+
+
+def report(index_manager, out=sys.stdout):
+    """ Print the stats and the problems of the indexes. Returns the problems
+
+    index_manager is an IndexManager or the WorkerIndexes of a running worker
+    """
+    print("{:<8} {:<34} {:<20} {:>9} {:>12} {:>9}".format(
+        "Model", "Fields", "Kind", "Entries", "Memory (KB)", "Build ms"), file=out)
+    for stats in index_manager.stats():
+        fields = ", ".join(stats["fields"]) + (" (unique)" if stats["unique"] else "")
+        print("{:<8} {:<34} {:<20} {:>9} {:>12.1f} {:>9}".format(
+            stats["model"], fields, stats["kind"],
+            "-" if stats["entries"] is None else stats["entries"],
+            stats["memory_bytes"] / 1024,
+            "-" if stats["build_seconds"] is None else "{:.2f}".format(stats["build_seconds"] * 1000)), file=out)
+
+    problems = index_manager.check()
+    print("", file=out)
+    if problems:
+        print("{} problems found:".format(len(problems)), file=out)
+        for problem in problems:
+            print("  " + problem, file=out)
+    else:
+        print("The indexes match the data", file=out)
+    return problems
+
+
+def report_change_bus(stats, out=sys.stdout):
+    """ Print the ChangeBus.stats() of a worker. The lags are from sending a change to applying it """
+    print("", file=out)
+    if stats is None:
+        print("No change bus, the worker doesn't share its changes", file=out)
+        return
+    print("Change bus of worker {}: {} messages sent, {} dropped, {} received with {} changes".format(
+        stats["pid"], stats["sent"], stats["dropped"], stats["received"], stats["applied"]), file=out)
+    print("  lag ms: last {:.1f}, mean {:.1f}, max {:.1f}".format(
+        stats["last_lag"] * 1000, stats["mean_lag"] * 1000, stats["max_lag"] * 1000), file=out)
+    print("  {} missed messages, {} reloads".format(stats["missed"], stats["reloads"]), file=out)
+
+
+if __name__ == '__main__':
+    worker = WorkerIndexes(*sys.argv[1:2])
+    problems = report(worker)
+    report_change_bus(worker.change_bus)
+    sys.exit(1 if problems else 0)
@@ -1,89 +1,655 @@
 #!/usr/bin/python3
 """This module defines a class to manage file storage for hbnb evolution"""
 
+import atexit
+import hashlib
 import json
+import logging
+import marshal
+import multiprocessing
+import os
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
+from data.json_stream import iter_rows
+from data.shards import is_manifest, read_manifest, shard_for, write_manifest
+
+try:
+    import fcntl
+except ImportError:
+    # no flock e.g. on Windows, where only one process can use a journal
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# bump this whenever the layout of the loaded data changes so old snapshots are rebuilt
+SNAPSHOT_VERSION = 1
 
 class FileStorage():
     """ Class for reading from files """
 
+    def __init__(self, journal_filename=None, sync_every=32, sync_interval=0.05,
+                 flush_interval=0.2, flush_threshold=100, checkpoint_size=4 * 1024 * 1024,
+                 snapshot_dir=None):
+        """ constructor """
+
+        # Parsed model files are cached in snapshot_dir in marshal format. None disables the cache.
+        self.snapshot_dir = snapshot_dir
+
+        # seconds taken to load each collection by the last load_all()
+        self.load_timings = {}
+
+        # When journal_filename is None nothing is persisted (e.g. while testing)
+        self.journal_filename = journal_filename
+
+        # Group commit: fsync once every sync_every records or once
+        # sync_interval seconds have passed since the last fsync, whichever comes first
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+
+        self._journal = None
+        self._journal_lock = threading.Lock()
+        # every process using the journal locks this file, see _locked_journal()
+        self._lock_file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+        # The flusher thread writes out the changed records every flush_interval seconds,
+        # or sooner once flush_threshold changes are waiting. When the journal grows past
+        # checkpoint_size bytes the model files are rewritten and the journal starts over.
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.checkpoint_size = checkpoint_size
+
+        self._collections = {}
+        self._flusher = None
+        self._stopping = False
+        self._dirty_count = 0
+        self._flush_condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+
+        # a ChangeBus that passes the changes on to the other worker processes
+        self.change_bus = None
+
     def load_model_data(self, filename):
-        """ Load JSON data from file and returns as dictionary """
+        """ Load JSON data from file and returns as dictionary
 
-        data = {}
+        filename can also be the manifest of a sharded model (see data/shards.py)
+        """
+        if is_manifest(filename):
+            return self.load_all({"model": (filename, "model")})["model"]
+        return self._load_with_snapshot(filename, "model", self._parse_model_data)
 
-        if not Path(filename).is_file():
-            raise FileNotFoundError("Data file '{}' missing".format(filename))
+    def _parse_model_data(self, filename):
+        """ Parse a model JSON file into a dictionary keyed by id """
 
+        output = {}
+
+        # The rows are streamed from the file one at a time and go straight into the
+        # dictionary under their id, so the whole file is never held in memory twice
         try:
-            with open(filename, 'r') as f:
-                rows = json.load(f)
-            for key in rows:
-                data[key] = rows[key]
+            with open(filename, 'r', encoding='utf-8') as f:
+                for _, row in iter_rows(f):
+                    output[row['id']] = row
         except ValueError as exc:
             raise ValueError("Unable to load data from file '{}'".format(filename)) from exc
 
-        # The data at this point is not directly usable. It needs to be cleaned up
-        data = self.reorganise_model_data(data)
+        return output
 
-        return data
+    def load_all(self, files, max_workers=None, process_parse_size=8 * 1024 * 1024):
+        """ Load several data files at the same time
 
-    def reorganise_model_data(self, data):
-        """ Parse and reorganise the data so that the id is the key """
-        output = {}
+        files maps a collection name to (filename, kind) where kind is "model" or "many_to_many"
+        Every file, or every shard of a sharded model, is read in its own thread. Files of at least
+        process_parse_size bytes are parsed in a separate process so that the parsing isn't
+        serialised by the GIL. The processes are forked, as this runs while data is imported and a
+        spawned process would import it again. Where fork isn't available every file is parsed in a thread.
+        Returns a dictionary of the loaded data with the same names as files
+        """
+        parsers = {
+            "model": self._parse_model_data,
+            "many_to_many": self._parse_many_to_many_data
+        }
+
+        # a sharded model is loaded as one job per shard and put back together at the end
+        jobs = {}
+        for name, (filename, kind) in files.items():
+            if is_manifest(filename):
+                for i, shard_filename in enumerate(read_manifest(filename)["shards"]):
+                    jobs[(name, i)] = (shard_filename, kind)
+            else:
+                jobs[name] = (filename, kind)
+
+        for filename, _ in jobs.values():
+            if not Path(filename).is_file():
+                raise FileNotFoundError("Data file '{}' missing".format(filename))
+
+        kind_of = {filename: kind for filename, kind in jobs.values()}
+        fork = _fork_context()
+        large = [filename for filename, kind in jobs.values()
+                 if fork is not None and os.path.getsize(filename) >= process_parse_size]
+        process_pool = None
+        if large:
+            process_pool = ProcessPoolExecutor(max_workers=min(len(large), os.cpu_count() or 1), mp_context=fork)
+            # every process is forked on the first submit. It is made from this thread before the loader
+            # threads start, as a fork while another thread holds a lock can leave the child deadlocked.
+            process_pool.submit(os.getpid).result()
 
-        # To make it easier to look for certain ids in the loaded data
-        # we are going to rebuild the dictionary so that the row id (uuid)
-        # is also the key for the record
+        def parse_in_process(filename):
+            """ Parse in the process pool. Only this thread waits for the result """
+            return process_pool.submit(_parse_file, kind_of[filename], filename).result()
 
-        for key in data:
-            # key's value is 'Place', 'Country', etc. since the JSON's key is the model name
-            # print("Rebuilding loaded data for {}...".format(key))
-            # print(data[key])
-            for row in data[key]:
-                # now we interate inside the JSON data...
-                output[row['id']] = row
+        def load(filename, kind):
+            """ Load one file and time it """
+            start = time.perf_counter()
+            parse = parse_in_process if filename in large else parsers[kind]
+            data = self._load_with_snapshot(filename, kind, parse)
+            return data, time.perf_counter() - start
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers or len(jobs) or 1) as thread_pool:
+                futures = {job: thread_pool.submit(load, filename, kind)
+                           for job, (filename, kind) in jobs.items()}
+                output = {}
+                self.load_timings = {}
+                for job, future in futures.items():
+                    data, seconds = future.result()
+                    name = job[0] if isinstance(job, tuple) else job
+                    if name in output:
+                        output[name].update(data)
+                    else:
+                        output[name] = data
+                    # shards load side by side so the collection took as long as its slowest shard
+                    self.load_timings[name] = max(seconds, self.load_timings.get(name, 0))
+        finally:
+            if process_pool is not None:
+                process_pool.shutdown()
+
+        for name, seconds in self.load_timings.items():
+            logger.info("Loaded %s in %.3fs", name, seconds)
 
         return output
 
     def load_many_to_many_data(self, filename):
         """ many to many data is loaded by this function """
+        return self._load_with_snapshot(filename, "many_to_many", self._parse_many_to_many_data)
+
+    def _parse_many_to_many_data(self, filename):
+        """ Parse a many to many JSON file into lists of ids grouped by the first id """
 
-        data = {}
         grouped_data = {}
 
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                # model's value is 'Place_to_Amenity'
+                for _, row in iter_rows(f):
+                    place_id = row['place_id']
+                    amenity_id = row['amenity_id']
+
+                    if place_id not in grouped_data:
+                        grouped_data[place_id] = []
+                    grouped_data[place_id].append(amenity_id)
+        except ValueError as exc:
+            raise ValueError("Unable to load data from file '{}'".format(filename)) from exc
+
+        return grouped_data
+
+    # --- Snapshots ---
+    # A snapshot holds a header (version, kind, mtime, size, content hash of the JSON file)
+    # followed by the parsed data, both in marshal format. Loading a valid snapshot
+    # skips json.load and the reorganising of the rows entirely.
+
+    def _load_with_snapshot(self, filename, kind, parse):
+        """ Returns the snapshot of a file when it is up to date, otherwise parses the file """
+
         if not Path(filename).is_file():
             raise FileNotFoundError("Data file '{}' missing".format(filename))
 
+        if self.snapshot_dir is None:
+            return parse(filename)
+
+        stat = os.stat(filename)
+        snapshot_filename = os.path.join(self.snapshot_dir, "{}.{}.snapshot".format(Path(filename).name, kind))
+        digest = None
+
         try:
-            with open(filename, 'r') as f:
-                rows = json.load(f)
-            for key in rows:
-                data[key] = rows[key]
-        except ValueError as exc:
-            raise ValueError("Unable to load data from file '{}'".format(filename)) from exc
+            with open(snapshot_filename, 'rb') as f:
+                version, snapshot_kind, mtime_ns, size, snapshot_digest = marshal.load(f)
+                if version == SNAPSHOT_VERSION and snapshot_kind == kind and size == stat.st_size:
+                    if mtime_ns == stat.st_mtime_ns:
+                        return marshal.load(f)
 
-        # print(data.items())
+                    # touched but maybe not changed (e.g. a git checkout). Compare the contents.
+                    digest = self._file_digest(filename)
+                    if digest == snapshot_digest:
+                        data = marshal.load(f)
+                        self._write_snapshot(snapshot_filename, kind, stat, digest, data)
+                        return data
+        except (OSError, EOFError, ValueError, TypeError):
+            # missing or unreadable snapshot. Rebuild it.
+            pass
 
-        for key in data:
-            # key's value is 'Place_to_Amenity'
-            for row in data[key]:
-                place_id = row['place_id']
-                amenity_id = row['amenity_id']
+        data = parse(filename)
+        self._write_snapshot(snapshot_filename, kind, stat, digest or self._file_digest(filename), data)
 
-                if place_id not in grouped_data:
-                    grouped_data[place_id] = []
-                grouped_data[place_id].append(amenity_id)
+        return data
 
-        return grouped_data
+    def _file_digest(self, filename):
+        """ Returns the content hash of a file """
+        h = hashlib.blake2b(digest_size=16)
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        return h.digest()
+
+    def _write_snapshot(self, snapshot_filename, kind, stat, digest, data):
+        """ Atomically write a snapshot so other workers never read half of one """
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        tmp_filename = "{}.{}.tmp".format(snapshot_filename, os.getpid())
+        try:
+            with open(tmp_filename, 'wb') as f:
+                marshal.dump((SNAPSHOT_VERSION, kind, stat.st_mtime_ns, stat.st_size, digest), f)
+                marshal.dump(data, f)
+            os.replace(tmp_filename, snapshot_filename)
+        except (OSError, ValueError):
+            # the cache is only an optimisation. Carry on without it.
+            if Path(tmp_filename).is_file():
+                os.remove(tmp_filename)
 
     def update_and_save_model_data(self, data, filename):
-        """ Update and save the data dictionary to a JSON file """
+        """ Update and save the data dictionary to a JSON file
+
+        The data is written to a temporary file which is fsynced and then renamed
+        over the target, so a crash part way through never leaves a corrupted file
+        """
+
+        # TrackedDicts are saved in the same {"Place": [...]} layout that load_model_data reads
+        model = getattr(data, 'model', None)
+        if model is not None:
+            data = {model: list(data.values())}
+
+        tmp_filename = filename + ".tmp"
         try:
-            with open(filename, "w", encoding='utf-8') as f:
+            with open(tmp_filename, "w", encoding='utf-8') as f:
                 json.dump(data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_filename, filename)
+            self._fsync_dir(filename)
             return True  # Indicate success
         except TypeError as exc:
             raise TypeError("Non-serializable data type encountered: {}".format(exc)) from exc
         except Exception as e:
-            raise Exception("An error occurred while saving the data: {}".format(e)) from e
\ No newline at end of file
+            raise Exception("An error occurred while saving the data: {}".format(e)) from e
+        finally:
+            if Path(tmp_filename).is_file():
+                os.remove(tmp_filename)
+
+    def save_sharded_model_data(self, data, manifest_filename, changed_ids=None):
+        """ Save a sharded model, rewriting only the shards that hold one of changed_ids
+
+        Every shard is saved atomically. All of them are rewritten when changed_ids is None.
+        """
+        manifest = read_manifest(manifest_filename)
+        shards = manifest["shards"]
+        count = len(shards)
+
+        if changed_ids is None:
+            changed = set(range(count))
+        else:
+            changed = {shard_for(row_id, count) for row_id in changed_ids}
+
+        rows = {i: [] for i in changed}
+        for row in list(data.values()):
+            i = shard_for(row['id'], count)
+            if i in changed:
+                rows[i].append(row)
+
+        for i in sorted(changed):
+            self.update_and_save_model_data({manifest["model"]: rows[i]}, shards[i])
+
+        # a new generation tells anything built from the shards that it is out of date
+        directory = os.path.dirname(manifest_filename)
+        write_manifest(manifest_filename, manifest["model"],
+                       [os.path.relpath(shard, directory or ".") for shard in shards],
+                       manifest["generation"] + 1)
+        return True
+
+    def _fsync_dir(self, filename):
+        """ fsync the directory of a file so that a rename into it is durable """
+        try:
+            fd = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY)
+        except OSError:
+            # not every platform allows directories to be opened
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def save_changes(self, data):
+        """ Persist only the records of a TrackedDict that changed since the last save
+
+        Inserted and updated records are written as puts and deleted ids as deletes,
+        so a single change to a big collection writes a single record.
+        Returns the number of records written
+        """
+        inserted, updated, deleted = data.take_changes()
+
+        for key in inserted | updated:
+            row = data.get(key)
+            # a record deleted in the meantime is already tracked as a delete for the next save
+            if row is not None:
+                self.journal_put(data.model, row)
+        for key in deleted:
+            self.journal_delete(data.model, key)
+
+        return len(inserted) + len(updated) + len(deleted)
+
+    # --- Flusher ---
+    # Request handlers only call mark_dirty() and return. The flusher thread writes the
+    # changed records to the journal in groups and checkpoints the model files now and then.
+
+    def register(self, data, filename):
+        """ Register a TrackedDict with the model file it is saved to """
+        self._collections[data.model] = (data, filename)
+
+    def mark_dirty(self, data):
+        """ Let the storage know that a collection has changes waiting to be saved """
+        if self._flusher is None:
+            # no flusher running so save straight away
+            with self._flush_lock:
+                self.save_changes(data)
+                self._publish([data])
+            return
+
+        with self._flush_condition:
+            self._dirty_count += 1
+            if self._dirty_count >= self.flush_threshold:
+                self._flush_condition.notify()
+
+    def start_flusher(self):
+        """ Start the background thread that saves the registered collections """
+        if self._flusher is not None:
+            return
+
+        self._stopping = False
+        self._flusher = threading.Thread(target=self._run_flusher, name="FileStorage-flusher", daemon=True)
+        self._flusher.start()
+        atexit.register(self.stop_flusher)
+
+    def stop_flusher(self):
+        """ Stop the flusher thread once it has saved everything """
+        if self._flusher is None:
+            return
+
+        with self._flush_condition:
+            self._stopping = True
+            self._flush_condition.notify()
+        self._flusher.join()
+        self._flusher = None
+
+    def _run_flusher(self):
+        """ Flusher thread main loop """
+        while True:
+            with self._flush_condition:
+                if self._dirty_count < self.flush_threshold and not self._stopping:
+                    self._flush_condition.wait(self.flush_interval)
+                self._dirty_count = 0
+                stopping = self._stopping
+
+            self.flush()
+
+            if stopping:
+                return
+
+    def flush(self):
+        """ Save every pending change of the registered collections. Blocks until it is on disk """
+        with self._flush_lock:
+            self._flush()
+
+            if self.journal_filename is not None and Path(self.journal_filename).is_file() \
+                    and os.path.getsize(self.journal_filename) >= self.checkpoint_size:
+                self._checkpoint()
+
+    def _flush(self):
+        """ Save every pending change and pass it on to the other workers. The caller must hold the flush lock """
+        for data, _ in self._collections.values():
+            if data.is_dirty():
+                self.save_changes(data)
+        self.sync_journal()
+        self._publish([data for data, _ in self._collections.values()])
+
+    def _publish(self, collections):
+        """ Send the saved changes of the collections to the other workers. The caller must hold the flush lock
+
+        They are only sent once they are in the journal, so a worker that reloads
+        after missing a message finds every change it was told about.
+        """
+        if self.change_bus is not None:
+            for data in collections:
+                self.change_bus.publish(data)
+
+    def reload(self, apply):
+        """ Load what is saved of every registered collection and call apply with {model: data}
+
+        For a worker that missed changes of the others. The pending changes of this worker
+        are saved first, and nothing is saved until apply returns, so the ones made in the
+        meantime are still tracked by the collections and can be told apart.
+        """
+        with self._flush_lock:
+            self._flush()
+            with self._journal_lock, self._locked_journal():
+                saved = {model: self.load_model_data(filename) for model, (_, filename) in self._collections.items()}
+                records, _ = self._read_journal() if self.journal_filename is not None else ([], 0)
+
+            for record in records:
+                if record['model'] in saved:
+                    self._apply_records([record], saved[record['model']])
+            apply(saved)
+
+    def checkpoint(self):
+        """ Rewrite the model files that have journaled changes and empty the journal """
+        with self._flush_lock:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        """ Checkpoint. The caller must hold the flush lock
+
+        Every worker process appends to the same journal, and this one may not have
+        seen the latest changes of the others yet. So the model files are rebuilt from
+        the files and the journal on disk, not from the data in memory. The journal is
+        locked against every process from reading it to emptying it, and only the
+        records that were read are removed.
+        """
+        if self.journal_filename is None:
+            return
+
+        with self._journal_lock, self._locked_journal():
+            records, offset = self._read_journal()
+
+            changes = {}
+            for record in records:
+                changes.setdefault(record['model'], []).append(record)
+
+            for model, model_records in changes.items():
+                if model not in self._collections:
+                    continue
+                _, filename = self._collections[model]
+                data = self.load_model_data(filename)
+                self._apply_records(model_records, data)
+                if is_manifest(filename):
+                    self.save_sharded_model_data(data, filename, {record['id'] for record in model_records})
+                else:
+                    self.update_and_save_model_data({model: list(data.values())}, filename)
+
+            # every record read is in the model files now
+            self._truncate_journal(offset)
+
+    # --- Journal ---
+    # Every change is appended to the journal as one compact JSON line, e.g.
+    # {"model":"User","op":"put","id":"...","row":{...}} or
+    # {"model":"User","op":"delete","id":"..."}
+    # so the cost of a write depends on the size of the change, not the size of the file.
+
+    def journal_put(self, model, row):
+        """ Record an inserted or updated row in the journal """
+        return self._append_to_journal({"model": model, "op": "put", "id": row['id'], "row": row})
+
+    def journal_delete(self, model, row_id):
+        """ Record a deleted row in the journal """
+        return self._append_to_journal({"model": model, "op": "delete", "id": row_id})
+
+    def _append_to_journal(self, record):
+        """ Append a record to the journal and fsync it once the current batch is full """
+        if self.journal_filename is None:
+            return False
+
+        line = json.dumps(record, separators=(',', ':')) + "\n"
+
+        with self._journal_lock:
+            with self._locked_journal():
+                if self._journal is None:
+                    self._open_journal()
+
+                # flush() hands the record to the OS straight away so that it survives
+                # the process dying. The fsync that protects against power loss is batched.
+                self._journal.write(line)
+                self._journal.flush()
+            self._unsynced += 1
+
+            if self._unsynced >= self.sync_every or \
+                    time.monotonic() - self._last_sync >= self.sync_interval:
+                self._sync_journal()
+
+        return True
+
+    @contextmanager
+    def _locked_journal(self):
+        """ Hold the lock on the journal shared by every process. The caller must hold the journal lock
+
+        Appends, replays and checkpoints take it, so no process appends to the journal
+        while another one is reading or emptying it.
+        """
+        if fcntl is None or self.journal_filename is None:
+            yield
+            return
+
+        if self._lock_file is None:
+            self._lock_file = open(self.journal_filename + ".lock", 'a')
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _open_journal(self):
+        """ Open the journal for appending, dropping a record torn by an earlier crash.
+        The caller must hold the lock on the journal
+        """
+        if Path(self.journal_filename).is_file():
+            with open(self.journal_filename, 'rb+') as f:
+                content = f.read()
+                if content and not content.endswith(b"\n"):
+                    f.truncate(content.rfind(b"\n") + 1)
+
+        self._journal = open(self.journal_filename, 'a', encoding='utf-8')
+
+        # the journal is reopened after every checkpoint. Only register once.
+        atexit.unregister(self.sync_journal)
+        atexit.register(self.sync_journal)
+
+    def _sync_journal(self):
+        """ fsync the journal. The caller must hold the journal lock """
+        if self._unsynced:
+            os.fsync(self._journal.fileno())
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _read_journal(self):
+        """ Returns the records of the journal and the offset just after the last complete one.
+        The caller must hold the lock on the journal
+        """
+        records = []
+        offset = 0
+        if not Path(self.journal_filename).is_file():
+            return records, offset
+
+        with open(self.journal_filename, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Only the last record can be incomplete (crash mid-write). Ignore it.
+                    break
+                records.append(record)
+                offset += len(line)
+        return records, offset
+
+    def _truncate_journal(self, offset):
+        """ Remove the first offset bytes of the journal, keeping anything after them.
+        The caller must hold the lock on the journal
+        """
+        if not Path(self.journal_filename).is_file():
+            return
+
+        # changed in place, so the other processes keep appending to the same file
+        with open(self.journal_filename, 'rb+') as f:
+            f.seek(offset)
+            rest = f.read()
+            f.seek(0)
+            f.write(rest)
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+
+    def sync_journal(self):
+        """ Force any records still waiting on a batched fsync to disk """
+        with self._journal_lock:
+            if self._journal is not None:
+                self._sync_journal()
+
+    def replay_journal(self, collections):
+        """ Apply the journal on top of data loaded from the base JSON files
+
+        collections maps the model name to its data dictionary e.g. {"User": user_data}
+        Returns the number of records applied
+        """
+        if self.journal_filename is None:
+            return 0
+
+        with self._journal_lock, self._locked_journal():
+            records, _ = self._read_journal()
+
+        applied = 0
+        for record in records:
+            data = collections.get(record['model'])
+            if data is not None:
+                self._apply_records([record], data)
+                applied += 1
+        return applied
+
+    @staticmethod
+    def _apply_records(records, data):
+        """ Apply journal records to the data dictionary of their model """
+        for record in records:
+            if record['op'] == "put":
+                data[record['id']] = record['row']
+            elif record['op'] == "delete":
+                data.pop(record['id'], None)
+
+def _fork_context():
+    """ Returns the multiprocessing context that forks, None where processes can't be forked e.g. on Windows """
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return None
+
+
+def _parse_file(kind, filename):
+    """ Parse a data file. Runs in a worker process of FileStorage.load_all """
+    storage = FileStorage()
+    if kind == "many_to_many":
+        return storage._parse_many_to_many_data(filename)
+    return storage._parse_model_data(filename)
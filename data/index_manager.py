@@ -0,0 +1,169 @@
+#!/usr/bin/python3
+"""This module keeps every secondary index of the model data in one place
+
+Indexes register with the IndexManager under their model and the field(s) they
+cover e.g. ("Place", ("city_id", "price_per_night")). The write path in
+data/__init__.py tells the manager about every insert, update and delete, and
+the manager passes it on to the indexes of that model, so no handler has to
+know which indexes exist.
+
+To check the indexes of a running worker against its data and see what they cost:
+    python3 -m data.check_indexes [URL]
+"""
+
+import sys
+import time
+
+
+def _size_of(value, seen):
+    """ Returns the bytes used by a value and the containers inside it, counting each object once """
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_size_of(key, seen) + _size_of(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_size_of(item, seen) for item in value)
+    return size
+
+
+def memory_bytes(index):
+    """ Returns roughly how many bytes an index holds
+
+    Only the plain containers and values of its attributes are followed, so data the
+    index refers to but doesn't own, e.g. the storage or the links, isn't counted.
+    Ids shared with the rows are counted as the index keeps them alive too.
+    """
+    seen = set()
+    size = sys.getsizeof(index)
+    for value in vars(index).values():
+        if isinstance(value, (dict, list, tuple, set, frozenset, str, bytes, int, float)):
+            size += _size_of(value, seen)
+    return size
+
+
+class IndexManager():
+    """ The indexes of every model, kept up to date from a single write path """
+
+    def __init__(self):
+        """ constructor """
+        # model -> the data of the model e.g. place_data
+        self.collections = {}
+
+        # (model, fields, unique) -> index, in the order they were registered
+        self._indexes = {}
+
+        # (model, fields, unique) -> seconds the last build took
+        self._build_seconds = {}
+
+    @staticmethod
+    def _key(model, fields, unique):
+        """ Returns the registry key. fields is a field name or a tuple of them """
+        return model, (fields,) if isinstance(fields, str) else tuple(fields), unique
+
+    def add_collection(self, model, data):
+        """ Tell the manager where the data of a model is, for rebuilds and checks """
+        self.collections[model] = data
+
+    def register(self, model, fields, index, unique=False):
+        """ Register an index of a model. Returns the index
+
+        fields names what it covers e.g. "code" or ("city_id", "price_per_night").
+        unique indexes are kept apart as a unique constraint can cover the same fields
+        as a lookup index e.g. Country.code.
+        """
+        key = self._key(model, fields, unique)
+        if key in self._indexes:
+            raise ValueError("An index of {} on {} is already registered".format(model, ", ".join(key[1])))
+        self._indexes[key] = index
+        return index
+
+    def get(self, model, fields, unique=False):
+        """ Returns the index of a model on some field(s) """
+        return self._indexes[self._key(model, fields, unique)]
+
+    def indexes(self, model):
+        """ Returns every index of a model """
+        return [index for (name, _, _), index in self._indexes.items() if name == model]
+
+    def unique(self, model):
+        """ Returns the unique constraint indexes of a model """
+        return [index for (name, _, unique), index in self._indexes.items() if name == model and unique]
+
+    # --- Write hooks ---
+
+    def inserted(self, model, row_id, row):
+        """ Index a record that was just added """
+        for index in self.indexes(model):
+            index.add(row_id, row)
+
+    def updated(self, model, row_id, row):
+        """ Index a record again after it was changed """
+        for index in self.indexes(model):
+            index.update(row_id, row)
+
+    def deleted(self, model, row_id):
+        """ Remove a deleted record from the indexes """
+        for index in self.indexes(model):
+            index.remove(row_id)
+
+    def apply(self, model, row_id, row):
+        """ Index a change that may be an insert or an update. row is None when the record was deleted
+
+        For changes made elsewhere, e.g. by another worker through the change bus.
+        """
+        if row is None:
+            self.deleted(model, row_id)
+        else:
+            self.updated(model, row_id, row)
+
+    # --- Rebuilding and checking ---
+
+    def rebuild(self):
+        """ Build every index from the data
+
+        The rows of each model are read once and handed to all of its indexes, so the
+        columns file or the database is only gone through once per model.
+        """
+        for model, data in self.collections.items():
+            items = None
+            for (name, fields, unique), index in self._indexes.items():
+                if name != model:
+                    continue
+                if items is None:
+                    items = list(data.items())
+                started = time.perf_counter()
+                index.build(items)
+                self._build_seconds[(name, fields, unique)] = time.perf_counter() - started
+
+    def check(self):
+        """ Compare every index with the data. Returns the problems found, an empty list when there are none """
+        problems = []
+        for model, data in self.collections.items():
+            items = None
+            for (name, fields, unique), index in self._indexes.items():
+                if name != model:
+                    continue
+                if items is None:
+                    items = list(data.items())
+                for problem in index.check(items):
+                    problems.append("{} {}{}: {}".format(
+                        model, ", ".join(fields), " (unique)" if unique else "", problem))
+        return problems
+
+    def stats(self):
+        """ Returns the size, memory in bytes and last build time in seconds of every index """
+        stats = []
+        for (model, fields, unique), index in self._indexes.items():
+            stats.append({
+                "model": model,
+                "fields": list(fields),
+                "unique": unique,
+                "kind": type(index).__name__,
+                "entries": len(index) if hasattr(index, "__len__") else None,
+                "memory_bytes": memory_bytes(index),
+                "build_seconds": self._build_seconds.get((model, fields, unique))
+            })
+        return stats
@@ -0,0 +1,807 @@
+#!/usr/bin/python3
+"""This module defines in-memory indexes over the model data
+
+An index maps the value of a field to the ids of the rows that have it, so a
+lookup like "the country with code CA" doesn't have to scan every row.
+The IndexManager in data/index_manager.py keeps them up to date from the write path.
+"""
+
+import bisect
+import heapq
+import math
+import re
+from abc import ABC, abstractmethod
+from collections.abc import Mapping
+
+# mean radius of the earth, for distances between coordinates
+EARTH_RADIUS_KM = 6371.0088
+
+# Fields whose values may only belong to one record of the model. Strings are compared lower-cased.
+# They are checked by each worker against the data it has, so with FileStorage two workers can
+# still take the same value at the same moment, before the change bus tells them about each other.
+UNIQUE_CONSTRAINTS = {
+    "User": [("email",)],
+    "Country": [("code",)],
+    "Amenity": [("name",)],
+    "City": [("country_id", "name")]
+}
+
+
+def normalize(value):
+    """ Returns the value used to compare unique fields """
+    return value.lower() if isinstance(value, str) else value
+
+
+def tokenize(text):
+    """ Returns the lower-cased words of a text, for the full-text search """
+    return re.findall(r"\w+", text.lower()) if isinstance(text, str) else []
+
+
+class HashIndex():
+    """ Maps a field value to the ids of the rows with that value, in insertion order """
+
+    def __init__(self, field):
+        """ constructor """
+        self.field = field
+        self._ids = {}
+
+        # the value each id was indexed under. Rows are often changed in place,
+        # so the old value can't be read back from the row when it is updated.
+        self._keys = {}
+
+    def key(self, row):
+        """ Returns the value a row is indexed under """
+        return row.get(self.field)
+
+    def build(self, items):
+        """ Index every (id, row) pair, dropping whatever was indexed before """
+        self._ids = {}
+        self._keys = {}
+        for row_id, row in items:
+            self.add(row_id, row)
+
+    def add(self, row_id, row):
+        """ Index a new row """
+        key = self.key(row)
+        self._keys[row_id] = key
+        # a dict keeps the ids in insertion order with O(1) removal
+        self._ids.setdefault(key, {})[row_id] = None
+
+    def remove(self, row_id):
+        """ Remove a row from the index. Unknown ids are ignored """
+        if row_id not in self._keys:
+            return
+
+        key = self._keys.pop(row_id)
+        ids = self._ids[key]
+        del ids[row_id]
+        if not ids:
+            del self._ids[key]
+
+    def update(self, row_id, row):
+        """ Index a row again after it was changed, or add it when it is new """
+        if row_id in self._keys and self._keys[row_id] == self.key(row):
+            return
+        self.remove(row_id)
+        self.add(row_id, row)
+
+    def find(self, value):
+        """ Returns the id of the first row with the value, or None """
+        return next(iter(self._ids.get(value, ())), None)
+
+    def ids(self, value):
+        """ Returns the ids of the rows with the value """
+        return list(self._ids.get(value, ()))
+
+    def ids_of(self, values):
+        """ Returns {value: ids of the rows with the value} for several values at once """
+        return {value: list(self._ids.get(value, ())) for value in values}
+
+    def check(self, items):
+        """ Compare the index with the data it was built from
+
+        items are the (id, row) pairs of the data. Returns a list of the differences
+        found, which is empty when the index is up to date.
+        """
+        problems = []
+        seen = set()
+        for row_id, row in items:
+            seen.add(row_id)
+            if row_id not in self._keys:
+                problems.append("{} is missing from the {} index".format(row_id, self.field))
+            elif self._keys[row_id] != self.key(row):
+                problems.append("{} is indexed under {!r} instead of {!r}".format(
+                    row_id, self._keys[row_id], self.key(row)))
+
+        for row_id in self._keys:
+            if row_id not in seen:
+                problems.append("{} is in the {} index but not in the data".format(row_id, self.field))
+
+        return problems
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class UniqueConstraintError(ValueError):
+    """ Raised when a record would have the unique values of another record of its model """
+
+    def __init__(self, model, fields, other_id):
+        """ constructor """
+        super().__init__("{} with the same {} already exists".format(model, " and ".join(fields)))
+        self.model = model
+        self.fields = tuple(fields)
+        self.other_id = other_id
+
+
+class UniqueIndex(HashIndex):
+    """ Index on one or more fields whose values may only belong to one record """
+
+    def __init__(self, model, fields):
+        """ constructor. fields is a tuple of field names from UNIQUE_CONSTRAINTS """
+        super().__init__(", ".join(fields))
+        self.model = model
+        self.fields = tuple(fields)
+
+    def key(self, row):
+        """ Returns the normalized value, or tuple of values, of the unique fields """
+        values = tuple(normalize(row.get(field)) for field in self.fields)
+        return values[0] if len(values) == 1 else values
+
+    def conflict(self, row_id, row):
+        """ Returns the id of another record that has the same unique values as row, or None """
+        for other_id in self._ids.get(self.key(row), ()):
+            if other_id != row_id:
+                return other_id
+        return None
+
+    def check(self, items):
+        """ Compare the index with the data and report values that more than one record has """
+        problems = super().check(items)
+        for key, ids in self._ids.items():
+            if len(ids) > 1:
+                problems.append("{} {} {!r} is shared by {}".format(
+                    self.model, self.field, key, ", ".join(ids)))
+        return problems
+
+
+class SortedIndex():
+    """ Ids ordered by a numeric field, then by id, for range queries and ordered paging
+
+    With group_by the rows are kept in a separate order for every value of that field
+    e.g. the prices of the places of each city.
+    """
+
+    def __init__(self, field, group_by=None):
+        """ constructor """
+        self.field = field
+        self.group_by = group_by
+        # group -> (sorted values, ids in the same order). The group is None without group_by.
+        self._groups = {}
+        # id -> (group, value) the row was indexed under, as rows are changed in place
+        self._keys = {}
+
+    def key(self, row):
+        """ Returns (group, value) of a row, or None when the value isn't a number """
+        try:
+            value = float(row.get(self.field))
+        except (TypeError, ValueError):
+            return None
+        if value != value:
+            # NaN can't be ordered
+            return None
+        return (row.get(self.group_by) if self.group_by else None), value
+
+    def build(self, items):
+        """ Index every (id, row) pair, dropping whatever was indexed before """
+        self._groups = {}
+        self._keys = {}
+        entries = {}
+        for row_id, row in items:
+            key = self.key(row)
+            if key is not None:
+                self._keys[row_id] = key
+                entries.setdefault(key[0], []).append((key[1], row_id))
+
+        # sorting once is much faster than inserting one at a time
+        for group, pairs in entries.items():
+            pairs.sort()
+            self._groups[group] = ([value for value, _ in pairs], [row_id for _, row_id in pairs])
+
+    def _position(self, values, ids, value, row_id):
+        """ Returns where (value, id) is or would be inserted """
+        lo = bisect.bisect_left(values, value)
+        hi = bisect.bisect_right(values, value, lo)
+        return bisect.bisect_left(ids, row_id, lo, hi)
+
+    def add(self, row_id, row):
+        """ Index a new row. Rows without a number in the field are left out """
+        key = self.key(row)
+        if key is None:
+            return
+        group, value = key
+        self._keys[row_id] = key
+        values, ids = self._groups.setdefault(group, ([], []))
+        i = self._position(values, ids, value, row_id)
+        values.insert(i, value)
+        ids.insert(i, row_id)
+
+    def remove(self, row_id):
+        """ Remove a row from the index. Unknown ids are ignored """
+        if row_id not in self._keys:
+            return
+
+        group, value = self._keys.pop(row_id)
+        values, ids = self._groups[group]
+        i = self._position(values, ids, value, row_id)
+        del values[i]
+        del ids[i]
+        if not ids:
+            del self._groups[group]
+
+    def update(self, row_id, row):
+        """ Index a row again after it was changed, or add it when it is new """
+        if row_id in self._keys and self._keys[row_id] == self.key(row):
+            return
+        self.remove(row_id)
+        self.add(row_id, row)
+
+    def value(self, row_id):
+        """ Returns the value a row is indexed under, or None """
+        key = self._keys.get(row_id)
+        return None if key is None else key[1]
+
+    def range(self, low=None, high=None, group=None, after=None, limit=None, after_key=None):
+        """ Returns (value, id) of the rows with low <= value <= high in order
+
+        group picks the rows of one value of group_by. after is the id of the row the
+        previous page ended with, and the page starts right after it. after_key does the
+        same with the (value, id) of that row, so it works even if the row is gone since.
+        Costs O(log n + limit).
+        """
+        values, ids = self._groups.get(group, ((), ()))
+        start = 0 if low is None else bisect.bisect_left(values, low)
+        end = len(values) if high is None else bisect.bisect_right(values, high)
+
+        if after is not None:
+            key = self._keys.get(after)
+            if key is None or key[0] != group:
+                raise KeyError(after)
+            after_key = (key[1], after)
+
+        if after_key is not None:
+            value, row_id = after_key
+            i = self._position(values, ids, value, row_id)
+            if i < len(ids) and values[i] == value and ids[i] == row_id:
+                i += 1
+            start = max(start, i)
+
+        if limit is not None:
+            end = min(end, start + limit)
+        return list(zip(values[start:end], ids[start:end]))
+
+    def check(self, items):
+        """ Compare the index with the data. Returns a list of the differences found """
+        problems = []
+        seen = set()
+        for row_id, row in items:
+            key = self.key(row)
+            if key is None:
+                continue
+            seen.add(row_id)
+            if self._keys.get(row_id) != key:
+                problems.append("{} is indexed under {!r} instead of {!r} in the {} index".format(
+                    row_id, self._keys.get(row_id), key, self.field))
+
+        for row_id in self._keys:
+            if row_id not in seen:
+                problems.append("{} is in the {} index but not in the data".format(row_id, self.field))
+
+        for group, (values, ids) in self._groups.items():
+            if list(zip(values, ids)) != sorted(zip(values, ids)):
+                problems.append("The {} index of {!r} is out of order".format(self.field, group))
+
+        return problems
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class TextIndex():
+    """ Inverted index of the words in some text fields, ranked with BM25
+
+    Every word maps to the sorted ids of the rows that contain it. The counts of
+    the words of each row are kept for the ranking and for taking the row out again.
+    """
+
+    def __init__(self, fields, k1=1.2, b=0.75):
+        """ constructor. k1 and b are the usual BM25 parameters """
+        self.fields = tuple(fields)
+        self.k1 = k1
+        self.b = b
+        # word -> sorted ids of the rows that have it
+        self._postings = {}
+        # id -> {word: count} of the row
+        self._terms = {}
+        # id -> number of words in the row, and the sum of them all for the average
+        self._lengths = {}
+        self._total_length = 0
+
+    def terms(self, row):
+        """ Returns the number of times each word appears in the text fields of a row """
+        counts = {}
+        for field in self.fields:
+            for term in tokenize(row.get(field)):
+                counts[term] = counts.get(term, 0) + 1
+        return counts
+
+    def build(self, items):
+        """ Index every (id, row) pair, dropping whatever was indexed before """
+        self._postings = {}
+        self._terms = {}
+        self._lengths = {}
+        self._total_length = 0
+        for row_id, row in items:
+            counts = self.terms(row)
+            self._store(row_id, counts)
+            for term in counts:
+                self._postings.setdefault(term, []).append(row_id)
+
+        # sorting each list once is much faster than inserting one id at a time
+        for ids in self._postings.values():
+            ids.sort()
+
+    def _store(self, row_id, counts):
+        """ Keep the word counts of a row """
+        self._terms[row_id] = counts
+        self._lengths[row_id] = sum(counts.values())
+        self._total_length += self._lengths[row_id]
+
+    def add(self, row_id, row):
+        """ Index a new row """
+        counts = self.terms(row)
+        self._store(row_id, counts)
+        for term in counts:
+            bisect.insort(self._postings.setdefault(term, []), row_id)
+
+    def remove(self, row_id):
+        """ Remove a row from the index. Unknown ids are ignored """
+        if row_id not in self._terms:
+            return
+
+        for term in self._terms.pop(row_id):
+            ids = self._postings[term]
+            del ids[bisect.bisect_left(ids, row_id)]
+            if not ids:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(row_id)
+
+    def update(self, row_id, row):
+        """ Index a row again after it was changed, or add it when it is new """
+        if row_id in self._terms and self._terms[row_id] == self.terms(row):
+            return
+        self.remove(row_id)
+        self.add(row_id, row)
+
+    def search(self, query, limit=None):
+        """ Returns (score, id) of the rows with any word of the query, best match first """
+        if not self._terms:
+            return []
+
+        count = len(self._terms)
+        average_length = self._total_length / count or 1
+        scores = {}
+        for term in set(tokenize(query)):
+            ids = self._postings.get(term)
+            if not ids:
+                continue
+            # words that few rows have count for more
+            idf = math.log(1 + (count - len(ids) + 0.5) / (len(ids) + 0.5))
+            for row_id in ids:
+                frequency = self._terms[row_id][term]
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[row_id] / average_length)
+                scores[row_id] = scores.get(row_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        ranked = [(-score, row_id) for row_id, score in scores.items()]
+        ranked = heapq.nsmallest(limit, ranked) if limit is not None else sorted(ranked)
+        return [(-score, row_id) for score, row_id in ranked]
+
+    def check(self, items):
+        """ Compare the index with the data. Returns a list of the differences found """
+        problems = []
+        seen = set()
+        for row_id, row in items:
+            seen.add(row_id)
+            if self._terms.get(row_id) != self.terms(row):
+                problems.append("The words of {} in the {} index are out of date".format(
+                    row_id, ", ".join(self.fields)))
+
+        for row_id in self._terms:
+            if row_id not in seen:
+                problems.append("{} is in the {} index but not in the data".format(
+                    row_id, ", ".join(self.fields)))
+
+        for term, ids in self._postings.items():
+            if ids != sorted(ids) or any(term not in self._terms.get(row_id, ()) for row_id in ids):
+                problems.append("The ids of {!r} in the {} index are wrong".format(term, ", ".join(self.fields)))
+
+        return problems
+
+    def __len__(self):
+        return len(self._terms)
+
+
+class PlaceAmenityIndex(Mapping):
+    """ The Place_to_Amenity links in both directions, with set semantics
+
+    As a mapping it is place id -> list of amenity ids, the same as the dictionary
+    returned by FileStorage.load_many_to_many_data. amenities() and places() look
+    the links up from either side.
+    """
+
+    def __init__(self, grouped_data=None):
+        """ constructor. grouped_data maps place ids to lists of amenity ids """
+        # dicts are used as ordered sets so the ids keep the order they were added in
+        self._amenities = {}
+        self._places = {}
+
+        # an AmenityBitmapIndex to tell about every link added or removed
+        self.bitmaps = None
+        for place_id, amenity_ids in (grouped_data or {}).items():
+            for amenity_id in amenity_ids:
+                self.add(place_id, amenity_id)
+
+    def add(self, place_id, amenity_id):
+        """ Link an amenity to a place. Adding a link twice keeps one """
+        self._amenities.setdefault(place_id, {})[amenity_id] = None
+        self._places.setdefault(amenity_id, {})[place_id] = None
+        if self.bitmaps is not None:
+            self.bitmaps.link(place_id, amenity_id)
+
+    def remove(self, place_id, amenity_id):
+        """ Unlink an amenity from a place. Unknown links are ignored """
+        if self.bitmaps is not None:
+            self.bitmaps.unlink(place_id, amenity_id)
+        for links, key, value in ((self._amenities, place_id, amenity_id), (self._places, amenity_id, place_id)):
+            ids = links.get(key)
+            if ids is not None and value in ids:
+                del ids[value]
+                if not ids:
+                    del links[key]
+
+    def has(self, place_id, amenity_id):
+        """ True when the place has the amenity """
+        return amenity_id in self._amenities.get(place_id, ())
+
+    def amenities(self, place_id):
+        """ Returns the amenity ids of a place """
+        return list(self._amenities.get(place_id, ()))
+
+    def amenities_of(self, place_ids):
+        """ Returns {place id: amenity ids of the place} for several places at once """
+        return {place_id: list(self._amenities.get(place_id, ())) for place_id in place_ids}
+
+    def places(self, amenity_id):
+        """ Returns the ids of the places that have an amenity """
+        return list(self._places.get(amenity_id, ()))
+
+    def __getitem__(self, place_id):
+        if place_id not in self._amenities:
+            raise KeyError(place_id)
+        return list(self._amenities[place_id])
+
+    def __contains__(self, place_id):
+        return place_id in self._amenities
+
+    def __iter__(self):
+        return iter(list(self._amenities))
+
+    def __len__(self):
+        return len(self._amenities)
+
+
+class AmenityBitmapIndex():
+    """ The places that have each amenity as a bitmap, for filtering by several amenities
+
+    Every place gets a small number, its ordinal, and an amenity maps to a Python int with
+    the bits of its places set. "wifi and pool but not smoking" is then a few bitwise
+    operations however many places there are. It is a Place index, and the
+    PlaceAmenityIndex it is given tells it about the links added and removed.
+    """
+
+    def __init__(self, links=None):
+        """ constructor. links is the PlaceAmenityIndex with the links of the places """
+        self.links = links
+        if links is not None:
+            links.bitmaps = self
+
+        self._ordinals = {}
+        self._place_ids = []
+        # ordinals of removed places, reused so the bitmaps stay as short as possible
+        self._free = []
+        # amenity id -> bitmap of the places that have it
+        self._bitmaps = {}
+        # bitmap of the places in the place data, as links may name places that aren't
+        self._all = 0
+
+    def _ordinal(self, place_id):
+        """ Returns the ordinal of a place, giving it one when it has none """
+        ordinal = self._ordinals.get(place_id)
+        if ordinal is None:
+            if self._free:
+                ordinal = self._free.pop()
+                self._place_ids[ordinal] = place_id
+            else:
+                ordinal = len(self._place_ids)
+                self._place_ids.append(place_id)
+            self._ordinals[place_id] = ordinal
+        return ordinal
+
+    def build(self, items):
+        """ Index every (id, row) pair of the places and their links """
+        self._ordinals = {}
+        self._place_ids = []
+        self._free = []
+        self._bitmaps = {}
+        self._all = 0
+        for row_id, _ in items:
+            self.add(row_id, None)
+        for place_id, amenity_ids in (self.links.items() if self.links is not None else ()):
+            for amenity_id in amenity_ids:
+                self.link(place_id, amenity_id)
+
+    def add(self, row_id, row):
+        """ Index a new place """
+        self._all |= 1 << self._ordinal(row_id)
+
+    def update(self, row_id, row):
+        """ Index a place. The amenities of a place are not in its row so nothing changes """
+        self.add(row_id, row)
+
+    def remove(self, row_id):
+        """ Remove a place and its links. Unknown ids are ignored """
+        ordinal = self._ordinals.pop(row_id, None)
+        if ordinal is None:
+            return
+
+        bit = 1 << ordinal
+        self._all &= ~bit
+        for amenity_id, bitmap in list(self._bitmaps.items()):
+            if bitmap & bit:
+                self._set(amenity_id, bitmap & ~bit)
+        self._place_ids[ordinal] = None
+        self._free.append(ordinal)
+
+    def _set(self, amenity_id, bitmap):
+        """ Store the bitmap of an amenity, dropping it when no place is left """
+        if bitmap:
+            self._bitmaps[amenity_id] = bitmap
+        else:
+            self._bitmaps.pop(amenity_id, None)
+
+    def link(self, place_id, amenity_id):
+        """ Set the bit of a place in the bitmap of an amenity """
+        self._set(amenity_id, self._bitmaps.get(amenity_id, 0) | 1 << self._ordinal(place_id))
+
+    def unlink(self, place_id, amenity_id):
+        """ Clear the bit of a place in the bitmap of an amenity. Unknown links are ignored """
+        ordinal = self._ordinals.get(place_id)
+        if ordinal is not None:
+            self._set(amenity_id, self._bitmaps.get(amenity_id, 0) & ~(1 << ordinal))
+
+    def matching(self, all_of=(), none_of=()):
+        """ Returns the ids of the places that have every amenity in all_of and none in none_of """
+        bitmap = self._all
+        for amenity_id in all_of:
+            bitmap &= self._bitmaps.get(amenity_id, 0)
+        for amenity_id in none_of:
+            bitmap &= ~self._bitmaps.get(amenity_id, 0)
+
+        # find() on the binary digits skips the zeros much faster than testing bit by bit
+        bits = bin(bitmap)[:1:-1]
+        place_ids = []
+        ordinal = bits.find("1")
+        while ordinal != -1:
+            place_ids.append(self._place_ids[ordinal])
+            ordinal = bits.find("1", ordinal + 1)
+        return place_ids
+
+    def check(self, items):
+        """ Compare the bitmaps with the places and their links """
+        problems = []
+        expected = AmenityBitmapIndex()
+        expected.links = self.links
+        expected.build(items)
+
+        places = set(expected.matching())
+        for place_id in places ^ set(self.matching()):
+            problems.append("{} is {} the amenity bitmaps".format(
+                place_id, "missing from" if place_id in places else "left in"))
+
+        for amenity_id in set(expected._bitmaps) | set(self._bitmaps):
+            wrong = set(expected.matching((amenity_id,))) ^ set(self.matching((amenity_id,)))
+            if wrong:
+                problems.append("The bitmap of amenity {} is wrong for {}".format(
+                    amenity_id, ", ".join(sorted(wrong))))
+
+        return problems
+
+    def __len__(self):
+        return bin(self._all).count("1")
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """ Returns the great-circle distance in km between two points given in degrees """
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat, lon, radius_km):
+    """ Returns the box of coordinates that holds every point within radius_km of a point
+
+    The result is (lat_min, lat_max, lon_ranges). lon_ranges is a list of (lon_min, lon_max)
+    as a box crossing the antimeridian is split in two.
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    lat_min = lat - math.degrees(angle)
+    lat_max = lat + math.degrees(angle)
+
+    # a circle around a pole covers every longitude
+    if lat_min <= -90 or lat_max >= 90 or angle >= math.pi / 2:
+        return max(lat_min, -90.0), min(lat_max, 90.0), [(-180.0, 180.0)]
+
+    ratio = math.sin(angle) / math.cos(math.radians(lat))
+    if ratio >= 1:
+        return lat_min, lat_max, [(-180.0, 180.0)]
+
+    delta = math.degrees(math.asin(ratio))
+    lon_min, lon_max = lon - delta, lon + delta
+    if lon_min < -180:
+        return lat_min, lat_max, [(lon_min + 360, 180.0), (-180.0, lon_max)]
+    if lon_max > 180:
+        return lat_min, lat_max, [(lon_min, 180.0), (-180.0, lon_max - 360)]
+    return lat_min, lat_max, [(lon_min, lon_max)]
+
+
+def coordinates(row):
+    """ Returns the (latitude, longitude) of a row, or None when it has no usable ones """
+    try:
+        lat = float(row.get("latitude"))
+        lon = float(row.get("longitude"))
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        # also drops NaN
+        return None
+    return lat, lon
+
+
+class GeoQueries(ABC):
+    """ Radius and nearest neighbour queries for an index that can list the points in a box """
+
+    # the first radius tried by nearest(). It grows until enough points are found.
+    start_radius_km = 5.0
+
+    @abstractmethod
+    def in_box(self, lat_min, lat_max, lon_ranges):
+        """ Yields (id, latitude, longitude) for at least every point in the box """
+
+    def within(self, lat, lon, radius_km):
+        """ Returns (distance in km, id) of every point within radius_km, nearest first """
+        found = []
+        for row_id, point_lat, point_lon in self.in_box(*bounding_box(lat, lon, radius_km)):
+            distance = haversine_km(lat, lon, point_lat, point_lon)
+            if distance <= radius_km:
+                found.append((distance, row_id))
+        found.sort()
+        return found
+
+    def nearest(self, lat, lon, k, radius_km=None):
+        """ Returns (distance in km, id) of the k points nearest to a point, nearest first
+
+        Only points within radius_km are returned when it is given.
+        """
+        # half the circumference of the earth reaches every point
+        limit = math.pi * EARTH_RADIUS_KM if radius_km is None else radius_km
+        radius = min(self.start_radius_km, limit)
+        while True:
+            # every point closer than the k-th one found within a radius is within it too
+            found = self.within(lat, lon, radius)
+            if len(found) >= k or radius >= limit:
+                return found[:k]
+            radius = min(radius * 4, limit)
+
+
+class GridIndex(GeoQueries):
+    """ Places bucketed into a grid of cell_degrees x cell_degrees cells by their coordinates """
+
+    def __init__(self, cell_degrees=0.1):
+        """ constructor """
+        self.cell_degrees = cell_degrees
+        # (row of cells, column of cells) -> {id: (latitude, longitude)}
+        self._cells = {}
+        # id -> (cell, latitude, longitude), as rows are changed in place
+        self._points = {}
+
+    def cell(self, lat, lon):
+        """ Returns the cell of a point """
+        return math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees)
+
+    def build(self, items):
+        """ Index every (id, row) pair, dropping whatever was indexed before """
+        self._cells = {}
+        self._points = {}
+        for row_id, row in items:
+            self.add(row_id, row)
+
+    def add(self, row_id, row):
+        """ Index a new row. Rows without coordinates are left out """
+        point = coordinates(row)
+        if point is None:
+            return
+        cell = self.cell(*point)
+        self._points[row_id] = (cell,) + point
+        self._cells.setdefault(cell, {})[row_id] = point
+
+    def remove(self, row_id):
+        """ Remove a row from the index. Unknown ids are ignored """
+        if row_id not in self._points:
+            return
+
+        cell = self._points.pop(row_id)[0]
+        points = self._cells[cell]
+        del points[row_id]
+        if not points:
+            del self._cells[cell]
+
+    def update(self, row_id, row):
+        """ Index a row again after it was changed, or add it when it is new """
+        if row_id in self._points and self._points[row_id][1:] == coordinates(row):
+            return
+        self.remove(row_id)
+        self.add(row_id, row)
+
+    def in_box(self, lat_min, lat_max, lon_ranges):
+        """ Yields (id, latitude, longitude) for every point in the cells the box touches """
+        first_row, last_row = math.floor(lat_min / self.cell_degrees), math.floor(lat_max / self.cell_degrees)
+        columns = [(math.floor(lon_min / self.cell_degrees), math.floor(lon_max / self.cell_degrees))
+                   for lon_min, lon_max in lon_ranges]
+
+        box_size = (last_row - first_row + 1) * sum(last - first + 1 for first, last in columns)
+        if box_size > len(self._cells):
+            # a big box has more cells than there are cells with points in them
+            cells = [cell for cell in self._cells if first_row <= cell[0] <= last_row and
+                     any(first <= cell[1] <= last for first, last in columns)]
+        else:
+            cells = [(row, column) for row in range(first_row, last_row + 1)
+                     for first, last in columns for column in range(first, last + 1)]
+
+        for cell in cells:
+            for row_id, (lat, lon) in self._cells.get(cell, {}).items():
+                yield row_id, lat, lon
+
+    def check(self, items):
+        """ Compare the index with the data. Returns a list of the differences found """
+        problems = []
+        seen = set()
+        for row_id, row in items:
+            point = coordinates(row)
+            if point is None:
+                continue
+            seen.add(row_id)
+            if row_id not in self._points:
+                problems.append("{} is missing from the coordinates index".format(row_id))
+            elif self._points[row_id][1:] != point:
+                problems.append("{} is indexed at {!r} instead of {!r}".format(
+                    row_id, self._points[row_id][1:], point))
+
+        for row_id in self._points:
+            if row_id not in seen:
+                problems.append("{} is in the coordinates index but not in the data".format(row_id))
+
+        return problems
+
+    def __len__(self):
+        return len(self._points)
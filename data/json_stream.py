@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+"""This module reads the rows of a data file one at a time
+
+The data files have the layout {"Place": [{...}, {...}], ...}. Instead of parsing
+the whole file into memory, the rows are decoded one by one from a bounded buffer.
+"""
+
+import json
+import re
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class _Reader():
+    """ Buffered reader that decodes one JSON value at a time """
+
+    def __init__(self, f, chunk_size, max_buffer_size):
+        """ constructor """
+        self.f = f
+        self.chunk_size = chunk_size
+        self.max_buffer_size = max_buffer_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def read_more(self, size):
+        """ Append up to size characters to the buffer. Returns False at the end of the file """
+        # drop what has already been decoded so the buffer only holds the current value
+        if self.pos:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+
+        chunk = self.f.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+
+        self.buffer += chunk
+        if len(self.buffer) > self.max_buffer_size:
+            raise ValueError("A single row is larger than {} characters".format(self.max_buffer_size))
+        return True
+
+    def peek(self):
+        """ Returns the next non-whitespace character without consuming it. '' at the end """
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.read_more(self.chunk_size):
+                return ""
+
+    def expect(self, chars):
+        """ Consume the next character, which has to be one of chars """
+        c = self.peek()
+        if c == "" or c not in chars:
+            raise ValueError("Expected one of '{}' but found '{}'".format(chars, c))
+        self.pos += 1
+        return c
+
+    def decode(self):
+        """ Decode the next JSON value """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # a value that runs up to the end of the buffer may be cut short e.g. 150.0 read as 15
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+
+            # read at least as much again as the value so far so large rows aren't re-decoded too often
+            if not self.read_more(max(self.chunk_size, len(self.buffer) - self.pos)) \
+                    and self.pos >= len(self.buffer):
+                raise ValueError("Unexpected end of file")
+
+
+def iter_rows(f, chunk_size=64 * 1024, max_buffer_size=16 * 1024 * 1024):
+    """ Yields (model name, row) for every row of a data file opened in text mode """
+
+    reader = _Reader(f, chunk_size, max_buffer_size)
+
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+
+    while True:
+        model = reader.decode()
+        if not isinstance(model, str):
+            raise ValueError("Expected a model name but found {!r}".format(model))
+        reader.expect(":")
+        reader.expect("[")
+
+        if reader.peek() == "]":
+            reader.expect("]")
+        else:
+            while True:
+                yield model, reader.decode()
+                if reader.expect(",]") == "]":
+                    break
+
+        if reader.expect(",}") == "}":
+            break
+
+    if reader.peek() != "":
+        raise ValueError("Extra data after the end of the file")
@@ -0,0 +1,314 @@
+#!/usr/bin/python3
+"""This module defines a memory-mapped columnar file for the place data
+
+Every gunicorn worker maps the same file, so the OS page cache holds one copy
+of the places instead of each worker keeping its own dictionaries.
+
+File layout (native byte order, every section 8-byte aligned):
+    header          magic, row count, mtime and size of the source JSON file
+    numbers         one float64 array per numeric field
+    kinds           one byte array per field telling whether each row's value is missing,
+                    null, an int, a float or a string
+    string offsets  one array of row count + 1 offsets into the string heap per string field,
+                    and one for the extra fields
+    id index        row numbers sorted by id, for binary search
+    string heap     the UTF-8 bytes of every string
+
+The rows read back are the rows written. Fields that aren't in FIELDS, and values
+that don't fit the column of their field, are kept in a JSON object per row in
+the extra fields.
+"""
+
+import json
+import mmap
+import os
+import struct
+from array import array
+from collections.abc import MutableMapping
+from pathlib import Path
+from data.tracked_dict import ChangeTracker
+
+MAGIC = b"HBPCOL02"
+HEADER = struct.Struct("=8sQqQ")
+
+# Fields in the order they appear in the place rows
+FIELDS = ["id", "host_user_id", "city_id", "name", "description", "address",
+          "latitude", "longitude", "number_of_rooms", "bathrooms", "price_per_night",
+          "max_guests", "created_at", "updated_at"]
+STRING_FIELDS = ["id", "host_user_id", "city_id", "name", "description", "address"]
+NUMBER_FIELDS = ["latitude", "longitude", "number_of_rooms", "bathrooms", "price_per_night",
+                 "max_guests", "created_at", "updated_at"]
+
+# the strings of the offsets named EXTRA are the JSON of the fields kept outside the columns
+EXTRA = "extra"
+HEAP_FIELDS = STRING_FIELDS + [EXTRA]
+
+# the kind of each value, so that e.g. 150 doesn't come back as 150.0 or None as "None"
+MISSING, NULL, INTEGER, FLOAT, STRING = range(5)
+
+# the largest ints that float64 holds exactly
+MAX_EXACT_INTEGER = 2 ** 53
+
+
+def _kind_of(field, row):
+    """ Returns the kind of the value of a field of a row, None when it doesn't fit the column """
+    if field not in row:
+        return MISSING
+    value = row[field]
+    if value is None:
+        return NULL
+    if field in STRING_FIELDS:
+        return STRING if isinstance(value, str) else None
+    # bools are ints too, they are kept in the extra fields
+    if type(value) is int and abs(value) <= MAX_EXACT_INTEGER:
+        return INTEGER
+    if type(value) is float:
+        return FLOAT
+    return None
+
+
+def _align(size):
+    """ Round a size up to a multiple of 8 """
+    return (size + 7) & ~7
+
+
+class PlaceColumns():
+    """ Read-only memory-mapped columnar place data """
+
+    def __init__(self, filename):
+        """ constructor """
+        with open(filename, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.count, self.source_mtime_ns, self.source_size = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError("'{}' is not a place columns file".format(filename))
+
+        view = memoryview(self._mmap)
+        n = self.count
+        offset = _align(HEADER.size)
+
+        self._numbers = {}
+        for field in NUMBER_FIELDS:
+            self._numbers[field] = view[offset:offset + n * 8].cast('d')
+            offset += n * 8
+
+        self._kinds = {}
+        for field in FIELDS:
+            self._kinds[field] = view[offset:offset + n]
+            offset += n
+        offset = _align(offset)
+
+        self._offsets = {}
+        for field in HEAP_FIELDS:
+            self._offsets[field] = view[offset:offset + (n + 1) * 8].cast('Q')
+            offset += (n + 1) * 8
+
+        self._id_index = view[offset:offset + n * 4].cast('I')
+        offset = _align(offset + n * 4)
+
+        self._heap = view[offset:]
+
+    @staticmethod
+    def write(filename, rows, source_filename):
+        """ Write the rows to a columns file. Written to a temp file and renamed into place """
+        rows = list(rows)
+        n = len(rows)
+
+        numbers = {field: array('d') for field in NUMBER_FIELDS}
+        kinds = {field: bytearray() for field in FIELDS}
+        offsets = {field: array('Q', [0]) for field in HEAP_FIELDS}
+        heaps = {field: bytearray() for field in HEAP_FIELDS}
+        ids = []
+
+        for row in rows:
+            extra = {field: value for field, value in row.items() if field not in kinds}
+            strings = {EXTRA: ""}
+            for field in FIELDS:
+                kind = _kind_of(field, row)
+                if kind is None:
+                    extra[field] = row[field]
+                    kind = MISSING
+                kinds[field].append(kind)
+                if field in numbers:
+                    numbers[field].append(float(row[field]) if kind in (INTEGER, FLOAT) else float('nan'))
+                else:
+                    strings[field] = row[field] if kind == STRING else ""
+            if extra:
+                strings[EXTRA] = json.dumps(extra, separators=(',', ':'))
+
+            for field in HEAP_FIELDS:
+                encoded = strings[field].encode('utf-8')
+                heaps[field] += encoded
+                offsets[field].append(len(heaps[field]))
+                if field == "id":
+                    ids.append(encoded)
+
+        # every field has its own stretch of the heap so shift its offsets to where it starts
+        heap = bytearray()
+        for field in HEAP_FIELDS:
+            offsets[field] = array('Q', [offset + len(heap) for offset in offsets[field]])
+            heap += heaps[field]
+
+        id_index = array('I', sorted(range(n), key=ids.__getitem__))
+
+        stat = os.stat(source_filename)
+        tmp_filename = "{}.{}.tmp".format(filename, os.getpid())
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        try:
+            with open(tmp_filename, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, n, stat.st_mtime_ns, stat.st_size))
+                f.write(b"\0" * (_align(HEADER.size) - HEADER.size))
+                for field in NUMBER_FIELDS:
+                    numbers[field].tofile(f)
+                for field in FIELDS:
+                    f.write(kinds[field])
+                f.write(b"\0" * (_align(len(FIELDS) * n) - len(FIELDS) * n))
+                for field in HEAP_FIELDS:
+                    offsets[field].tofile(f)
+                id_index.tofile(f)
+                f.write(b"\0" * (_align(n * 4) - n * 4))
+                f.write(heap)
+            os.replace(tmp_filename, filename)
+        finally:
+            if Path(tmp_filename).is_file():
+                os.remove(tmp_filename)
+
+    @staticmethod
+    def is_fresh(filename, source_filename):
+        """ True when the columns file was written from the current version of the source file """
+        try:
+            with open(filename, 'rb') as f:
+                magic, _, mtime_ns, size = HEADER.unpack(f.read(HEADER.size))
+        except (OSError, struct.error):
+            return False
+
+        stat = os.stat(source_filename)
+        return magic == MAGIC and mtime_ns == stat.st_mtime_ns and size == stat.st_size
+
+    def string(self, field, i):
+        """ Returns a string field of row i """
+        offsets = self._offsets[field]
+        return str(self._heap[offsets[i]:offsets[i + 1]], 'utf-8')
+
+    def number(self, field, i):
+        """ Returns a numeric field of row i, None when it is missing or null """
+        kind = self._kinds[field][i]
+        if kind == INTEGER:
+            return int(self._numbers[field][i])
+        if kind == FLOAT:
+            return self._numbers[field][i]
+        return None
+
+    def row(self, i):
+        """ Returns row i as a dictionary """
+        row = {}
+        for field in FIELDS:
+            kind = self._kinds[field][i]
+            if kind == NULL:
+                row[field] = None
+            elif kind == STRING:
+                row[field] = self.string(field, i)
+            elif kind != MISSING:
+                row[field] = self.number(field, i)
+
+        extra = self.string(EXTRA, i)
+        if extra:
+            row.update(json.loads(extra))
+        return row
+
+    def find(self, place_id):
+        """ Returns the row number of a place id or None. Binary search on the id index """
+        key = place_id.encode('utf-8')
+        offsets = self._offsets["id"]
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            i = self._id_index[mid]
+            candidate = self._heap[offsets[i]:offsets[i + 1]].tobytes()
+            if candidate < key:
+                lo = mid + 1
+            elif candidate > key:
+                hi = mid
+            else:
+                return i
+        return None
+
+
+class ColumnarPlaceData(ChangeTracker, MutableMapping):
+    """ place_data read from PlaceColumns, with the changes made since it was written kept in memory """
+
+    model = "Place"
+
+    def __init__(self, columns):
+        """ constructor """
+        self.columns = columns
+        self._updated = {}   # rows of the columns file that were replaced
+        self._removed = set()  # ids of rows of the columns file that were deleted
+        self._new = {}       # rows that are not in the columns file
+        self._init_changes()
+
+    def _base_row(self, key):
+        """ Returns the row number in the columns file of a place that hasn't been deleted """
+        if key in self._removed or not isinstance(key, str):
+            return None
+        return self.columns.find(key)
+
+    def __getitem__(self, key):
+        if key in self._new:
+            return self._new[key]
+        if key in self._updated:
+            return self._updated[key]
+
+        i = self._base_row(key)
+        if i is None:
+            raise KeyError(key)
+        return self.columns.row(i)
+
+    def __contains__(self, key):
+        return key in self._new or key in self._updated or self._base_row(key) is not None
+
+    def __setitem__(self, key, row):
+        with self._changes_lock:
+            self._track_set(key, key in self)
+            if key in self._new or (key not in self._removed and self.columns.find(key) is None):
+                self._new[key] = row
+            else:
+                self._removed.discard(key)
+                self._updated[key] = row
+
+    def __delitem__(self, key):
+        with self._changes_lock:
+            if key in self._new:
+                del self._new[key]
+            elif self._base_row(key) is not None:
+                self._updated.pop(key, None)
+                self._removed.add(key)
+            else:
+                raise KeyError(key)
+            self._track_delete(key)
+
+    def __iter__(self):
+        """ Iterates over the ids in the order of the columns file, then the new places """
+        for i in range(self.columns.count):
+            key = self.columns.string("id", i)
+            if key not in self._removed:
+                yield key
+        yield from list(self._new)
+
+    def __len__(self):
+        return self.columns.count - len(self._removed) + len(self._new)
+
+    def items(self):
+        """ Iterates over (id, row) pairs without looking every id up again """
+        for i in range(self.columns.count):
+            key = self.columns.string("id", i)
+            if key in self._removed:
+                continue
+            yield key, self._updated[key] if key in self._updated else self.columns.row(i)
+        yield from list(self._new.items())
+
+    def values(self):
+        """ Iterates over the rows """
+        for _, row in self.items():
+            yield row
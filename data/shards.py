@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+"""This module splits a model file into shards chosen by a hash of the record id
+
+A manifest file e.g. data/review.manifest.json describes the layout:
+    {"model": "Review", "hash": "crc32", "generation": 3,
+     "shards": ["review.0.json", "review.1.json", ...]}
+Every shard has the usual {"Review": [...]} layout. The generation goes up each
+time shards are rewritten, so anything cached from the manifest knows it is stale.
+
+To split an existing file (the original file is left alone):
+    python3 -m data.shards data/review.json 8
+"""
+
+import json
+import os
+import sys
+import zlib
+from pathlib import Path
+
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+def is_manifest(filename):
+    """ True when the file name is that of a shard manifest """
+    return filename.endswith(MANIFEST_SUFFIX)
+
+
+def shard_for(row_id, count):
+    """ Returns the shard number of a record id. crc32 is the same in every process unlike hash() """
+    return zlib.crc32(row_id.encode('utf-8')) % count
+
+
+def read_manifest(filename):
+    """ Load a manifest. The shard file names are made relative to the current directory """
+    if not Path(filename).is_file():
+        raise FileNotFoundError("Manifest file '{}' missing".format(filename))
+
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except ValueError as exc:
+        raise ValueError("Unable to load manifest from file '{}'".format(filename)) from exc
+
+    if manifest.get("hash") != "crc32" or not manifest.get("shards"):
+        raise ValueError("Unsupported shard layout in '{}'".format(filename))
+
+    directory = os.path.dirname(filename)
+    manifest["shards"] = [os.path.join(directory, shard) for shard in manifest["shards"]]
+    return manifest
+
+
+def write_manifest(filename, model, shards, generation=0):
+    """ Atomically write a manifest. shards are file names relative to the manifest """
+    manifest = {"model": model, "hash": "crc32", "generation": generation, "shards": shards}
+
+    tmp_filename = "{}.{}.tmp".format(filename, os.getpid())
+    with open(tmp_filename, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+
+def split_rows(rows, count):
+    """ Returns the rows split into count lists by shard """
+    shards = [[] for _ in range(count)]
+    for row in rows:
+        shards[shard_for(row['id'], count)].append(row)
+    return shards
+
+
+def reshard(source_filename, count, manifest_filename=None):
+    """ Split a model file, or re-split an already sharded one, into count shards
+
+    Returns the manifest file name
+    """
+    # imported here so that the module can be used without the storage loaded
+    from data.file_storage import FileStorage
+    from data.json_stream import iter_rows
+
+    if count < 1:
+        raise ValueError("The number of shards has to be at least 1")
+
+    storage = FileStorage()
+    old_shards = []
+    if is_manifest(source_filename):
+        old_manifest = read_manifest(source_filename)
+        model = old_manifest["model"]
+        old_shards = old_manifest["shards"]
+        base = source_filename[:-len(MANIFEST_SUFFIX)]
+    else:
+        with open(source_filename, 'r', encoding='utf-8') as f:
+            model = next(iter_rows(f), (None, None))[0]
+        if model is None:
+            raise ValueError("No rows to shard in '{}'".format(source_filename))
+        base = os.path.splitext(source_filename)[0]
+
+    rows = storage.load_model_data(source_filename).values()
+    manifest_filename = manifest_filename or base + MANIFEST_SUFFIX
+
+    shards = []
+    for i, shard_rows in enumerate(split_rows(rows, count)):
+        shard_filename = "{}.{}.json".format(base, i)
+        storage.update_and_save_model_data({model: shard_rows}, shard_filename)
+        shards.append(os.path.basename(shard_filename))
+
+    write_manifest(manifest_filename, model, shards)
+
+    # going down to fewer shards leaves the old extra ones behind
+    for shard_filename in old_shards:
+        if os.path.basename(shard_filename) not in shards and Path(shard_filename).is_file():
+            os.remove(shard_filename)
+
+    return manifest_filename
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python3 -m data.shards <model file or manifest> <number of shards>")
+        sys.exit(1)
+    print("Wrote {}".format(reshard(sys.argv[1], int(sys.argv[2]))))
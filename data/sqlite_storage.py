@@ -0,0 +1,655 @@
+#!/usr/bin/python3
+"""This module defines a class to manage SQLite storage for hbnb evolution
+
+The tables are exposed as dictionary-like objects so the rest of the app can use
+them exactly like the dictionaries loaded by FileStorage e.g. place_data[place_id]
+"""
+
+import sqlite3
+import threading
+from collections.abc import Mapping, MutableMapping
+from data.file_storage import FileStorage
+from data.indexes import UNIQUE_CONSTRAINTS, GeoQueries, coordinates, normalize, tokenize
+
+# Columns of every model table. The id is always the primary key.
+MODEL_COLUMNS = {
+    "Country": [("id", "TEXT"), ("name", "TEXT"), ("code", "TEXT"),
+                ("created_at", "REAL"), ("updated_at", "REAL")],
+    "City": [("id", "TEXT"), ("country_id", "TEXT"), ("name", "TEXT"),
+             ("created_at", "REAL"), ("updated_at", "REAL")],
+    "Amenity": [("id", "TEXT"), ("name", "TEXT"), ("created_at", "REAL"), ("updated_at", "REAL")],
+    "Place": [("id", "TEXT"), ("host_user_id", "TEXT"), ("city_id", "TEXT"), ("name", "TEXT"),
+              ("description", "TEXT"), ("address", "TEXT"), ("latitude", "REAL"), ("longitude", "REAL"),
+              ("number_of_rooms", "INTEGER"), ("bathrooms", "INTEGER"), ("price_per_night", "REAL"),
+              ("max_guests", "INTEGER"), ("created_at", "REAL"), ("updated_at", "REAL")],
+    "User": [("id", "TEXT"), ("first_name", "TEXT"), ("last_name", "TEXT"), ("email", "TEXT"),
+             ("password", "TEXT"), ("created_at", "REAL"), ("updated_at", "REAL")],
+    "Review": [("id", "TEXT"), ("commentor_user_id", "TEXT"), ("place_id", "TEXT"), ("feedback", "TEXT"),
+               ("rating", "REAL"), ("created_at", "REAL"), ("updated_at", "REAL")]
+}
+
+# Lookups that the app makes by something other than the id. A tuple is an index on several columns
+MODEL_INDEXES = {
+    "Country": ["code", ("created_at", "id")],
+    "City": ["country_id", ("created_at", "id")],
+    "Amenity": [("created_at", "id")],
+    "Place": ["host_user_id", "city_id", "latitude", ("price_per_night", "id"),
+              ("city_id", "price_per_night", "id"), ("created_at", "id")],
+    "User": [("created_at", "id")],
+    "Review": ["place_id", "commentor_user_id", ("created_at", "id")]
+}
+
+# values looked up together with one IN (...) query. Older SQLite versions allow 999 parameters
+MAX_QUERY_PARAMETERS = 500
+
+
+def in_chunks(values):
+    """ Yields the distinct values in lists of up to MAX_QUERY_PARAMETERS and the (?, ?, ...) for each """
+    values = list(dict.fromkeys(values))
+    for start in range(0, len(values), MAX_QUERY_PARAMETERS):
+        chunk = values[start:start + MAX_QUERY_PARAMETERS]
+        yield chunk, "({})".format(", ".join("?" * len(chunk)))
+
+
+class SQLiteStorage():
+    """ Class for keeping the model data in SQLite """
+
+    def __init__(self, database):
+        """ constructor """
+
+        # database is a file name or a URI e.g. 'file:hbnb?mode=memory&cache=shared'
+        self.database = database
+        self._local = threading.local()
+
+        # A shared in-memory database only lives as long as one of its connections,
+        # so keep this one open. It also creates the tables.
+        self._keepalive = self.connection()
+        self._create_tables()
+
+    def connection(self):
+        """ Returns the connection of the current thread """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level None means every statement commits on its own
+            conn = sqlite3.connect(self.database, uri=self.database.startswith("file:"),
+                                   isolation_level=None, cached_statements=256)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _create_tables(self):
+        """ Create the tables and indexes that don't exist yet """
+        conn = self.connection()
+        for model, columns in MODEL_COLUMNS.items():
+            definitions = ", ".join("{} {}".format(name, kind) for name, kind in columns[1:])
+            conn.execute("CREATE TABLE IF NOT EXISTS {} (id TEXT PRIMARY KEY, {})".format(model, definitions))
+            for columns in MODEL_INDEXES.get(model, []):
+                columns = (columns,) if isinstance(columns, str) else columns
+                conn.execute("CREATE INDEX IF NOT EXISTS {}_{} ON {} ({})".format(
+                    model, "_".join(columns), model, ", ".join(columns)))
+
+        # The unique fields are compared lower-cased. The indexes aren't UNIQUE so that
+        # existing duplicates don't stop the database from opening. check() reports them.
+        for model, constraints in UNIQUE_CONSTRAINTS.items():
+            for fields in constraints:
+                conn.execute("CREATE INDEX IF NOT EXISTS {}_unique_{} ON {} ({})".format(
+                    model, "_".join(fields), model, ", ".join("lower({})".format(field) for field in fields)))
+
+        conn.execute("CREATE TABLE IF NOT EXISTS Place_to_Amenity "
+                     "(place_id TEXT, amenity_id TEXT, PRIMARY KEY (place_id, amenity_id))")
+        conn.execute("CREATE INDEX IF NOT EXISTS Place_to_Amenity_amenity_id ON Place_to_Amenity (amenity_id)")
+
+    def table(self, model):
+        """ Returns the dictionary-like object for a model table e.g. 'Place' """
+        return SQLiteTable(self, model)
+
+    def index(self, model, field):
+        """ Returns the lookups by a column of a model table e.g. ('Country', 'code') """
+        return SQLiteIndex(self, model, field)
+
+    def unique_index(self, model, fields):
+        """ Returns the unique constraint on some fields of a model table e.g. ('User', ('email',)) """
+        return SQLiteUniqueIndex(self, model, fields)
+
+    def geo_index(self, model):
+        """ Returns the radius and nearest queries on the coordinates of a model table e.g. 'Place' """
+        return SQLiteGeoIndex(self, model)
+
+    def sorted_index(self, model, field, group_by=None):
+        """ Returns the ordered range queries on a column of a model table e.g. ('Place', 'price_per_night') """
+        return SQLiteSortedIndex(self, model, field, group_by)
+
+    def text_index(self, model, fields):
+        """ Returns the full-text search on some fields of a model table e.g. ('Review', ('feedback',)) """
+        return SQLiteTextIndex(self, model, fields)
+
+    def amenity_index(self):
+        """ Returns the filtering of the places by the amenities they have and don't have """
+        return SQLiteAmenityIndex(self)
+
+    def many_to_many(self):
+        """ Returns the place id -> list of amenity ids view of the Place_to_Amenity table """
+        return SQLiteManyToMany(self)
+
+    def import_files(self, files):
+        """ Copy the JSON data files into empty tables
+
+        files maps the table name to (filename, kind) as in FileStorage.load_all
+        Tables that already have rows are left alone. Returns the names of the imported tables
+        """
+        conn = self.connection()
+        empty = {name: spec for name, spec in files.items()
+                 if conn.execute("SELECT 1 FROM {} LIMIT 1".format(name)).fetchone() is None}
+        if not empty:
+            return []
+
+        loaded = FileStorage().load_all(empty)
+
+        conn.execute("BEGIN")
+        try:
+            for name, data in loaded.items():
+                if name == "Place_to_Amenity":
+                    conn.executemany("INSERT OR IGNORE INTO Place_to_Amenity (place_id, amenity_id) VALUES (?, ?)",
+                                     [(place_id, amenity_id) for place_id, amenity_ids in data.items()
+                                      for amenity_id in amenity_ids])
+                else:
+                    table = self.table(name)
+                    conn.executemany(table.sql_replace, [table.to_values(row) for row in data.values()])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        return list(loaded)
+
+    def mark_dirty(self, data):
+        """ Every change is already committed. Nothing to do """
+
+    def flush(self):
+        """ Every change is already committed. Nothing to do """
+
+
+class SQLiteTable(MutableMapping):
+    """ Dictionary-like view of a model table keyed by id """
+
+    def __init__(self, storage, model):
+        """ constructor """
+        self.storage = storage
+        self.model = model
+        self.columns = [name for name, _ in MODEL_COLUMNS[model]]
+
+        # the statements are built once so sqlite3 can reuse them from its statement cache
+        names = ", ".join(self.columns)
+        self.sql_select = "SELECT {} FROM {} WHERE id = ?".format(names, model)
+        self.sql_select_all = "SELECT {} FROM {}".format(names, model)
+        self.sql_contains = "SELECT 1 FROM {} WHERE id = ?".format(model)
+        self.sql_ids = "SELECT id FROM {}".format(model)
+        self.sql_count = "SELECT COUNT(*) FROM {}".format(model)
+        self.sql_replace = "INSERT OR REPLACE INTO {} ({}) VALUES ({})".format(
+            model, names, ", ".join("?" * len(self.columns)))
+        self.sql_delete = "DELETE FROM {} WHERE id = ?".format(model)
+
+    def to_values(self, row):
+        """ Returns the column values of a row """
+        return [row.get(name) for name in self.columns]
+
+    def to_row(self, values):
+        """ Returns the row dictionary for some column values """
+        return dict(zip(self.columns, values))
+
+    def __getitem__(self, key):
+        """ Returns the row with the id """
+        values = self.storage.connection().execute(self.sql_select, (key,)).fetchone()
+        if values is None:
+            raise KeyError(key)
+        return self.to_row(values)
+
+    def __contains__(self, key):
+        """ Checks that a row exists without reading it """
+        return self.storage.connection().execute(self.sql_contains, (key,)).fetchone() is not None
+
+    def __setitem__(self, key, row):
+        """ Inserts or replaces the row with the id """
+        if row.get('id') != key:
+            raise ValueError("Row id {} doesn't match key {}".format(row.get('id'), key))
+        self.storage.connection().execute(self.sql_replace, self.to_values(row))
+
+    def __delitem__(self, key):
+        """ Deletes the row with the id """
+        if self.storage.connection().execute(self.sql_delete, (key,)).rowcount == 0:
+            raise KeyError(key)
+
+    def __iter__(self):
+        """ Iterates over the ids """
+        for (key,) in self.storage.connection().execute(self.sql_ids):
+            yield key
+
+    def __len__(self):
+        return self.storage.connection().execute(self.sql_count).fetchone()[0]
+
+    def get_many(self, keys):
+        """ Returns {id: row} for the ids that exist, looked up together """
+        rows = {}
+        for chunk, parameters in in_chunks(keys):
+            for values in self.storage.connection().execute(
+                    "{} WHERE id IN {}".format(self.sql_select_all, parameters), chunk):
+                rows[values[0]] = self.to_row(values)
+        return rows
+
+    def items(self):
+        """ Iterates over (id, row) pairs with a single query """
+        for values in self.storage.connection().execute(self.sql_select_all):
+            yield values[0], self.to_row(values)
+
+    def values(self):
+        """ Iterates over the rows with a single query """
+        for values in self.storage.connection().execute(self.sql_select_all):
+            yield self.to_row(values)
+
+
+class SQLiteManyToMany(Mapping):
+    """ Dictionary-like view of Place_to_Amenity: place id -> list of amenity ids
+
+    Has the same lookups in both directions as data.indexes.PlaceAmenityIndex
+    """
+
+    def __init__(self, storage):
+        """ constructor """
+        self.storage = storage
+
+    def __getitem__(self, place_id):
+        rows = self.storage.connection().execute(
+            "SELECT amenity_id FROM Place_to_Amenity WHERE place_id = ? ORDER BY rowid", (place_id,)).fetchall()
+        if not rows:
+            raise KeyError(place_id)
+        return [amenity_id for (amenity_id,) in rows]
+
+    def __contains__(self, place_id):
+        return self.storage.connection().execute(
+            "SELECT 1 FROM Place_to_Amenity WHERE place_id = ? LIMIT 1", (place_id,)).fetchone() is not None
+
+    def __iter__(self):
+        for (place_id,) in self.storage.connection().execute(
+                "SELECT place_id FROM Place_to_Amenity GROUP BY place_id ORDER BY MIN(rowid)"):
+            yield place_id
+
+    def __len__(self):
+        return self.storage.connection().execute(
+            "SELECT COUNT(DISTINCT place_id) FROM Place_to_Amenity").fetchone()[0]
+
+    def add(self, place_id, amenity_id):
+        """ Link an amenity to a place. Adding a link twice keeps one """
+        self.storage.connection().execute(
+            "INSERT OR IGNORE INTO Place_to_Amenity (place_id, amenity_id) VALUES (?, ?)", (place_id, amenity_id))
+
+    def remove(self, place_id, amenity_id):
+        """ Unlink an amenity from a place. Unknown links are ignored """
+        self.storage.connection().execute(
+            "DELETE FROM Place_to_Amenity WHERE place_id = ? AND amenity_id = ?", (place_id, amenity_id))
+
+    def has(self, place_id, amenity_id):
+        """ True when the place has the amenity """
+        return self.storage.connection().execute(
+            "SELECT 1 FROM Place_to_Amenity WHERE place_id = ? AND amenity_id = ?",
+            (place_id, amenity_id)).fetchone() is not None
+
+    def amenities(self, place_id):
+        """ Returns the amenity ids of a place """
+        return self.get(place_id, [])
+
+    def amenities_of(self, place_ids):
+        """ Returns {place id: amenity ids of the place} for several places at once """
+        found = {place_id: [] for place_id in place_ids}
+        for chunk, parameters in in_chunks(found):
+            for place_id, amenity_id in self.storage.connection().execute(
+                    "SELECT place_id, amenity_id FROM Place_to_Amenity WHERE place_id IN {} "
+                    "ORDER BY rowid".format(parameters), chunk):
+                found[place_id].append(amenity_id)
+        return found
+
+    def places(self, amenity_id):
+        """ Returns the ids of the places that have an amenity """
+        return [place_id for (place_id,) in self.storage.connection().execute(
+            "SELECT place_id FROM Place_to_Amenity WHERE amenity_id = ? ORDER BY rowid", (amenity_id,))]
+
+
+class SQLiteIndex():
+    """ Index lookups answered by the SQLite index on a column
+
+    Has the same lookups as data.indexes.HashIndex. The database keeps its indexes
+    up to date itself, so the maintenance methods have nothing to do.
+    """
+
+    def __init__(self, storage, model, field):
+        """ constructor """
+        self.storage = storage
+        self.field = field
+        self.sql_ids = "SELECT id FROM {} WHERE {} = ? ORDER BY rowid".format(model, field)
+        self.sql_find = self.sql_ids + " LIMIT 1"
+        self.sql_ids_of = "SELECT {1}, id FROM {0} WHERE {1} IN {{}} ORDER BY rowid".format(model, field)
+
+    def build(self, items):
+        """ Nothing to do """
+
+    def add(self, row_id, row):
+        """ Nothing to do """
+
+    def remove(self, row_id):
+        """ Nothing to do """
+
+    def update(self, row_id, row):
+        """ Nothing to do """
+
+    def check(self, items=None):
+        """ The database keeps its indexes up to date. Nothing to report """
+        return []
+
+    def find(self, value):
+        """ Returns the id of the first row with the value, or None """
+        found = self.storage.connection().execute(self.sql_find, (value,)).fetchone()
+        return found[0] if found else None
+
+    def ids(self, value):
+        """ Returns the ids of the rows with the value """
+        return [row_id for (row_id,) in self.storage.connection().execute(self.sql_ids, (value,))]
+
+    def ids_of(self, values):
+        """ Returns {value: ids of the rows with the value} for several values at once """
+        found = {value: [] for value in values}
+        for chunk, parameters in in_chunks(found):
+            for value, row_id in self.storage.connection().execute(self.sql_ids_of.format(parameters), chunk):
+                found[value].append(row_id)
+        return found
+
+
+class SQLiteUniqueIndex(SQLiteIndex):
+    """ Unique constraint checks answered by the lower-cased SQLite index on the fields
+
+    Has the same checks as data.indexes.UniqueIndex. Note that SQLite only lower-cases ASCII letters.
+    """
+
+    def __init__(self, storage, model, fields):
+        """ constructor """
+        super().__init__(storage, model, ", ".join(fields))
+        self.model = model
+        self.fields = tuple(fields)
+        lowered = ", ".join("lower({})".format(field) for field in fields)
+        self.sql_conflict = "SELECT id FROM {} WHERE {} AND id != ? LIMIT 1".format(
+            model, " AND ".join("lower({}) = ?".format(field) for field in fields))
+        self.sql_duplicates = "SELECT {0}, group_concat(id, ', ') FROM {1} GROUP BY {0} HAVING COUNT(*) > 1".format(
+            lowered, model)
+
+    def conflict(self, row_id, row):
+        """ Returns the id of another record that has the same unique values as row, or None """
+        values = [normalize(row.get(field)) for field in self.fields]
+        found = self.storage.connection().execute(self.sql_conflict, values + [row_id]).fetchone()
+        return found[0] if found else None
+
+    def check(self, items=None):
+        """ Report values that more than one record has. The database keeps the index itself """
+        problems = []
+        for values in self.storage.connection().execute(self.sql_duplicates):
+            key = values[0] if len(self.fields) == 1 else tuple(values[:-1])
+            problems.append("{} {} {!r} is shared by {}".format(self.model, self.field, key, values[-1]))
+        return problems
+
+
+class SQLiteGeoIndex(GeoQueries):
+    """ Radius and nearest queries answered with the SQLite index on latitude
+
+    Has the same queries as data.indexes.GridIndex
+    """
+
+    def __init__(self, storage, model):
+        """ constructor """
+        self.storage = storage
+        self.sql_in_box = "SELECT id, latitude, longitude FROM {} WHERE latitude BETWEEN ? AND ? " \
+                          "AND longitude BETWEEN ? AND ?".format(model)
+
+    def build(self, items):
+        """ Nothing to do """
+
+    def add(self, row_id, row):
+        """ Nothing to do """
+
+    def remove(self, row_id):
+        """ Nothing to do """
+
+    def update(self, row_id, row):
+        """ Nothing to do """
+
+    def check(self, items=None):
+        """ The database keeps its indexes up to date. Nothing to report """
+        return []
+
+    def in_box(self, lat_min, lat_max, lon_ranges):
+        """ Yields (id, latitude, longitude) for every point in the box """
+        conn = self.storage.connection()
+        for lon_min, lon_max in lon_ranges:
+            for row_id, lat, lon in conn.execute(self.sql_in_box, (lat_min, lat_max, lon_min, lon_max)):
+                if coordinates({"latitude": lat, "longitude": lon}) is not None:
+                    yield row_id, lat, lon
+
+
+class SQLiteSortedIndex():
+    """ Ordered range queries answered by the SQLite index on (group_by, field, id)
+
+    Has the same queries as data.indexes.SortedIndex
+    """
+
+    def __init__(self, storage, model, field, group_by=None):
+        """ constructor """
+        self.storage = storage
+        self.field = field
+        self.group_by = group_by
+        self.sql_value = "SELECT {}, {} FROM {} WHERE id = ? AND typeof({}) IN ('integer', 'real')".format(
+            field, group_by or "NULL", model, field)
+        self.sql_range = "SELECT {0}, id FROM {1} WHERE typeof({0}) IN ('integer', 'real')".format(field, model)
+
+    def build(self, items):
+        """ Nothing to do """
+
+    def add(self, row_id, row):
+        """ Nothing to do """
+
+    def remove(self, row_id):
+        """ Nothing to do """
+
+    def update(self, row_id, row):
+        """ Nothing to do """
+
+    def check(self, items=None):
+        """ The database keeps its indexes up to date. Nothing to report """
+        return []
+
+    def value(self, row_id):
+        """ Returns the value a row is indexed under, or None """
+        found = self.storage.connection().execute(self.sql_value, (row_id,)).fetchone()
+        return float(found[0]) if found else None
+
+    def range(self, low=None, high=None, group=None, after=None, limit=None, after_key=None):
+        """ Returns (value, id) of the rows with low <= value <= high in order """
+        sql = self.sql_range
+        params = []
+        if self.group_by:
+            sql += " AND {} = ?".format(self.group_by)
+            params.append(group)
+        if low is not None:
+            sql += " AND {} >= ?".format(self.field)
+            params.append(low)
+        if high is not None:
+            sql += " AND {} <= ?".format(self.field)
+            params.append(high)
+        if after is not None:
+            found = self.storage.connection().execute(self.sql_value, (after,)).fetchone()
+            if found is None or found[1] != group:
+                raise KeyError(after)
+            after_key = (found[0], after)
+        if after_key is not None:
+            sql += " AND ({0} > ? OR ({0} = ? AND id > ?))".format(self.field)
+            params.extend([after_key[0], after_key[0], after_key[1]])
+        sql += " ORDER BY {}, id".format(self.field)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        return [(float(value), row_id) for value, row_id in self.storage.connection().execute(sql, params)]
+
+
+class SQLiteTextIndex():
+    """ Full-text search answered by an FTS5 table ranked with its bm25()
+
+    Has the same search as data.indexes.TextIndex. The FTS5 table {model}_text is kept up to
+    date by the same calls as the in-memory index. {model}_text_ids numbers the record ids
+    as FTS5 tables are keyed by integers.
+    """
+
+    def __init__(self, storage, model, fields):
+        """ constructor. Indexes the records that aren't indexed yet e.g. just imported ones """
+        self.storage = storage
+        self.model = model
+        self.fields = tuple(fields)
+        names = ", ".join(self.fields)
+
+        self.sql_docid = "SELECT docid FROM {}_text_ids WHERE id = ?".format(model)
+        self.sql_new_docid = "INSERT INTO {}_text_ids (id) VALUES (?)".format(model)
+        self.sql_delete_docid = "DELETE FROM {}_text_ids WHERE docid = ?".format(model)
+        self.sql_delete = "DELETE FROM {}_text WHERE rowid = ?".format(model)
+        self.sql_insert = "INSERT INTO {}_text (rowid, {}) VALUES (?, {})".format(
+            model, names, ", ".join("?" * len(self.fields)))
+        self.sql_search = "SELECT -bm25({0}_text), i.id FROM {0}_text JOIN {0}_text_ids i " \
+                          "ON i.docid = {0}_text.rowid WHERE {0}_text MATCH ? " \
+                          "ORDER BY bm25({0}_text), i.id LIMIT ?".format(model)
+        self.sql_missing = "SELECT id FROM {0} WHERE id NOT IN (SELECT id FROM {0}_text_ids)".format(model)
+        self.sql_stale = "SELECT id FROM {0}_text_ids WHERE id NOT IN (SELECT id FROM {0})".format(model)
+        self.sql_catch_up_ids = "INSERT INTO {0}_text_ids (id) SELECT id FROM {0} WHERE id NOT IN " \
+                                "(SELECT id FROM {0}_text_ids)".format(model)
+        self.sql_catch_up = "INSERT INTO {0}_text (rowid, {1}) SELECT i.docid, {2} FROM {0}_text_ids i " \
+                            "JOIN {0} m ON m.id = i.id WHERE i.docid NOT IN (SELECT rowid FROM {0}_text)".format(
+                                model, names, ", ".join("m." + field for field in self.fields))
+
+        conn = storage.connection()
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS {}_text USING fts5({})".format(model, names))
+        conn.execute("CREATE TABLE IF NOT EXISTS {}_text_ids (docid INTEGER PRIMARY KEY, id TEXT UNIQUE)".format(
+            model))
+
+        def catch_up():
+            conn.execute(self.sql_catch_up_ids)
+            conn.execute(self.sql_catch_up)
+
+        self._in_transaction(catch_up)
+
+    def _in_transaction(self, change):
+        """ Run change() so that either all or none of its statements are committed """
+        conn = self.storage.connection()
+        conn.execute("BEGIN")
+        try:
+            change()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def build(self, items):
+        """ Nothing to do. The records are indexed when the index is created """
+
+    def add(self, row_id, row):
+        """ Index a new row """
+        self.update(row_id, row)
+
+    def remove(self, row_id):
+        """ Remove a row from the index. Unknown ids are ignored """
+        conn = self.storage.connection()
+        found = conn.execute(self.sql_docid, (row_id,)).fetchone()
+        if found is None:
+            return
+
+        def change():
+            conn.execute(self.sql_delete, found)
+            conn.execute(self.sql_delete_docid, found)
+
+        self._in_transaction(change)
+
+    def update(self, row_id, row):
+        """ Index a row again after it was changed, or add it when it is new """
+        conn = self.storage.connection()
+        values = [row.get(field) if isinstance(row.get(field), str) else None for field in self.fields]
+
+        def change():
+            found = conn.execute(self.sql_docid, (row_id,)).fetchone()
+            if found is None:
+                docid = conn.execute(self.sql_new_docid, (row_id,)).lastrowid
+            else:
+                docid = found[0]
+                conn.execute(self.sql_delete, (docid,))
+            conn.execute(self.sql_insert, [docid] + values)
+
+        self._in_transaction(change)
+
+    def search(self, query, limit=None):
+        """ Returns (score, id) of the rows with any word of the query, best match first """
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        # quoted so that words like AND or NEAR aren't read as operators
+        match = " OR ".join('"{}"'.format(term) for term in terms)
+        return list(self.storage.connection().execute(self.sql_search, (match, -1 if limit is None else limit)))
+
+    def check(self, items=None):
+        """ Report records missing from the index and ids left in it after their record was deleted """
+        conn = self.storage.connection()
+        problems = ["{} is missing from the {} index".format(row_id, ", ".join(self.fields))
+                    for (row_id,) in conn.execute(self.sql_missing)]
+        problems.extend("{} is in the {} index but not in the data".format(row_id, ", ".join(self.fields))
+                        for (row_id,) in conn.execute(self.sql_stale))
+        return problems
+
+
+class SQLiteAmenityIndex():
+    """ Places filtered by their amenities with the index on Place_to_Amenity
+
+    Has the same queries as data.indexes.AmenityBitmapIndex
+    """
+
+    def __init__(self, storage):
+        """ constructor """
+        self.storage = storage
+
+    def build(self, items):
+        """ Nothing to do """
+
+    def add(self, row_id, row):
+        """ Nothing to do """
+
+    def remove(self, row_id):
+        """ Nothing to do """
+
+    def update(self, row_id, row):
+        """ Nothing to do """
+
+    def link(self, place_id, amenity_id):
+        """ Nothing to do """
+
+    def unlink(self, place_id, amenity_id):
+        """ Nothing to do """
+
+    def check(self, items=None):
+        """ The database keeps its indexes up to date. Nothing to report """
+        return []
+
+    def matching(self, all_of=(), none_of=()):
+        """ Returns the ids of the places that have every amenity in all_of and none in none_of """
+        all_of = list(dict.fromkeys(all_of))
+        none_of = list(dict.fromkeys(none_of))
+        sql = "SELECT id FROM Place WHERE 1"
+        if all_of:
+            sql += " AND id IN (SELECT place_id FROM Place_to_Amenity WHERE amenity_id IN ({}) " \
+                   "GROUP BY place_id HAVING COUNT(*) = ?)".format(", ".join("?" * len(all_of)))
+        if none_of:
+            sql += " AND id NOT IN (SELECT place_id FROM Place_to_Amenity WHERE amenity_id IN ({}))".format(
+                ", ".join("?" * len(none_of)))
+        sql += " ORDER BY rowid"
+
+        params = all_of + ([len(all_of)] if all_of else []) + none_of
+        return [place_id for (place_id,) in self.storage.connection().execute(sql, params)]
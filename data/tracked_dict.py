@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+"""This module defines a dictionary that keeps track of its changed records"""
+
+import threading
+from contextlib import contextmanager
+
+
+class ChangeTracker():
+    """ Remembers which ids were inserted, updated or deleted since the last flush """
+
+    # model is the name used for the records on disk e.g. 'Place'
+    model = None
+
+    # set by ChangeBus.register so the changed ids are also kept for the other workers
+    publish_changes = False
+
+    def _init_changes(self):
+        """ Start with no changes """
+        self.inserted = set()
+        self.updated = set()
+        self.deleted = set()
+        self._unpublished = set()
+        self._tracking = True
+
+        # the storage flusher thread takes the changes while requests are adding to them
+        self._changes_lock = threading.RLock()
+
+    def _track_set(self, key, exists):
+        """ Mark a stored record as inserted or updated. exists tells if the key was present """
+        with self._changes_lock:
+            if not self._tracking:
+                return
+            if self.publish_changes:
+                self._unpublished.add(key)
+            if exists or key in self.deleted:
+                # a record deleted and then added again still exists on disk, so it is an update
+                self.deleted.discard(key)
+                if key not in self.inserted:
+                    self.updated.add(key)
+            else:
+                self.inserted.add(key)
+
+    def _track_delete(self, key):
+        """ Mark a record as deleted. Records that were never flushed simply disappear """
+        with self._changes_lock:
+            if not self._tracking:
+                return
+            if self.publish_changes:
+                self._unpublished.add(key)
+            if key in self.inserted:
+                self.inserted.discard(key)
+            else:
+                self.updated.discard(key)
+                self.deleted.add(key)
+
+    def is_dirty(self):
+        """ True when there are changes that have not been flushed """
+        return bool(self.inserted or self.updated or self.deleted)
+
+    def take_changes(self):
+        """ Return the changed ids as (inserted, updated, deleted) and start tracking afresh """
+        with self._changes_lock:
+            changes = (self.inserted, self.updated, self.deleted)
+            self.clear_changes()
+            return changes
+
+    def take_unpublished(self):
+        """ Return the ids changed since the last call, for the change bus """
+        with self._changes_lock:
+            unpublished = self._unpublished
+            self._unpublished = set()
+            return unpublished
+
+    @contextmanager
+    def untracked(self):
+        """ Changes made inside the block are not tracked e.g. ones another worker already saved """
+        with self._changes_lock:
+            self._tracking = False
+            try:
+                yield self
+            finally:
+                self._tracking = True
+
+    def clear_changes(self):
+        """ Forget the changes, e.g. after replaying the journal """
+        with self._changes_lock:
+            self.inserted = set()
+            self.updated = set()
+            self.deleted = set()
+
+
+class TrackedDict(ChangeTracker, dict):
+    """ Dictionary of model data that remembers which ids changed since the last flush """
+
+    def __init__(self, model, *args, **kwargs):
+        """ constructor """
+        super().__init__(*args, **kwargs)
+        self.model = model
+        self._init_changes()
+
+    def __setitem__(self, key, value):
+        """ Store a record and mark it as inserted or updated """
+        with self._changes_lock:
+            self._track_set(key, key in self)
+            super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        """ Remove a record and mark it as deleted """
+        with self._changes_lock:
+            super().__delitem__(key)
+            self._track_delete(key)
+
+    def pop(self, key, *args):
+        """ Remove a record and return it """
+        with self._changes_lock:
+            had_key = key in self
+            value = super().pop(key, *args)
+            if had_key:
+                self._track_delete(key)
+            return value
+
+    def popitem(self):
+        """ Remove the last record and return it """
+        with self._changes_lock:
+            key, value = super().popitem()
+            self._track_delete(key)
+            return key, value
+
+    def setdefault(self, key, default=None):
+        """ Return a record, adding it first when missing """
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        """ Store several records """
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        """ Remove every record """
+        for key in list(self):
+            del self[key]
@@ -1,4 +1,11 @@
 """
 The purpose of this file is so that the tests folder is interpreted
 as a module.
-"""
\ No newline at end of file
+
+It also sets TESTING=1 before any test imports data, so the tests never
+write to data/journal.log or change the real data files.
+"""
+
+import os
+
+os.environ["TESTING"] = "1"
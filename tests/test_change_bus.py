@@ -0,0 +1,203 @@
+#!/usr/bin/python3
+""" Unittests for HBnB Evolution Part 1
+
+Testing the change bus between worker processes
+"""
+
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from data.change_bus import ChangeBus
+from data.file_storage import FileStorage
+from data.tracked_dict import TrackedDict
+
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "Unix domain sockets are not available")
+class TestChangeBus(unittest.TestCase):
+    """Test passing changes between two buses as if they were two workers"""
+
+    def setUp(self):
+        """Start two buses in the same directory, each with its own user data"""
+        self.tmp_dir = tempfile.mkdtemp()
+        rows = {"u1": {"id": "u1", "first_name": "Bruce"}}
+
+        self.buses = []
+        self.users = []
+        for pid in (1001, 1002):
+            bus = ChangeBus(self.tmp_dir)
+            # both buses live in this process so pretend they are two workers
+            bus.pid = pid
+            user_data = TrackedDict("User", {k: dict(v) for k, v in rows.items()})
+            bus.register(user_data)
+            bus.start()
+            self.buses.append(bus)
+            self.users.append(user_data)
+
+    def tearDown(self):
+        for bus in self.buses:
+            bus.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def wait_for(self, condition):
+        """Wait up to a second for a change to arrive"""
+        deadline = time.monotonic() + 1
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.001)
+        return condition()
+
+    def test_put_and_delete(self):
+        """Test that inserts, updates and deletes reach the other worker"""
+        sender, receiver = self.buses
+        local, remote = self.users
+
+        local["u2"] = {"id": "u2", "first_name": "Selina"}
+        local["u1"]["first_name"] = "Batman"
+        local["u1"] = local["u1"]
+        self.assertEqual(sender.publish(local), 2)
+        self.assertTrue(self.wait_for(lambda: "u2" in remote and remote["u1"]["first_name"] == "Batman"))
+
+        del local["u2"]
+        self.assertEqual(sender.publish(local), 1)
+        self.assertTrue(self.wait_for(lambda: "u2" not in remote))
+
+        # nothing changed since the last publish
+        self.assertEqual(sender.publish(local), 0)
+
+        stats = receiver.stats()
+        self.assertEqual(stats["received"], 2)
+        self.assertEqual(stats["applied"], 3)
+        self.assertGreaterEqual(stats["max_lag"], stats["mean_lag"])
+        self.assertEqual(sender.stats()["sent"], 2)
+
+    def test_remote_changes_not_tracked(self):
+        """Test that applied changes are neither saved nor sent on again"""
+        sender, receiver = self.buses
+        local, remote = self.users
+
+        local["u2"] = {"id": "u2", "first_name": "Selina"}
+        sender.publish(local)
+        self.assertTrue(self.wait_for(lambda: "u2" in remote))
+
+        self.assertFalse(remote.is_dirty())
+        self.assertEqual(receiver.publish(remote), 0)
+
+        # local changes are still tracked afterwards
+        remote["u3"] = {"id": "u3", "first_name": "Alfred"}
+        self.assertEqual(remote.inserted, {"u3"})
+
+    def test_listeners(self):
+        """Test that listeners hear about every applied change"""
+        heard = []
+        self.buses[1].listeners.append(lambda model, row_id, row: heard.append((model, row_id, row)))
+
+        self.buses[1].apply({"origin": 1001, "sequence": 1, "sent_at": time.time(), "previous_sent_at": None,
+                             "changes": [{"model": "User", "op": "put", "id": "u2", "row": {"id": "u2"}},
+                                         {"model": "User", "op": "delete", "id": "u1"}]})
+        self.assertEqual(heard, [("User", "u2", {"id": "u2"}), ("User", "u1", None)])
+
+    def test_apply_waits_for_the_write_lock(self):
+        """Test that a remote change isn't applied while a change of this worker holds the write lock"""
+        receiver = self.buses[1]
+        message = {"origin": 1001, "sequence": 1, "sent_at": time.time(), "previous_sent_at": None,
+                   "changes": [{"model": "User", "op": "put", "id": "u2", "row": {"id": "u2"}}]}
+
+        with receiver.write_lock:
+            applying = threading.Thread(target=receiver.apply, args=(message,))
+            applying.start()
+            applying.join(0.05)
+            self.assertNotIn("u2", self.users[1])
+        applying.join()
+        self.assertIn("u2", self.users[1])
+
+    def test_stale_peer_removed(self):
+        """Test that the socket of a worker that died is cleaned up"""
+        sender, _ = self.buses
+        stale = os.path.join(self.tmp_dir, "999999.sock")
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        s.bind(stale)
+        s.close()
+
+        self.users[0]["u2"] = {"id": "u2", "first_name": "Selina"}
+        sender.publish(self.users[0])
+        self.assertFalse(os.path.exists(stale))
+
+    def test_storage_publishes_on_mark_dirty(self):
+        """Test that FileStorage.mark_dirty sends the change once it is saved"""
+        storage = FileStorage()
+        storage.change_bus = self.buses[0]
+
+        self.users[0]["u2"] = {"id": "u2", "first_name": "Selina"}
+        storage.mark_dirty(self.users[0])
+        self.assertTrue(self.wait_for(lambda: "u2" in self.users[1]))
+
+    def saved_storage(self, data):
+        """Returns a FileStorage saving the users to the test directory, the way every worker shares it"""
+        filename = os.path.join(self.tmp_dir, "user.json")
+        storage = FileStorage(journal_filename=os.path.join(self.tmp_dir, "journal.log"))
+        if not os.path.exists(filename):
+            storage.update_and_save_model_data(data, filename)
+        storage.register(data, filename)
+        return storage
+
+    def message(self, sequence, previous_sent_at, changes=()):
+        """Returns a message as if the first worker had sent it"""
+        return {"origin": 1001, "sequence": sequence, "sent_at": time.time(),
+                "previous_sent_at": previous_sent_at, "changes": list(changes)}
+
+    def test_missed_message_reloads(self):
+        """Test that a worker that missed a message reloads the changes from disk"""
+        receiver = self.buses[1]
+        local, remote = self.users
+        receiver.storage = self.saved_storage(remote)
+        heard = []
+        receiver.listeners.append(lambda model, row_id, row: heard.append((model, row_id, row)))
+
+        receiver.apply(self.message(1, None))
+        # the second message is lost on the way
+        local["u1"] = {"id": "u1", "first_name": "Batman"}
+        local["u2"] = {"id": "u2", "first_name": "Selina"}
+        self.saved_storage(local).save_changes(local)
+
+        # a change of this worker that isn't saved yet
+        remote["u3"] = {"id": "u3", "first_name": "Alfred"}
+
+        receiver.apply(self.message(3, time.time(), [{"model": "User", "op": "put", "id": "u4",
+                                                      "row": {"id": "u4", "first_name": "Lucius"}}]))
+        self.assertEqual(remote["u1"]["first_name"], "Batman")
+        self.assertEqual(set(remote), {"u1", "u2", "u3", "u4"})
+        self.assertIn(("User", "u2", {"id": "u2", "first_name": "Selina"}), heard)
+
+        stats = receiver.stats()
+        self.assertEqual((stats["missed"], stats["reloads"]), (1, 1))
+        # the local change was saved before reloading and isn't sent back as someone else's
+        self.assertIn("u3", self.journaled_ids())
+        self.assertFalse(remote.is_dirty())
+
+    def journaled_ids(self):
+        """Returns the ids of the records in the journal of the test directory"""
+        with open(os.path.join(self.tmp_dir, "journal.log"), 'r', encoding='utf-8') as f:
+            return {json.loads(line)["id"] for line in f}
+
+    def test_first_message_after_load(self):
+        """Test that the first message of a worker only means a missed one if the one before was sent after loading"""
+        receiver = self.buses[1]
+        receiver.storage = self.saved_storage(self.users[1])
+
+        receiver.apply(self.message(7, receiver._synced_at - 1))
+        self.assertEqual(receiver.stats()["missed"], 0)
+
+        receiver.apply(self.message(8, time.time()))
+        self.assertEqual(receiver.stats()["missed"], 0)
+
+        receiver._received.clear()
+        receiver.apply(self.message(9, time.time()))
+        self.assertEqual(receiver.stats()["reloads"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -135,6 +135,45 @@ class TestPlacesDelete(unittest.TestCase):
         # Assert the response status code is 404 Not Found
         self.assertEqual(response.status_code, 404)
 
+    def test_places_delete_unlinks_amenities(self):
+        """Test that a deleted place is no longer listed by its amenities, and a deleted amenity by its places"""
+        country = self.app.post('/api/v1/countries', json={"name": "Doom Valley", "code": "DV"}).json
+        city = self.app.post('/api/v1/cities', json={"name": "Doomstadt", "country_id": country["id"]}).json
+        user = self.app.post('/api/v1/users', json={"first_name": "Victor", "last_name": "Doom",
+                                                    "email": "victor@latveria.com", "password": "armour"}).json
+        places = [self.app.post('/api/v1/places', json={
+            "name": name, "description": "Ruled by Doom", "address": "Latveria", "latitude": 46.0,
+            "longitude": 20.0, "number_of_rooms": 10, "bathrooms": 5, "price_per_night": 500, "max_guests": 20,
+            "host_user_id": user["id"], "city_id": city["id"]}).json for name in ("Castle Doom", "Doom Keep")]
+        amenities = [self.app.post('/api/v1/amenities', json={"name": name}).json for name in ("Moat", "Throne")]
+        for place in places:
+            for amenity in amenities:
+                data.place_to_amenity_data.add(place["id"], amenity["id"])
+
+        self.app.delete('/api/v1/places/{}'.format(places[0]["id"]))
+        response = self.app.get('/api/v1/amenities/{}/place'.format(amenities[0]["id"]))
+        self.assertEqual(response.json, [{"place_id": places[1]["id"]}])
+        self.assertEqual(data.place_to_amenity_data.amenities(places[0]["id"]), [])
+
+        self.app.delete('/api/v1/amenities/{}'.format(amenities[1]["id"]))
+        self.assertEqual(data.place_to_amenity_data.amenities(places[1]["id"]), [amenities[0]["id"]])
+        self.assertEqual(data.index_manager.check(), [])
+
+    def test_links_of_places_deleted_elsewhere(self):
+        """Test that the links of places deleted by another worker, or before a restart, are removed too"""
+        amenity = self.app.post('/api/v1/amenities', json={"name": "Hall of Doom"}).json
+        for place_id in ("gone-1", "gone-2"):
+            data.place_to_amenity_data.add(place_id, amenity["id"])
+
+        # the delete of another worker passed on by the change bus
+        data.unlink_deleted("Place", "gone-1", None)
+        self.assertEqual(data.place_to_amenity_data.places(amenity["id"]), ["gone-2"])
+
+        # the links file still names a place the journal deleted
+        data.remove_dangling_links()
+        self.assertEqual(data.place_to_amenity_data.places(amenity["id"]), [])
+        self.assertEqual(data.index_manager.check(), [])
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+""" Unittests for HBnB Evolution Part 1
+
+Testing the ?fields= projection of the read endpoints
+"""
+
+import unittest
+from datetime import datetime
+from unittest import mock
+import app as app_module
+from app import app, MODEL_FIELDS
+
+
+class TestFields(unittest.TestCase):
+    """Test limiting the fields returned with ?fields="""
+
+    # don't forget to include the TESTING = 1 flag at the command line
+    # type in the terminal: TESTING=1 python3 -m unittest tests/test_fields.py
+    @classmethod
+    def setUpClass(cls):
+        """Set up the Flask test client and a place with a review"""
+        cls.app = app.test_client()
+        country = cls.app.post('/api/v1/countries', json={"name": "Fieldonia", "code": "FS"}).json
+        cls.city = cls.app.post('/api/v1/cities', json={"name": "Fieldtown", "country_id": country["id"]}).json
+        cls.user = cls.app.post('/api/v1/users', json={"first_name": "Sparse", "last_name": "Fieldset",
+                                                       "email": "sparse@fieldonia.com", "password": "narrow"}).json
+        cls.place = cls.app.post('/api/v1/places', json={
+            "name": "Narrow house", "description": "Only the fields you need", "address": "1 Field St",
+            "latitude": -33.5, "longitude": 151.25, "number_of_rooms": 2, "bathrooms": 1, "price_per_night": 65,
+            "max_guests": 3, "host_user_id": cls.user["id"], "city_id": cls.city["id"]}).json
+        cls.review = cls.app.post('/api/v1/reviews', json={"feedback": "Narrow but cosy",
+                                                           "commentor_user_id": cls.user["id"],
+                                                           "place_id": cls.place["id"], "rating": 4}).json
+
+    def test_all_fields_by_default(self):
+        """Test that without fields every field is returned as before"""
+        response = self.app.get('/api/v1/places/{}'.format(self.place["id"]))
+        self.assertEqual(set(response.json[0]), set(MODEL_FIELDS["Place"]))
+
+        response = self.app.get('/api/v1/places/{}/user'.format(self.place["id"]))
+        self.assertEqual(set(response.json), set(MODEL_FIELDS["User"]) - {"password"})
+
+    def test_some_fields(self):
+        """Test that only the fields asked for are returned, on single records and lists"""
+        response = self.app.get('/api/v1/places/{}?fields=id,name,price_per_night'.format(self.place["id"]))
+        self.assertEqual(response.json, [{"id": self.place["id"], "name": "Narrow house", "price_per_night": 65}])
+
+        response = self.app.get('/api/v1/places?fields=id, name')
+        self.assertTrue(response.json)
+        self.assertTrue(all(set(row) == {"id", "name"} for row in response.json))
+
+        response = self.app.get('/api/v1/cities/{}/places?fields=id'.format(self.city["id"]))
+        self.assertEqual(response.json, [{"id": self.place["id"]}])
+
+        response = self.app.get('/api/v1/users/{}/reviews?fields=rating,feedback'.format(self.user["id"]))
+        self.assertEqual(response.json, [{"feedback": "Narrow but cosy", "rating": 4}])
+
+        response = self.app.get('/api/v1/countries/FS?fields=code')
+        self.assertEqual(response.json, {"code": "FS"})
+
+    def test_skips_datetimes(self):
+        """Test that timestamps left out aren't converted to datetimes"""
+        with mock.patch.object(app_module, "datetime", wraps=datetime) as mocked:
+            self.app.get('/api/v1/reviews?fields=id,rating')
+            self.assertEqual(mocked.fromtimestamp.call_count, 0)
+
+            response = self.app.get('/api/v1/reviews/{}?fields=id,created_at'.format(self.review["id"]))
+            self.assertEqual(mocked.fromtimestamp.call_count, 1)
+            self.assertEqual(set(response.json[0]), {"id", "created_at"})
+
+    def test_route_fields(self):
+        """Test asking for the fields some routes add to the records"""
+        response = self.app.get('/api/v1/places/nearby?lat=-33.5&lon=151.25&k=1&fields=id,distance_km')
+        self.assertEqual(response.json, [{"id": self.place["id"], "distance_km": 0.0}])
+
+        response = self.app.get('/api/v1/search?q=narrow&fields=id,score,rating')
+        self.assertIn(self.place["id"], [row["id"] for row in response.json["places"]])
+        self.assertTrue(all(set(row) == {"id", "score"} for row in response.json["places"]))
+        self.assertTrue(all(set(row) == {"id", "score", "rating"} for row in response.json["reviews"]))
+
+    def test_invalid_fields(self):
+        """Test that fields the route doesn't return are rejected"""
+        for url in ['/api/v1/places?fields=id,colour', '/api/v1/places/{}?fields='.format(self.place["id"]),
+                    '/api/v1/places/{}/user?fields=password'.format(self.place["id"]),
+                    '/api/v1/places/by_price?fields=distance_km', '/api/v1/amenities?fields=code']:
+            self.assertEqual(self.app.get(url).status_code, 400, url)
+
+
+if __name__ == '__main__':
+    unittest.main()
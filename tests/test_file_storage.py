@@ -0,0 +1,360 @@
+#!/usr/bin/python3
+""" Unittests for HBnB Evolution Part 1
+
+Testing the FileStorage persistence layer
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from data import file_storage
+from data.file_storage import FileStorage, fcntl
+from data.tracked_dict import TrackedDict
+
+
+class TestJournal(unittest.TestCase):
+    """Test that changes written to the journal are replayed on load"""
+
+    def setUp(self):
+        """Give every test its own journal file"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.journal_filename = os.path.join(self.tmp_dir, "journal.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_replay_put_and_delete(self):
+        """Test that puts and deletes are applied in order on top of the base data"""
+        storage = FileStorage(journal_filename=self.journal_filename)
+        storage.journal_put("User", {"id": "1", "first_name": "Bruce"})
+        storage.journal_put("User", {"id": "2", "first_name": "Clark"})
+        storage.journal_put("User", {"id": "1", "first_name": "Diana"})
+        storage.journal_delete("User", "2")
+        storage.sync_journal()
+
+        user_data = {"3": {"id": "3", "first_name": "Barry"}}
+        applied = FileStorage(journal_filename=self.journal_filename).replay_journal({"User": user_data})
+
+        self.assertEqual(applied, 4)
+        self.assertEqual(set(user_data.keys()), {"1", "3"})
+        self.assertEqual(user_data["1"]["first_name"], "Diana")
+
+    def test_replay_ignores_torn_record(self):
+        """Test that a record cut short by a crash is ignored and later appends still work"""
+        storage = FileStorage(journal_filename=self.journal_filename)
+        storage.journal_put("City", {"id": "1", "name": "Gotham"})
+        storage.sync_journal()
+        with open(self.journal_filename, 'a', encoding='utf-8') as f:
+            f.write('{"model":"City","op":"put","id":"2","ro')
+
+        storage = FileStorage(journal_filename=self.journal_filename)
+        storage.journal_put("City", {"id": "3", "name": "Metropolis"})
+        storage.sync_journal()
+
+        city_data = {}
+        storage.replay_journal({"City": city_data})
+        self.assertEqual(set(city_data.keys()), {"1", "3"})
+
+    def test_no_journal(self):
+        """Test that nothing is written when no journal file is configured"""
+        storage = FileStorage()
+        self.assertFalse(storage.journal_put("User", {"id": "1"}))
+        self.assertEqual(storage.replay_journal({"User": {}}), 0)
+
+
+class TestTrackedDict(unittest.TestCase):
+    """Test that TrackedDict records the changed ids"""
+
+    def test_changes(self):
+        """Test inserts, updates and deletes since the last flush"""
+        data = TrackedDict("Review", {"1": {"id": "1"}, "2": {"id": "2"}})
+        self.assertFalse(data.is_dirty())
+
+        data["1"] = {"id": "1", "rating": 1}
+        data["3"] = {"id": "3"}
+        data["3"] = {"id": "3", "rating": 2}
+        del data["2"]
+
+        self.assertEqual(data.take_changes(), ({"3"}, {"1"}, {"2"}))
+        self.assertFalse(data.is_dirty())
+
+    def test_insert_then_delete(self):
+        """Test that a record added and removed before a flush leaves no change behind"""
+        data = TrackedDict("Review")
+        data["1"] = {"id": "1"}
+        data.pop("1")
+        self.assertFalse(data.is_dirty())
+
+    def test_save_changes(self):
+        """Test that only the changed records are written"""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        journal_filename = os.path.join(tmp_dir, "journal.log")
+
+        rows = {str(i): {"id": str(i), "rating": 0.5} for i in range(1000)}
+        review_data = TrackedDict("Review", rows)
+        review_data["7"] = {"id": "7", "rating": 1.0}
+        del review_data["8"]
+
+        storage = FileStorage(journal_filename=journal_filename)
+        self.assertEqual(storage.save_changes(review_data), 2)
+        self.assertEqual(storage.save_changes(review_data), 0)
+        storage.sync_journal()
+
+        with open(journal_filename, 'r', encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+        reloaded = dict(rows)
+        storage.replay_journal({"Review": reloaded})
+        self.assertEqual(reloaded, dict(review_data))
+
+
+class TestFlusher(unittest.TestCase):
+    """Test the background flusher and the atomic saves"""
+
+    def setUp(self):
+        """Copy a model file into a temporary directory"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.journal_filename = os.path.join(self.tmp_dir, "journal.log")
+        self.place_filename = os.path.join(self.tmp_dir, "place.json")
+        shutil.copy("data/place.json", self.place_filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def new_storage(self, **kwargs):
+        """Returns a storage with the place data registered"""
+        storage = FileStorage(journal_filename=self.journal_filename, **kwargs)
+        place_data = TrackedDict("Place", storage.load_model_data(self.place_filename))
+        storage.register(place_data, self.place_filename)
+        return storage, place_data
+
+    def test_mark_dirty_returns_before_saving(self):
+        """Test that the flusher thread saves the changes, not the caller"""
+        storage, place_data = self.new_storage(flush_interval=60, flush_threshold=1000)
+        storage.start_flusher()
+        self.addCleanup(storage.stop_flusher)
+
+        place_data["1"] = {"id": "1", "name": "Wayne Manor"}
+        storage.mark_dirty(place_data)
+        self.assertTrue(place_data.is_dirty())
+
+        storage.flush()
+        self.assertFalse(place_data.is_dirty())
+
+        reloaded = storage.load_model_data(self.place_filename)
+        FileStorage(journal_filename=self.journal_filename).replay_journal({"Place": reloaded})
+        self.assertEqual(reloaded["1"]["name"], "Wayne Manor")
+
+    def test_flusher_threshold(self):
+        """Test that reaching the dirty-count threshold wakes the flusher up"""
+        storage, place_data = self.new_storage(flush_interval=60, flush_threshold=2)
+        storage.start_flusher()
+        self.addCleanup(storage.stop_flusher)
+
+        for i in range(2):
+            place_data[str(i)] = {"id": str(i)}
+            storage.mark_dirty(place_data)
+
+        deadline = time.monotonic() + 5
+        while place_data.is_dirty() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(place_data.is_dirty())
+
+    def test_checkpoint(self):
+        """Test that a checkpoint rewrites the model file and empties the journal"""
+        storage, place_data = self.new_storage()
+        del place_data["90c83333-35d4-4638-bdd8-1eceac56915e"]
+        storage.mark_dirty(place_data)
+        storage.checkpoint()
+
+        self.assertEqual(os.path.getsize(self.journal_filename), 0)
+        self.assertEqual(os.listdir(self.tmp_dir).count("place.json.tmp"), 0)
+        self.assertEqual(storage.load_model_data(self.place_filename), dict(place_data))
+
+    def test_checkpoint_includes_other_processes(self):
+        """Test that a checkpoint writes out the changes other processes journaled, even ones it never saw"""
+        storage, place_data = self.new_storage()
+        other, other_place_data = self.new_storage()
+
+        place_data["1"] = {"id": "1", "name": "Wayne Manor"}
+        storage.mark_dirty(place_data)
+        other_place_data["2"] = {"id": "2", "name": "Stark Tower"}
+        other.mark_dirty(other_place_data)
+        self.assertNotIn("2", place_data)
+
+        storage.checkpoint()
+        saved = FileStorage().load_model_data(self.place_filename)
+        self.assertEqual((saved["1"]["name"], saved["2"]["name"]), ("Wayne Manor", "Stark Tower"))
+        self.assertEqual(os.path.getsize(self.journal_filename), 0)
+
+    def test_checkpoint_keeps_later_records(self):
+        """Test that only the records a checkpoint read are removed from the journal"""
+        storage, place_data = self.new_storage()
+        storage.journal_put("Place", {"id": "1", "name": "Wayne Manor"})
+        later = '{"model":"Place","op":"put","id":"2","row":{"id":"2","name":"Stark Tower"}}\n'
+
+        read_journal = storage._read_journal
+
+        def read_then_append():
+            """Another process appends right after the journal is read, as if it ignored the lock"""
+            found = read_journal()
+            with open(self.journal_filename, 'a', encoding='utf-8') as f:
+                f.write(later)
+            return found
+
+        storage._read_journal = read_then_append
+        storage.checkpoint()
+
+        with open(self.journal_filename, 'r', encoding='utf-8') as f:
+            self.assertEqual(f.read(), later)
+        self.assertNotIn("2", storage.load_model_data(self.place_filename))
+
+    @unittest.skipIf(fcntl is None, "flock isn't available")
+    def test_journal_lock_is_shared_by_processes(self):
+        """Test that another process can't take the journal lock while this one holds it"""
+        storage, _ = self.new_storage()
+        try_lock = ("import fcntl, sys\n"
+                    "f = open(sys.argv[1], 'a')\n"
+                    "try:\n"
+                    "    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)\n"
+                    "except BlockingIOError:\n"
+                    "    sys.exit(1)\n")
+        lock_filename = self.journal_filename + ".lock"
+
+        with storage._journal_lock, storage._locked_journal():
+            self.assertEqual(subprocess.run([sys.executable, "-c", try_lock, lock_filename]).returncode, 1)
+        self.assertEqual(subprocess.run([sys.executable, "-c", try_lock, lock_filename]).returncode, 0)
+
+
+class TestSnapshots(unittest.TestCase):
+    """Test the binary snapshot cache used when loading model files"""
+
+    def setUp(self):
+        """Copy a model file into a temporary directory"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.snapshot_dir = os.path.join(self.tmp_dir, "snapshots")
+        self.place_filename = os.path.join(self.tmp_dir, "place.json")
+        shutil.copy("data/place.json", self.place_filename)
+        self.storage = FileStorage(snapshot_dir=self.snapshot_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def fail_to_parse(self, filename):
+        """Stands in for the JSON parser when the snapshot should be used"""
+        raise AssertionError("{} was parsed instead of loaded from its snapshot".format(filename))
+
+    def test_snapshot_is_used(self):
+        """Test that the second load comes from the snapshot"""
+        expected = FileStorage().load_model_data(self.place_filename)
+        self.assertEqual(self.storage.load_model_data(self.place_filename), expected)
+
+        self.storage._parse_model_data = self.fail_to_parse
+        self.assertEqual(self.storage.load_model_data(self.place_filename), expected)
+
+    def test_touched_file_reuses_snapshot(self):
+        """Test that a new mtime with the same contents keeps the snapshot"""
+        self.storage.load_model_data(self.place_filename)
+        stat = os.stat(self.place_filename)
+        os.utime(self.place_filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        self.storage._parse_model_data = self.fail_to_parse
+        self.assertEqual(self.storage.load_model_data(self.place_filename), FileStorage().load_model_data(self.place_filename))
+
+    def test_stale_snapshot_is_rebuilt(self):
+        """Test that changed contents of the same size are parsed again when only the mtime moved"""
+        self.storage.load_model_data(self.place_filename)
+        stat = os.stat(self.place_filename)
+
+        with open(self.place_filename, 'r', encoding='utf-8') as f:
+            content = f.read()
+        with open(self.place_filename, 'w', encoding='utf-8') as f:
+            f.write(content.replace("Ringwood Hotel", "Ringwood Motel"))
+        # the size is the same, so the contents are compared with the digest of the snapshot
+        os.utime(self.place_filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        names = [row['name'] for row in self.storage.load_model_data(self.place_filename).values()]
+        self.assertIn("Ringwood Motel", names)
+
+    def test_many_to_many_snapshot(self):
+        """Test that many to many data is cached as well"""
+        expected = FileStorage().load_many_to_many_data("data/place_to_amenity.json")
+        self.assertEqual(self.storage.load_many_to_many_data("data/place_to_amenity.json"), expected)
+
+        self.storage._parse_many_to_many_data = self.fail_to_parse
+        self.assertEqual(self.storage.load_many_to_many_data("data/place_to_amenity.json"), expected)
+
+
+class TestLoadAll(unittest.TestCase):
+    """Test loading every collection at the same time"""
+
+    files = {
+        "Country": ("data/country.json", "model"),
+        "City": ("data/city.json", "model"),
+        "Place": ("data/place.json", "model"),
+        "Review": ("data/review.json", "model"),
+        "Place_to_Amenity": ("data/place_to_amenity.json", "many_to_many")
+    }
+
+    def sequential(self):
+        """Loads the files one after another"""
+        storage = FileStorage()
+        return {name: storage.load_many_to_many_data(filename) if kind == "many_to_many"
+                else storage.load_model_data(filename)
+                for name, (filename, kind) in self.files.items()}
+
+    def test_load_all_threads(self):
+        """Test that the results match the sequential loading and are timed"""
+        storage = FileStorage()
+        loaded = storage.load_all(self.files)
+
+        self.assertEqual(loaded, self.sequential())
+        for name in self.files:
+            self.assertEqual(list(loaded[name]), list(self.sequential()[name]))
+        self.assertEqual(set(storage.load_timings), set(self.files))
+
+    def test_load_all_processes(self):
+        """Test that parsing in worker processes gives the same results"""
+        submitted_from = []
+
+        class RecordingPool(file_storage.ProcessPoolExecutor):
+            """Records the thread of every submit"""
+
+            def submit(self, *args, **kwargs):
+                submitted_from.append(threading.current_thread())
+                return super().submit(*args, **kwargs)
+
+        with mock.patch.object(file_storage, "ProcessPoolExecutor", wraps=RecordingPool) as pool:
+            loaded = FileStorage().load_all(self.files, process_parse_size=0)
+        self.assertEqual(loaded, self.sequential())
+
+        if file_storage._fork_context() is not None:
+            # spawned processes would import data, and load the files again, before parsing
+            self.assertEqual(pool.call_args.kwargs["mp_context"].get_start_method(), "fork")
+            # the processes are forked by the first submit, before the loader threads exist
+            self.assertIs(submitted_from[0], threading.current_thread())
+            self.assertEqual(len(submitted_from), len(self.files) + 1)
+
+    def test_load_all_without_fork(self):
+        """Test that every file is parsed in a thread where processes can't be forked"""
+        with mock.patch.object(file_storage.multiprocessing, "get_all_start_methods", return_value=["spawn"]), \
+                mock.patch.object(file_storage, "ProcessPoolExecutor") as pool:
+            loaded = FileStorage().load_all(self.files, process_parse_size=0)
+        self.assertEqual(loaded, self.sequential())
+        pool.assert_not_called()
+
+    def test_load_all_missing_file(self):
+        """Test that a missing file is reported before anything is loaded"""
+        with self.assertRaises(FileNotFoundError):
+            FileStorage().load_all({"Place": ("data/nowhere.json", "model")})
+
+
+if __name__ == '__main__':
+    unittest.main()
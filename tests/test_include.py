@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+""" Unittests for HBnB Evolution Part 1
+
+Testing the related records added to places with ?include=
+"""
+
+import unittest
+from unittest import mock
+import app as app_module
+import data
+from app import app
+
+
+class TestInclude(unittest.TestCase):
+    """Test adding the city, country, host, amenities and reviews to places"""
+
+    # don't forget to include the TESTING = 1 flag at the command line
+    # type in the terminal: TESTING=1 python3 -m unittest tests/test_include.py
+    @classmethod
+    def setUpClass(cls):
+        """Set up the Flask test client and two places of one host in one city"""
+        cls.app = app.test_client()
+        cls.country = cls.app.post('/api/v1/countries', json={"name": "Includia", "code": "IC"}).json
+        cls.city = cls.app.post('/api/v1/cities', json={"name": "Compound", "country_id": cls.country["id"]}).json
+        cls.host = cls.app.post('/api/v1/users', json={"first_name": "Ida", "last_name": "Include",
+                                                       "email": "ida@includia.com", "password": "related"}).json
+        cls.places = [cls.app.post('/api/v1/places', json={
+            "name": "Compound {}".format(letter), "description": "Everything at once", "address": "Includia",
+            "latitude": 12.5, "longitude": -70.0, "number_of_rooms": 1, "bathrooms": 1, "price_per_night": 40,
+            "max_guests": 2, "host_user_id": cls.host["id"], "city_id": cls.city["id"]}).json
+            for letter in "AB"]
+        cls.amenity = cls.app.post('/api/v1/amenities', json={"name": "Compound pool"}).json
+        for place in cls.places:
+            data.place_to_amenity_data.add(place["id"], cls.amenity["id"])
+        cls.review = cls.app.post('/api/v1/reviews', json={"feedback": "All in one", "rating": 5,
+                                                           "commentor_user_id": cls.host["id"],
+                                                           "place_id": cls.places[0]["id"]}).json
+
+    def test_specific_place(self):
+        """Test that one request returns what the place's five routes return"""
+        place_id = self.places[0]["id"]
+        place = self.app.get('/api/v1/places/{}?include=city,country,host,amenities,reviews'.format(
+            place_id)).json[0]
+
+        self.assertEqual(place["id"], place_id)
+        self.assertEqual(place["city"], self.app.get('/api/v1/places/{}/city'.format(place_id)).json)
+        self.assertEqual(place["country"], self.app.get('/api/v1/countries/IC').json)
+        self.assertEqual(place["host"], self.app.get('/api/v1/places/{}/user'.format(place_id)).json)
+        self.assertNotIn("password", place["host"])
+        self.assertEqual(place["reviews"], self.app.get('/api/v1/places/{}/review'.format(place_id)).json)
+        self.assertEqual([amenity["id"] for amenity in place["amenities"]], [self.amenity["id"]])
+        self.assertEqual(place["amenities"][0]["name"], "Compound pool")
+
+    def test_some_includes(self):
+        """Test that only the related records asked for are added, next to the fields asked for"""
+        place = self.app.get('/api/v1/places/{}?include=host&fields=id'.format(self.places[1]["id"])).json[0]
+        self.assertEqual(set(place), {"id", "host"})
+
+        place = self.app.get('/api/v1/places/{}?include=reviews'.format(self.places[1]["id"])).json[0]
+        self.assertEqual(place["reviews"], [])
+        self.assertNotIn("city", place)
+
+    def test_list_looks_up_once(self):
+        """Test that the related records of a list are looked up once per model, not per place"""
+        with mock.patch.object(app_module, "get_records", wraps=data.get_records) as get_records:
+            response = self.app.get('/api/v1/places?include=city,country,host,amenities')
+            places = [place for place in response.json if place["city_id"] == self.city["id"]]
+
+        self.assertEqual(len(places), 2)
+        self.assertTrue(all(place["country"]["code"] == "IC" for place in places))
+        self.assertTrue(all(place["host"]["id"] == self.host["id"] for place in places))
+        batches = -(-len(response.json) // app_module.INCLUDE_BATCH_SIZE)
+        # one lookup of the cities, countries, hosts and amenities for each batch of places
+        self.assertEqual(get_records.call_count, 4 * batches)
+
+    def test_paged_list(self):
+        """Test that the related records are added to each page of the list"""
+        response = self.app.get('/api/v1/places?limit=1&include=city')
+        self.assertEqual(len(response.json), 1)
+        self.assertIn("city", response.json[0])
+        self.assertIn("X-Next-Cursor", response.headers)
+
+    def test_invalid_include(self):
+        """Test that related records a place doesn't have are rejected"""
+        for url in ['/api/v1/places?include=city,owner', '/api/v1/places/{}?include=user'.format(self.places[0]["id"])]:
+            self.assertEqual(self.app.get(url).status_code, 400, url)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,233 @@
+#!/usr/bin/python3
+""" Unittests for HBnB Evolution Part 1
+
+Testing the index manager and the write path that feeds it
+"""
+
+import io
+import threading
+import time
+import unittest
+from unittest import mock
+import app as app_module
+import data
+from app import app
+from data.change_bus import ChangeBus
+from data.check_indexes import WorkerIndexes, report, report_change_bus
+from data.index_manager import IndexManager, memory_bytes
+from data.indexes import HashIndex, SortedIndex, UniqueIndex
+
+
+class CountingDict(dict):
+    """Dictionary that counts how many times its rows are read"""
+
+    reads = 0
+
+    def items(self):
+        self.reads += 1
+        return super().items()
+
+
+class TestIndexManager(unittest.TestCase):
+    """Test registering indexes, the write hooks, rebuilding and checking"""
+
+    def setUp(self):
+        """Register a few indexes of some places"""
+        self.places = CountingDict({
+            "1": {"city_id": "a", "price_per_night": 100, "host_user_id": "x"},
+            "2": {"city_id": "b", "price_per_night": 50, "host_user_id": "x"}
+        })
+        self.manager = IndexManager()
+        self.manager.add_collection("Place", self.places)
+        self.city_index = self.manager.register("Place", "city_id", HashIndex("city_id"))
+        self.price_index = self.manager.register("Place", ("city_id", "price_per_night"),
+                                                 SortedIndex("price_per_night", group_by="city_id"))
+        self.manager.rebuild()
+
+    def test_registry(self):
+        """Test looking indexes up by model and field(s)"""
+        self.assertIs(self.manager.get("Place", "city_id"), self.city_index)
+        self.assertIs(self.manager.get("Place", ["city_id", "price_per_night"]), self.price_index)
+        self.assertEqual(self.manager.indexes("Place"), [self.city_index, self.price_index])
+        self.assertEqual(self.manager.indexes("User"), [])
+
+        with self.assertRaises(ValueError):
+            self.manager.register("Place", ("city_id",), HashIndex("city_id"))
+
+        # a unique constraint on the same field is a separate index
+        unique = self.manager.register("Place", "city_id", UniqueIndex("Place", ("city_id",)), unique=True)
+        self.assertEqual(self.manager.unique("Place"), [unique])
+
+    def test_rebuild_reads_once(self):
+        """Test that a rebuild reads the rows of a model once for all its indexes"""
+        self.places.reads = 0
+        self.manager.rebuild()
+        self.assertEqual(self.places.reads, 1)
+        self.assertEqual(self.city_index.ids("a"), ["1"])
+
+    def test_hooks(self):
+        """Test that inserts, updates and deletes reach every index of the model"""
+        self.places["3"] = {"city_id": "a", "price_per_night": 10, "host_user_id": "y"}
+        self.manager.inserted("Place", "3", self.places["3"])
+        self.places["1"]["city_id"] = "b"
+        self.manager.updated("Place", "1", self.places["1"])
+        del self.places["2"]
+        self.manager.deleted("Place", "2")
+        self.manager.apply("Place", "4", None)
+
+        self.assertEqual(self.city_index.ids("a"), ["3"])
+        self.assertEqual(self.price_index.range(group="b"), [(100.0, "1")])
+        self.assertEqual(self.manager.check(), [])
+
+    def test_check_and_stats(self):
+        """Test that drift is reported with the index it was found in, and the stats of each index"""
+        self.places["1"]["price_per_night"] = 75
+        problems = self.manager.check()
+        self.assertEqual(len(problems), 1)
+        self.assertTrue(problems[0].startswith("Place city_id, price_per_night: 1 "))
+
+        stats = self.manager.stats()
+        self.assertEqual([(row["fields"], row["kind"], row["entries"]) for row in stats],
+                         [(["city_id"], "HashIndex", 2), (["city_id", "price_per_night"], "SortedIndex", 2)])
+        self.assertTrue(all(row["build_seconds"] >= 0 for row in stats))
+        self.assertGreater(memory_bytes(self.price_index), memory_bytes(SortedIndex("price_per_night")))
+
+        out = io.StringIO()
+        self.assertEqual(report(self.manager, out), problems)
+        self.assertIn("1 problems found", out.getvalue())
+
+
+class TestWritePath(unittest.TestCase):
+    """Test that the changes made by the routes keep every index up to date"""
+
+    # don't forget to include the TESTING = 1 flag at the command line
+    # type in the terminal: TESTING=1 python3 -m unittest tests/test_index_manager.py
+    def test_routes_keep_indexes_current(self):
+        """Test that posting, changing and deleting records leaves no drift"""
+        client = app.test_client()
+        country = client.post('/api/v1/countries', json={"name": "Krakoa", "code": "KR"}).json
+        city = client.post('/api/v1/cities', json={"name": "Krakoa City", "country_id": country["id"]}).json
+        user = client.post('/api/v1/users', json={"first_name": "Ororo", "last_name": "Munroe",
+                                                  "email": "storm@krakoa.com", "password": "weather"}).json
+        place = client.post('/api/v1/places', json={
+            "name": "Living island", "description": "It moves", "address": "Pacific", "latitude": 1.5,
+            "longitude": 170.0, "number_of_rooms": 3, "bathrooms": 1, "price_per_night": 80, "max_guests": 6,
+            "host_user_id": user["id"], "city_id": city["id"]}).json
+        review = client.post('/api/v1/reviews', json={"feedback": "Lively", "commentor_user_id": user["id"],
+                                                      "place_id": place["id"], "rating": 5}).json
+
+        client.put('/api/v1/places/{}'.format(place["id"]), json={"price_per_night": 90, "name": "Arakko"})
+        client.put('/api/v1/reviews/{}'.format(review["id"]), json={"feedback": "Still lively"})
+        client.put('/api/v1/users/{}'.format(user["id"]), json={"first_name": "Storm"})
+        self.assertEqual(data.index_manager.check(), [])
+
+        client.delete('/api/v1/reviews/{}'.format(review["id"]))
+        client.delete('/api/v1/places/{}'.format(place["id"]))
+        self.assertEqual(data.index_manager.check(), [])
+        self.assertEqual(data.place_price_index.value(place["id"]), None)
+
+    def test_write_path_holds_the_lock(self):
+        """Test that a record and its indexes aren't changed while another thread holds the write lock"""
+        country_id = "write-lock-country"
+        row = {"id": country_id, "name": "Madripoor", "code": "MD", "created_at": 1.0, "updated_at": 1.0}
+
+        with data.write_lock:
+            saving = threading.Thread(target=data.save_record, args=("Country", country_id, row))
+            saving.start()
+            saving.join(0.05)
+            self.assertNotIn(country_id, data.country_data)
+        saving.join()
+        self.assertEqual(data.country_code_index.find("MD"), country_id)
+
+        data.delete_record("Country", country_id)
+        self.assertEqual(data.index_manager.check(), [])
+
+    def test_rejected_put_changes_nothing(self):
+        """Test that a PUT rejected for an invalid field leaves the record and its indexes as they were"""
+        client = app.test_client()
+        country = client.post('/api/v1/countries', json={"name": "Genosha", "code": "GN"}).json
+        city = client.post('/api/v1/cities', json={"name": "Hammer Bay", "country_id": country["id"]}).json
+        user = client.post('/api/v1/users', json={"first_name": "Lorna", "last_name": "Dane",
+                                                  "email": "polaris@genosha.com", "password": "magnetic"}).json
+        place = client.post('/api/v1/places', json={
+            "name": "Citadel", "description": "On the hill", "address": "Hammer Bay", "latitude": -10.5,
+            "longitude": 50.5, "number_of_rooms": 9, "bathrooms": 4, "price_per_night": 300, "max_guests": 12,
+            "host_user_id": user["id"], "city_id": city["id"]}).json
+        review = client.post('/api/v1/reviews', json={"feedback": "Grand", "commentor_user_id": user["id"],
+                                                      "place_id": place["id"], "rating": 4}).json
+
+        for model, url, body in [
+                ("User", '/api/v1/users/{}'.format(user["id"]), {"first_name": "Zorna"}),
+                ("Review", '/api/v1/reviews/{}'.format(review["id"]), {"feedback": "zebra giraffe"}),
+                ("Place", '/api/v1/places/{}'.format(place["id"]), {"name": "Zebra", "price_per_night": 1})]:
+            row_id = url.rsplit("/", 1)[1]
+            before = dict(data.model_data[model][row_id])
+            body["zzz"] = 1
+            self.assertEqual(client.put(url, json=body).status_code, 400, url)
+            self.assertEqual(data.model_data[model][row_id], before, url)
+
+        self.assertEqual(data.review_text_index.search("zebra"), [])
+        self.assertEqual(data.place_text_index.search("zebra"), [])
+        self.assertEqual(data.place_price_index.value(place["id"]), 300)
+        self.assertEqual(data.index_manager.check(), [])
+
+    def test_admin_route_checks_the_worker(self):
+        """Test that the admin route and check_indexes report the drift in the data the worker has in memory"""
+        client = app.test_client()
+        user = client.post('/api/v1/users', json={"first_name": "Hank", "last_name": "McCoy",
+                                                  "email": "beast@krakoa.com", "password": "blue fur"}).json
+
+        # only answered with HBNB_ADMIN=1 and from this machine
+        self.assertEqual(client.get('/api/v1/admin/indexes').status_code, 404)
+        patched = mock.patch.object(app_module, "admin_enabled", True)
+        patched.start()
+        self.addCleanup(patched.stop)
+        self.assertEqual(client.get('/api/v1/admin/indexes', environ_base={"REMOTE_ADDR": "10.0.0.7"}).status_code,
+                         404)
+
+        response = client.get('/api/v1/admin/indexes')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["problems"], [])
+        self.assertIn(["email"], [row["fields"] for row in response.json["indexes"] if row["model"] == "User"])
+
+        if not data.use_sqlite:
+            # changed behind the back of the write path, so the unique index of the emails drifts
+            data.user_data[user["id"]]["email"] = "hank@krakoa.com"
+        body = client.get('/api/v1/admin/indexes').get_data()
+        with mock.patch("data.check_indexes.urlopen", return_value=io.BytesIO(body)) as urlopen:
+            out = io.StringIO()
+            problems = report(WorkerIndexes("http://worker:5000/"), out)
+
+        urlopen.assert_called_once_with("http://worker:5000/api/v1/admin/indexes")
+        if data.use_sqlite:
+            self.assertEqual(problems, [])
+        else:
+            self.assertEqual(len(problems), 1)
+            self.assertTrue(problems[0].startswith("User email (unique): "))
+            self.assertIn("1 problems found", out.getvalue())
+            data.user_data[user["id"]]["email"] = "beast@krakoa.com"
+        client.delete('/api/v1/users/{}'.format(user["id"]))
+
+    def test_admin_route_reports_change_bus(self):
+        """Test that the metrics of the change bus are returned and printed next to the index report"""
+        client = app.test_client()
+        bus = ChangeBus("data/.bus-unused")
+        bus.apply({"origin": 1, "sequence": 1, "sent_at": time.time() - 0.25, "previous_sent_at": None,
+                   "changes": []})
+
+        with mock.patch.object(app_module, "admin_enabled", True):
+            self.assertIsNone(client.get('/api/v1/admin/indexes').json["change_bus"])
+            with mock.patch.object(app_module, "change_bus", bus):
+                stats = client.get('/api/v1/admin/indexes').json["change_bus"]
+
+        self.assertEqual((stats["received"], stats["pid"]), (1, bus.pid))
+        self.assertGreaterEqual(stats["max_lag"], 0.25)
+
+        out = io.StringIO()
+        report_change_bus(stats, out)
+        self.assertIn("1 received", out.getvalue())
+        self.assertIn("max 25", out.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,762 @@
+#!/usr/bin/python3
+""" Unittests for HBnB Evolution Part 1
+
+Testing the in-memory indexes and the routes that use them
+"""
+
+import random
+import threading
+import unittest
+import uuid
+import data
+from app import app
+from data.indexes import (AmenityBitmapIndex, GridIndex, HashIndex, PlaceAmenityIndex, SortedIndex, TextIndex, UniqueIndex,
+                          UniqueConstraintError, haversine_km, tokenize)
+
+
+def post_fixtures(client, country_code):
+    """Post a country, a city, a user and two places of the user. Returns them by name
+
+    The other test files change and delete the records of the test data, so the tests
+    here make their own.
+    """
+    def post(url, data):
+        response = client.post(url, json=data)
+        assert response.status_code == 200, response.get_data(as_text=True)
+        return response.json
+
+    country = post('/api/v1/countries', {"name": "Gotham", "code": country_code})
+    city = post('/api/v1/cities', {"name": "Gotham City", "country_id": country["id"]})
+    user = post('/api/v1/users', {"first_name": "Bruce", "last_name": "Wayne",
+                                  "email": "{}@wayne.com".format(uuid.uuid4()), "password": "alfred"})
+    places = [post('/api/v1/places', {
+        "name": name, "description": "Stately home", "address": "1007 Mountain Drive",
+        "latitude": 40.7, "longitude": -74.0, "number_of_rooms": 20, "bathrooms": 10,
+        "price_per_night": price, "max_guests": 40, "host_user_id": user["id"], "city_id": city["id"]})
+        for name, price in [("Wayne Manor", 500), ("Batcave", 100)]]
+
+    return {"country": country, "city": city, "user": user, "places": places}
+
+
+class TestHashIndex(unittest.TestCase):
+    """Test adding, changing and removing indexed rows"""
+
+    def setUp(self):
+        """Index a few countries by code"""
+        self.index = HashIndex("code")
+        self.index.build([("1", {"code": "CA"}), ("2", {"code": "PH"}), ("3", {"code": "CA"})])
+
+    def test_lookup(self):
+        """Test finding the ids of a value in insertion order"""
+        self.assertEqual(self.index.find("CA"), "1")
+        self.assertEqual(self.index.ids("CA"), ["1", "3"])
+        self.assertIsNone(self.index.find("AU"))
+        self.assertEqual(self.index.ids("AU"), [])
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.ids_of(["CA", "AU"]), {"CA": ["1", "3"], "AU": []})
+
+    def test_update_in_place(self):
+        """Test that a row changed in place moves to its new value"""
+        row = {"code": "PH"}
+        self.index.add("4", row)
+        row["code"] = "AU"
+        self.index.update("4", row)
+
+        self.assertEqual(self.index.ids("PH"), ["2"])
+        self.assertEqual(self.index.find("AU"), "4")
+
+        # adds rows it hasn't seen
+        self.index.update("5", {"code": "NZ"})
+        self.assertEqual(self.index.find("NZ"), "5")
+
+    def test_remove(self):
+        """Test removing rows, including unknown ones"""
+        self.index.remove("1")
+        self.index.remove("616")
+        self.assertEqual(self.index.find("CA"), "3")
+
+        self.index.remove("3")
+        self.assertIsNone(self.index.find("CA"))
+        self.assertEqual(len(self.index), 1)
+
+
+class TestUniqueIndex(unittest.TestCase):
+    """Test finding records that break a unique constraint"""
+
+    def test_conflict(self):
+        """Test that values are compared lower-cased and a record doesn't conflict with itself"""
+        index = UniqueIndex("User", ("email",))
+        index.build([("1", {"email": "Bruce@Wayne.com"})])
+
+        self.assertEqual(index.conflict("2", {"email": "bruce@wayne.COM"}), "1")
+        self.assertIsNone(index.conflict("1", {"email": "bruce@wayne.com"}))
+        self.assertIsNone(index.conflict("2", {"email": "selina@kyle.com"}))
+
+    def test_compound(self):
+        """Test a constraint on two fields together"""
+        index = UniqueIndex("City", ("country_id", "name"))
+        index.build([("1", {"country_id": "US", "name": "Gotham"})])
+
+        self.assertEqual(index.conflict("2", {"country_id": "US", "name": "gotham"}), "1")
+        self.assertIsNone(index.conflict("2", {"country_id": "UK", "name": "Gotham"}))
+
+    def test_check(self):
+        """Test that duplicates and drift from the data are reported"""
+        rows = {"1": {"name": "Wifi"}, "2": {"name": "wifi"}, "3": {"name": "Pool"}}
+        index = UniqueIndex("Amenity", ("name",))
+        index.build(rows.items())
+        self.assertEqual(len(index.check(rows.items())), 1)
+
+        del rows["2"]
+        index.remove("2")
+        self.assertEqual(index.check(rows.items()), [])
+
+        rows["3"]["name"] = "Sauna"
+        rows["4"] = {"name": "Gym"}
+        self.assertEqual(len(index.check(rows.items())), 2)
+
+
+class TestUniqueConstraints(unittest.TestCase):
+    """Test that the POST and PUT routes refuse duplicate unique values with 409"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the Flask test client"""
+        cls.app = app.test_client()
+
+    def test_user_email(self):
+        """Test that an email can only be used once, whatever its case"""
+        email = "{}@daily-planet.com".format(uuid.uuid4())
+        user = {"first_name": "Clark", "last_name": "Kent", "email": email, "password": "krypton"}
+        self.assertEqual(self.app.post('/api/v1/users', json=user).status_code, 200)
+
+        user["email"] = email.upper()
+        self.assertEqual(self.app.post('/api/v1/users', json=user).status_code, 409)
+
+    def test_country_code(self):
+        """Test that a code can't be posted twice or taken by another country"""
+        self.assertEqual(self.app.post('/api/v1/countries', json={"name": "Latveria", "code": "LV"}).status_code, 200)
+        self.assertEqual(self.app.post('/api/v1/countries', json={"name": "Latvia", "code": "LV"}).status_code, 409)
+
+        self.app.post('/api/v1/countries', json={"name": "Sokovia", "code": "SK"})
+        self.assertEqual(self.app.put('/api/v1/countries/SK', json={"code": "LV"}).status_code, 409)
+        self.assertEqual(self.app.get('/api/v1/countries/SK').json["name"], "Sokovia")
+
+    def test_amenity_name(self):
+        """Test that amenity names are unique and a refused PUT changes nothing"""
+        self.assertEqual(self.app.post('/api/v1/amenities', json={"name": "Batpole"}).status_code, 200)
+        self.assertEqual(self.app.post('/api/v1/amenities', json={"name": "BATPOLE"}).status_code, 409)
+
+        other = self.app.post('/api/v1/amenities', json={"name": "Batcomputer"}).json
+        url = '/api/v1/amenities/{}'.format(other["id"])
+        self.assertEqual(self.app.put(url, json={"name": "batpole"}).status_code, 409)
+        self.assertEqual(self.app.get(url).json[0]["name"], "Batcomputer")
+
+        # keeping its own name is fine
+        self.assertEqual(self.app.put(url, json={"name": "Batcomputer"}).status_code, 200)
+
+    def test_city_name_per_country(self):
+        """Test that city names are unique within a country only"""
+        first = self.app.post('/api/v1/countries', json={"name": "Krakoa", "code": "KK"}).json
+        second = self.app.post('/api/v1/countries', json={"name": "Madripoor", "code": "MP"}).json
+
+        city = {"name": "Lowtown", "country_id": first["id"]}
+        self.assertEqual(self.app.post('/api/v1/cities', json=city).status_code, 200)
+        self.assertEqual(self.app.post('/api/v1/cities', json=city).status_code, 409)
+
+        city["country_id"] = second["id"]
+        other = self.app.post('/api/v1/cities', json=city)
+        self.assertEqual(other.status_code, 200)
+
+        response = self.app.put('/api/v1/cities/{}'.format(other.json["id"]), json={"country_id": first["id"]})
+        self.assertEqual(response.status_code, 409)
+
+    def test_concurrent_signups(self):
+        """Test that requests posting the same email at the same moment create one user"""
+        email = "{}@daily-planet.com".format(uuid.uuid4())
+        user = {"first_name": "Lois", "last_name": "Lane", "email": email, "password": "scoops"}
+        barrier = threading.Barrier(8)
+        statuses = []
+
+        def sign_up():
+            client = app.test_client()
+            barrier.wait()
+            statuses.append(client.post('/api/v1/users', json=user).status_code)
+
+        threads = [threading.Thread(target=sign_up) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(statuses), [200] + [409] * 7)
+        self.assertEqual(len([row for row in data.user_data.values() if row["email"] == email]), 1)
+
+    def test_save_record_refuses_duplicates(self):
+        """Test that the write path itself refuses a duplicate and changes nothing"""
+        row = {"id": "duplicate-amenity", "name": "batpole", "created_at": 1.0, "updated_at": 1.0}
+        self.app.post('/api/v1/amenities', json={"name": "Batpole"})
+        with self.assertRaises(UniqueConstraintError) as raised:
+            data.save_record("Amenity", row["id"], row)
+        self.assertEqual(raised.exception.fields, ("name",))
+        self.assertNotIn(row["id"], data.amenity_data)
+
+    def test_consistent(self):
+        """Test that the unique indexes agree with the data after the changes"""
+        self.assertEqual(data.check_unique_constraints(), [])
+
+
+class TestGridIndex(unittest.TestCase):
+    """Test the radius and nearest queries of the coordinates index against a full scan"""
+
+    def setUp(self):
+        """Index random points, with some across the antimeridian and near the poles"""
+        rand = random.Random(616)
+        self.rows = {}
+        for i in range(2000):
+            self.rows[str(i)] = {"latitude": rand.uniform(-90, 90), "longitude": rand.uniform(-180, 180)}
+        for i, (lat, lon) in enumerate([(0, 179.95), (0, -179.95), (89.99, 0), (89.99, 180), (-89.99, 45)]):
+            self.rows["edge{}".format(i)] = {"latitude": lat, "longitude": lon}
+        self.rows["nowhere"] = {"latitude": None, "longitude": None}
+
+        self.index = GridIndex(cell_degrees=1)
+        self.index.build(self.rows.items())
+
+    def scan(self, lat, lon, radius_km):
+        """Returns the ids within radius_km of a point found the slow way, nearest first"""
+        found = []
+        for row_id, row in self.rows.items():
+            if row["latitude"] is not None:
+                distance = haversine_km(lat, lon, row["latitude"], row["longitude"])
+                if distance <= radius_km:
+                    found.append((distance, row_id))
+        return [row_id for _, row_id in sorted(found)]
+
+    def test_within(self):
+        """Test radius queries, including ones crossing the antimeridian and a pole"""
+        for lat, lon, radius_km in [(10, 20, 1500), (0, 180, 50), (0, -179.9, 100),
+                                    (89.5, 100, 200), (-89, -10, 300), (0, 0, 30000)]:
+            found = [row_id for _, row_id in self.index.within(lat, lon, radius_km)]
+            self.assertEqual(found, self.scan(lat, lon, radius_km))
+
+    def test_nearest(self):
+        """Test k nearest queries with and without a radius"""
+        self.assertEqual([row_id for _, row_id in self.index.nearest(0, 180, 3)],
+                         self.scan(0, 180, 30000)[:3])
+        self.assertEqual([row_id for _, row_id in self.index.nearest(45, 45, 10, radius_km=100)],
+                         self.scan(45, 45, 100)[:10])
+        self.assertEqual(len(self.index.nearest(0, 0, 5000)), 2005)
+
+    def test_update_and_remove(self):
+        """Test that moved and removed points are found where they are"""
+        row = self.rows["edge0"]
+        row["latitude"], row["longitude"] = -33.86, 151.21
+        self.index.update("edge0", row)
+        self.assertEqual(self.index.nearest(-33.86, 151.21, 1)[0][1], "edge0")
+        self.assertEqual(self.index.check(self.rows.items()), [])
+
+        self.index.remove("edge0")
+        self.assertNotEqual(self.index.nearest(-33.86, 151.21, 1)[0][1], "edge0")
+        self.assertEqual(len(self.index.check(self.rows.items())), 1)
+
+
+
+class TestSortedIndex(unittest.TestCase):
+    """Test the range queries of the sorted index against a full scan"""
+
+    def setUp(self):
+        """Index random prices in a few cities, with repeated prices and some that aren't numbers"""
+        rand = random.Random(1806)
+        self.rows = {}
+        for i in range(500):
+            self.rows["p{:03}".format(i)] = {"price_per_night": rand.choice([50, 75.5, 100, rand.randint(1, 300)]),
+                                              "city_id": rand.choice(["a", "b", "c"])}
+        self.rows["free"] = {"price_per_night": None, "city_id": "a"}
+        self.rows["odd"] = {"price_per_night": "cheap", "city_id": "a"}
+
+        self.index = SortedIndex("price_per_night")
+        self.index.build(self.rows.items())
+        self.city_index = SortedIndex("price_per_night", group_by="city_id")
+        self.city_index.build(self.rows.items())
+
+    def scan(self, low, high, city_id=None):
+        """Returns (price, id) in the range found the slow way"""
+        return sorted((float(row["price_per_night"]), row_id) for row_id, row in self.rows.items()
+                      if isinstance(row["price_per_night"], (int, float))
+                      and low <= row["price_per_night"] <= high and city_id in (None, row["city_id"]))
+
+    def test_range(self):
+        """Test ranges with and without bounds and by city"""
+        self.assertEqual(self.index.range(), self.scan(0, 1000))
+        self.assertEqual(self.index.range(75.5, 100), self.scan(75.5, 100))
+        self.assertEqual(self.index.range(high=50), self.scan(0, 50))
+        self.assertEqual(self.index.range(1000), [])
+        self.assertEqual(self.city_index.range(50, 200, group="b"), self.scan(50, 200, "b"))
+        self.assertEqual(self.city_index.range(group="nowhere"), [])
+        self.assertEqual(len(self.index), 500)
+
+    def test_pages(self):
+        """Test that paging with after walks the whole range once"""
+        pages = []
+        after = None
+        while True:
+            page = self.city_index.range(50, 100, group="a", after=after, limit=7)
+            if not page:
+                break
+            pages.extend(page)
+            after = page[-1][1]
+        self.assertEqual(pages, self.scan(50, 100, "a"))
+
+        with self.assertRaises(KeyError):
+            self.city_index.range(group="b", after="free")
+
+        # after_key goes on from a row that isn't in the index (any more)
+        value, row_id = self.index.range(limit=10)[4]
+        self.index.remove(row_id)
+        self.assertEqual(self.index.range(after_key=(value, row_id), limit=3), self.index.range(limit=8)[4:7])
+
+    def test_update_and_remove(self):
+        """Test that changed and removed rows move in the order"""
+        self.rows["p000"]["price_per_night"] = 0.5
+        self.rows["p000"]["city_id"] = "c"
+        self.index.update("p000", self.rows["p000"])
+        self.city_index.update("p000", self.rows["p000"])
+        self.assertEqual(self.index.range(limit=1), [(0.5, "p000")])
+        self.assertEqual(self.city_index.range(group="c", limit=1), [(0.5, "p000")])
+        self.assertEqual(self.index.check(self.rows.items()), [])
+        self.assertEqual(self.city_index.check(self.rows.items()), [])
+
+        self.index.remove("p000")
+        self.assertIsNone(self.index.value("p000"))
+        self.assertEqual(self.index.range(0, 0.5), [])
+        self.assertEqual(len(self.index.check(self.rows.items())), 1)
+
+
+class TestPlacesByPrice(unittest.TestCase):
+    """Test the /api/v1/places/by_price route"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the Flask test client and a city with two places"""
+        cls.app = app.test_client()
+        cls.fixtures = post_fixtures(cls.app, "BP")
+        cls.manor, cls.batcave = [place["id"] for place in cls.fixtures["places"]]
+        cls.city_query = "city_id={}".format(cls.fixtures["city"]["id"])
+
+    def by_price(self, query):
+        """Returns the ids of the places found by a query"""
+        response = self.app.get('/api/v1/places/by_price?' + query)
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        return [place["id"] for place in response.json]
+
+    def test_city_range(self):
+        """Test the places of a city in a price range, cheapest first"""
+        self.assertEqual(self.by_price(self.city_query), [self.batcave, self.manor])
+        self.assertEqual(self.by_price(self.city_query + "&min_price=200"), [self.manor])
+        self.assertEqual(self.by_price(self.city_query + "&limit=1&after=" + self.batcave), [self.manor])
+
+    def test_price_change(self):
+        """Test that a new price moves a place in the order"""
+        self.app.put('/api/v1/places/{}'.format(self.manor), json={"price_per_night": 50})
+        self.assertEqual(self.by_price(self.city_query), [self.manor, self.batcave])
+        self.assertIn(self.manor, self.by_price("max_price=50"))
+        self.assertEqual(data.place_city_price_index.check(data.place_data.items()), [])
+        self.app.put('/api/v1/places/{}'.format(self.manor), json={"price_per_night": 500})
+
+    def test_bad_parameters(self):
+        """Test that invalid parameters are a 400 and an unknown city a 404"""
+        for query in ["min_price=cheap", "limit=0", "after=nowhere"]:
+            self.assertEqual(self.app.get('/api/v1/places/by_price?' + query).status_code, 400, query)
+        self.assertEqual(self.app.get('/api/v1/places/by_price?city_id=nowhere').status_code, 404)
+
+
+class TestTextIndex(unittest.TestCase):
+    """Test the words and the ranking of the full-text index"""
+
+    def setUp(self):
+        """Index a few places"""
+        self.rows = {
+            "1": {"name": "Beach House", "description": "A quiet house by the beach", "address": "1 Ocean Rd"},
+            "2": {"name": "City Loft", "description": "Loud, central and close to the beach bars",
+                  "address": "2 Main St"},
+            "3": {"name": "Farm Stay", "description": None, "address": "3 Country Ln"}
+        }
+        self.index = TextIndex(("name", "description", "address"))
+        self.index.build(self.rows.items())
+
+    def test_tokenize(self):
+        """Test that words are lower-cased and split on anything but letters and digits"""
+        self.assertEqual(tokenize("Café-bar, 24/7!"), ["café", "bar", "24", "7"])
+        self.assertEqual(tokenize(None), [])
+
+    def test_search(self):
+        """Test that rows with more of the rarer words rank first"""
+        self.assertEqual([row_id for _, row_id in self.index.search("beach house")], ["1", "2"])
+        self.assertEqual([row_id for _, row_id in self.index.search("BEACH", limit=1)], ["1"])
+        self.assertEqual(self.index.search("castle"), [])
+        self.assertEqual(self.index.search(""), [])
+
+    def test_update_and_remove(self):
+        """Test that changed and removed rows are found by their new words only"""
+        self.rows["3"]["description"] = "A beach hut"
+        self.index.update("3", self.rows["3"])
+        self.assertIn("3", [row_id for _, row_id in self.index.search("hut")])
+        self.assertEqual(self.index.check(self.rows.items()), [])
+
+        self.index.remove("1")
+        self.assertEqual(self.index.search("quiet"), [])
+        self.assertEqual(len(self.index.check(self.rows.items())), 1)
+
+
+class TestSearch(unittest.TestCase):
+    """Test the /api/v1/search route"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the Flask test client, places with their own words and a review"""
+        cls.app = app.test_client()
+        cls.fixtures = post_fixtures(cls.app, "SR")
+        cls.manor, cls.batcave = [place["id"] for place in cls.fixtures["places"]]
+        cls.app.put('/api/v1/places/{}'.format(cls.batcave), json={"description": "Zyzzyva infested grotto"})
+        cls.review = cls.app.post('/api/v1/reviews', json={
+            "feedback": "The zyzzyva were everywhere", "commentor_user_id": cls.fixtures["user"]["id"],
+            "place_id": cls.batcave, "rating": 2}).json
+
+    def search(self, query):
+        """Returns the ids of the places and the reviews found by a query"""
+        response = self.app.get('/api/v1/search?' + query)
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        return ([place["id"] for place in response.json["places"]],
+                [review["id"] for review in response.json["reviews"]])
+
+    def test_places_and_reviews(self):
+        """Test that places and reviews are found by their words"""
+        self.assertEqual(self.search("q=zyzzyva"), ([self.batcave], [self.review["id"]]))
+        self.assertEqual(self.search("q=Grotto"), ([self.batcave], []))
+
+    def test_changes(self):
+        """Test that changed and deleted records are searched by their new words"""
+        self.app.put('/api/v1/places/{}'.format(self.manor), json={"name": "Quetzalcoatl Manor"})
+        self.assertEqual(self.search("q=quetzalcoatl")[0], [self.manor])
+
+        review = self.app.post('/api/v1/reviews', json={
+            "feedback": "Xylophone recital", "commentor_user_id": self.fixtures["user"]["id"],
+            "place_id": self.manor, "rating": 4}).json
+        self.assertEqual(self.search("q=xylophone")[1], [review["id"]])
+        self.app.delete('/api/v1/reviews/{}'.format(review["id"]))
+        self.assertEqual(self.search("q=xylophone")[1], [])
+        self.assertEqual(data.review_text_index.check(data.review_data.items()), [])
+
+    def test_bad_parameters(self):
+        """Test that a missing query or a bad limit is a 400"""
+        for query in ["", "q=+", "q=house&limit=0", "q=house&limit=ten"]:
+            self.assertEqual(self.app.get('/api/v1/search?' + query).status_code, 400, query)
+
+class TestNearbyPlaces(unittest.TestCase):
+    """Test the /api/v1/places/nearby route"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the Flask test client and two places about 43 km apart"""
+        cls.app = app.test_client()
+        places = post_fixtures(cls.app, "NB")["places"]
+        cls.place_ids = [place["id"] for place in places]
+        cls.app.put('/api/v1/places/{}'.format(cls.place_ids[0]), json={"latitude": 70.0, "longitude": 30.0})
+        cls.app.put('/api/v1/places/{}'.format(cls.place_ids[1]), json={"latitude": 70.0, "longitude": 31.15})
+
+    def nearby(self, query):
+        """Returns the ids of the places found by a query"""
+        response = self.app.get('/api/v1/places/nearby?' + query)
+        self.assertEqual(response.status_code, 200)
+        return [place["id"] for place in response.json]
+
+    def test_radius_and_k(self):
+        """Test finding places by distance, by count and by both"""
+        self.assertEqual(self.nearby("lat=70&lon=30.1&radius_km=10"), self.place_ids[:1])
+        self.assertEqual(self.nearby("lat=70&lon=30.1&radius_km=100"), self.place_ids)
+        self.assertEqual(self.nearby("lat=70&lon=31.2&k=2"), self.place_ids[::-1])
+        self.assertEqual(self.nearby("lat=70&lon=31.2&k=2&radius_km=5"), self.place_ids[1:])
+
+        response = self.app.get('/api/v1/places/nearby?lat=70&lon=30&k=1')
+        self.assertEqual(response.json[0]["distance_km"], 0)
+
+    def test_bad_parameters(self):
+        """Test that missing or invalid parameters are a 400"""
+        for query in ["lon=30", "lat=70&lon=east", "lat=91&lon=0", "lat=0&lon=0&k=0", "lat=0&lon=0&radius_km=-1"]:
+            self.assertEqual(self.app.get('/api/v1/places/nearby?' + query).status_code, 400, query)
+
+
+class TestCountryCodeIndex(unittest.TestCase):
+    """Test that the country routes find countries through the code index"""
+
+    # don't forget to include the TESTING = 1 flag at the command line
+    # type in the terminal: TESTING=1 python3 -m unittest tests/test_indexes.py
+    @classmethod
+    def setUpClass(cls):
+        """Set up the Flask test client"""
+        cls.app = app.test_client()
+
+    def test_post_then_get(self):
+        """Test that a new country can be found by its code straight away"""
+        response = self.app.post('/api/v1/countries', json={"name": "Gotham", "code": "GQ"})
+        self.assertEqual(response.status_code, 200)
+
+        response = self.app.get('/api/v1/countries/GQ')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["name"], "Gotham")
+
+    def test_code_change(self):
+        """Test that a country is found by its new code only after the code changes"""
+        self.app.post('/api/v1/countries', json={"name": "Metropolis", "code": "MQ"})
+
+        response = self.app.put('/api/v1/countries/MQ', json={"code": "MR"})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.app.get('/api/v1/countries/MQ').status_code, 404)
+        self.assertEqual(self.app.get('/api/v1/countries/MR').json["name"], "Metropolis")
+
+    def test_unknown_code(self):
+        """Test that an unknown code is a 404"""
+        self.assertEqual(self.app.get('/api/v1/countries/XX').status_code, 404)
+
+
+class TestCitiesByCountryIndex(unittest.TestCase):
+    """Test that the cities of a country are found through the country_id index"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the Flask test client"""
+        cls.app = app.test_client()
+
+    def city_names(self, country_code):
+        """Returns the names of the cities listed for a country"""
+        response = self.app.get('/api/v1/countries/{}/cities'.format(country_code))
+        self.assertEqual(response.status_code, 200)
+        return [city["name"] for city in response.json]
+
+    def test_city_writes(self):
+        """Test that posted, moved and deleted cities are listed under the right country"""
+        first = self.app.post('/api/v1/countries', json={"name": "Wakanda", "code": "WK"}).json
+        second = self.app.post('/api/v1/countries', json={"name": "Genovia", "code": "GV"}).json
+
+        city = self.app.post('/api/v1/cities', json={"name": "Birnin Zana", "country_id": first["id"]}).json
+        self.assertEqual(self.city_names("WK"), ["Birnin Zana"])
+
+        self.app.put('/api/v1/cities/{}'.format(city["id"]), json={"country_id": second["id"]})
+        self.assertEqual(self.city_names("WK"), [])
+        self.assertEqual(self.city_names("GV"), ["Birnin Zana"])
+
+        self.app.delete('/api/v1/cities/{}'.format(city["id"]))
+        self.assertEqual(self.city_names("GV"), [])
+
+
+class TestReviewIndexes(unittest.TestCase):
+    """Test that the reviews of a place or a user are found through their indexes"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the Flask test client and the records the reviews need"""
+        cls.app = app.test_client()
+        fixtures = post_fixtures(cls.app, "RV")
+        cls.user_id = fixtures["user"]["id"]
+        cls.place_id, cls.other_place_id = [place["id"] for place in fixtures["places"]]
+
+    def review_ids(self, url):
+        """Returns the ids of the reviews listed at a url"""
+        response = self.app.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [review["id"] for review in response.json]
+
+    def test_review_writes(self):
+        """Test that posted, moved and deleted reviews are listed under the right place and user"""
+        review = self.app.post('/api/v1/reviews', json={
+            "feedback": "Too many bats", "commentor_user_id": self.user_id,
+            "place_id": self.place_id, "rating": 2}).json
+
+        place_url = '/api/v1/places/{}/review'.format(self.place_id)
+        other_place_url = '/api/v1/places/{}/review'.format(self.other_place_id)
+        user_url = '/api/v1/users/{}/reviews'.format(self.user_id)
+
+        self.assertIn(review["id"], self.review_ids(place_url))
+        self.assertEqual(self.review_ids(user_url)[-1], review["id"])
+
+        response = self.app.put('/api/v1/reviews/{}'.format(review["id"]), json={"place_id": self.other_place_id})
+        self.assertEqual(response.json["place_id"], self.other_place_id)
+        self.assertNotIn(review["id"], self.review_ids(place_url))
+        self.assertIn(review["id"], self.review_ids(other_place_url))
+
+        self.app.delete('/api/v1/reviews/{}'.format(review["id"]))
+        self.assertNotIn(review["id"], self.review_ids(other_place_url))
+        self.assertNotIn(review["id"], self.review_ids(user_url))
+
+    def test_unknown_user(self):
+        """Test that the reviews of an unknown user are a 404"""
+        self.assertEqual(self.app.get('/api/v1/users/616/reviews').status_code, 404)
+
+
+class TestPlaceIndexes(unittest.TestCase):
+    """Test that the places of a host or a city are found through their indexes"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the Flask test client and two places of the same host and city"""
+        cls.app = app.test_client()
+        cls.fixtures = post_fixtures(cls.app, "PL")
+        cls.user_url = '/api/v1/users/{}/places'.format(cls.fixtures["user"]["id"])
+        cls.city_url = '/api/v1/cities/{}/places'.format(cls.fixtures["city"]["id"])
+
+    def place_names(self, url):
+        """Returns the names of the places listed at a url"""
+        response = self.app.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [place["name"] for place in response.json]
+
+    def test_listing(self):
+        """Test listing the places of a host and of a city"""
+        self.assertEqual(self.place_names(self.user_url), ["Wayne Manor", "Batcave"])
+        self.assertEqual(self.place_names(self.city_url), ["Wayne Manor", "Batcave"])
+
+    def test_place_writes(self):
+        """Test that posted, moved and deleted places are listed under the right host and city"""
+        other = post_fixtures(self.app, "PM")
+        other_user_url = '/api/v1/users/{}/places'.format(other["user"]["id"])
+        other_city_url = '/api/v1/cities/{}/places'.format(other["city"]["id"])
+        place_id = other["places"][0]["id"]
+
+        response = self.app.put('/api/v1/places/{}'.format(place_id), json={
+            "host_user_id": self.fixtures["user"]["id"], "city_id": self.fixtures["city"]["id"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.place_names(other_user_url), ["Batcave"])
+        self.assertEqual(self.place_names(other_city_url), ["Batcave"])
+
+        self.assertIn(place_id, [place["id"] for place in self.app.get(self.user_url).json])
+
+        # deleting it leaves the places of setUpClass as they were
+        self.app.delete('/api/v1/places/{}'.format(place_id))
+        self.assertNotIn(place_id, [place["id"] for place in self.app.get(self.city_url).json])
+
+    def test_unknown(self):
+        """Test that unknown users and cities are a 404"""
+        self.assertEqual(self.app.get('/api/v1/users/616/places').status_code, 404)
+        self.assertEqual(self.app.get('/api/v1/cities/616/places').status_code, 404)
+
+
+class TestPlaceAmenityIndex(unittest.TestCase):
+    """Test the place and amenity links in both directions"""
+
+    def setUp(self):
+        """Link a few amenities to places"""
+        self.links = PlaceAmenityIndex({"p1": ["wifi", "pool"], "p2": ["wifi"]})
+
+    def test_lookup(self):
+        """Test looking the links up from either side"""
+        self.assertEqual(self.links.amenities("p1"), ["wifi", "pool"])
+        self.assertEqual(self.links.places("wifi"), ["p1", "p2"])
+        self.assertEqual(self.links.places("sauna"), [])
+        self.assertEqual(self.links.amenities_of(["p1", "p3"]), {"p1": ["wifi", "pool"], "p3": []})
+        self.assertTrue(self.links.has("p2", "wifi"))
+        self.assertFalse(self.links.has("p2", "pool"))
+
+        # still reads like the dictionary loaded from the JSON file
+        self.assertEqual(dict(self.links), {"p1": ["wifi", "pool"], "p2": ["wifi"]})
+
+    def test_add_and_remove(self):
+        """Test that links are kept as sets and empty sides disappear"""
+        self.links.add("p2", "wifi")
+        self.links.add("p2", "sauna")
+        self.assertEqual(self.links.amenities("p2"), ["wifi", "sauna"])
+
+        self.links.remove("p1", "pool")
+        self.links.remove("p1", "sauna")
+        self.assertEqual(self.links.places("pool"), [])
+
+        self.links.remove("p2", "wifi")
+        self.links.remove("p2", "sauna")
+        self.assertNotIn("p2", self.links)
+        self.assertEqual(self.links.places("wifi"), ["p1"])
+
+
+class TestAmenityBitmapIndex(unittest.TestCase):
+    """Test filtering the places by the amenities they have and don't have"""
+
+    def setUp(self):
+        """Index a few places and link amenities to them"""
+        self.places = {"p{}".format(i): {} for i in range(1, 6)}
+        self.links = PlaceAmenityIndex({"p1": ["wifi", "pool"], "p2": ["wifi", "smoking"], "p3": ["pool"],
+                                        "gone": ["wifi"]})
+        self.bitmaps = AmenityBitmapIndex(self.links)
+        self.bitmaps.build(self.places.items())
+
+    def test_matching(self):
+        """Test combinations of amenities a place must and mustn't have"""
+        self.assertEqual(self.bitmaps.matching(["wifi"]), ["p1", "p2"])
+        self.assertEqual(self.bitmaps.matching(["wifi", "pool"]), ["p1"])
+        self.assertEqual(self.bitmaps.matching(["wifi"], ["smoking"]), ["p1"])
+        self.assertEqual(self.bitmaps.matching(none_of=["wifi", "pool"]), ["p4", "p5"])
+        self.assertEqual(self.bitmaps.matching(["sauna"]), [])
+        self.assertEqual(len(self.bitmaps), 5)
+
+    def test_changes(self):
+        """Test that links and places added or removed change the bitmaps"""
+        self.links.add("p5", "pool")
+        self.links.remove("p1", "pool")
+        self.assertEqual(self.bitmaps.matching(["pool"]), ["p3", "p5"])
+
+        self.bitmaps.remove("p3")
+        del self.places["p3"]
+        self.assertEqual(self.bitmaps.matching(["pool"]), ["p5"])
+
+        # the ordinal of the removed place is reused
+        self.places["p6"] = {}
+        self.bitmaps.add("p6", self.places["p6"])
+        self.assertEqual(self.bitmaps.matching(none_of=["wifi", "pool"]), ["p6", "p4"])
+
+        self.assertEqual(self.bitmaps.check(self.places.items()), [])
+        self.links.bitmaps = None
+        self.links.add("p4", "pool")
+        self.assertEqual(len(self.bitmaps.check(self.places.items())), 1)
+
+
+
+class TestPlaceAmenityRoutes(unittest.TestCase):
+    """Test that the place and amenity routes read the links from both sides"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Set up the Flask test client, two places and an amenity linked to both"""
+        cls.app = app.test_client()
+        fixtures = post_fixtures(cls.app, "AM")
+        cls.place_ids = [place["id"] for place in fixtures["places"]]
+        cls.amenity_id = cls.app.post('/api/v1/amenities', json={"name": "Bat signal"}).json["id"]
+        for place_id in cls.place_ids:
+            data.place_to_amenity_data.add(place_id, cls.amenity_id)
+        cls.other_amenity_id = cls.app.post('/api/v1/amenities', json={"name": "Bat pole"}).json["id"]
+        data.place_to_amenity_data.add(cls.place_ids[0], cls.other_amenity_id)
+
+    def test_amenity_places(self):
+        """Test listing the places of an amenity"""
+        response = self.app.get('/api/v1/amenities/{}/place'.format(self.amenity_id))
+        self.assertEqual(response.json, [{"place_id": place_id} for place_id in self.place_ids])
+
+    def test_place_amenities(self):
+        """Test listing the amenities of a place"""
+        response = self.app.get('/api/v1/places/{}/amenity'.format(self.place_ids[0]))
+        self.assertEqual(response.json, {self.place_ids[0]: [self.amenity_id, self.other_amenity_id]})
+
+    def test_places_filtered_by_amenities(self):
+        """Test listing the places that have some amenities and not others"""
+        def listed(query):
+            response = self.app.get('/api/v1/places?' + query)
+            self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+            return [place["id"] for place in response.json]
+
+        self.assertEqual(listed("amenities={},{}".format(self.amenity_id, self.other_amenity_id)),
+                         self.place_ids[:1])
+        self.assertEqual(listed("amenities={}&exclude_amenities={}".format(self.amenity_id, self.other_amenity_id)),
+                         self.place_ids[1:])
+        self.assertNotIn(self.place_ids[0], listed("exclude_amenities={}".format(self.other_amenity_id)))
+        self.assertEqual(self.app.get('/api/v1/places?amenities=nowhere').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+""" Unittests for HBnB Evolution Part 1
+
+Testing the streaming reader for data files
+"""
+
+import io
+import json
+import unittest
+from data.json_stream import iter_rows
+
+
+class TestIterRows(unittest.TestCase):
+    """Test that rows are streamed exactly as json.load would read them"""
+
+    data_files = ["data/country.json", "data/city.json", "data/amenity.json", "data/place.json",
+                  "data/user.json", "data/review.json", "data/place_to_amenity.json"]
+
+    def test_matches_json_load(self):
+        """Test every data file with chunk sizes that split values in all sorts of places"""
+        for filename in self.data_files:
+            with open(filename, 'r', encoding='utf-8') as f:
+                content = f.read()
+            expected = [(model, row) for model, rows in json.loads(content).items() for row in rows]
+
+            for chunk_size in [1, 3, 7, 64, 64 * 1024]:
+                rows = list(iter_rows(io.StringIO(content), chunk_size=chunk_size))
+                self.assertEqual(rows, expected, "{} with chunk_size {}".format(filename, chunk_size))
+
+    def test_several_models_and_empty_lists(self):
+        """Test files holding more than one model"""
+        content = '{"Place": [], "City": [{"id": "1", "lat": 150.00}] , "User":[ ]}'
+        self.assertEqual(list(iter_rows(io.StringIO(content), chunk_size=2)),
+                         [("City", {"id": "1", "lat": 150.0})])
+        self.assertEqual(list(iter_rows(io.StringIO(" { } "))), [])
+
+    def test_invalid_json(self):
+        """Test that broken files raise ValueError"""
+        for content in ['', '[]', '{"Place": [{"id": "1"}', '{"Place": [{"id": "1"},]}',
+                        '{"Place": [{"id": "1"}]} extra', '{"Place": [{"id": "1"}] "City": []}']:
+            with self.assertRaises(ValueError, msg=content):
+                list(iter_rows(io.StringIO(content), chunk_size=4))
+
+    def test_row_too_large(self):
+        """Test that the buffer is bounded"""
+        content = '{"Place": [{"id": "' + "x" * 1000 + '"}]}'
+        with self.assertRaises(ValueError):
+            list(iter_rows(io.StringIO(content), chunk_size=16, max_buffer_size=100))
+
+
+if __name__ == '__main__':
+    unittest.main()
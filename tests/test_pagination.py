@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+""" Unittests for HBnB Evolution Part 1
+
+Testing the cursor pagination of the list endpoints
+"""
+
+import json
+import unittest
+import uuid
+from unittest import mock
+import app as app_module
+import data
+from flask import jsonify
+from app import app, stream_json_list
+
+
+def amenity_name():
+    """Returns a new amenity name. Names may only have letters and spaces"""
+    return "Pager " + "".join(chr(ord("a") + int(digit, 16)) for digit in uuid.uuid4().hex[:12])
+
+
+class TestPagination(unittest.TestCase):
+    """Test paging through the lists with ?limit= and ?cursor="""
+
+    # don't forget to include the TESTING = 1 flag at the command line
+    # type in the terminal: TESTING=1 python3 -m unittest tests/test_pagination.py
+    @classmethod
+    def setUpClass(cls):
+        """Set up the Flask test client and a few amenities to page through"""
+        cls.app = app.test_client()
+        cls.amenity_ids = [cls.app.post('/api/v1/amenities', json={"name": amenity_name()}).json["id"]
+                           for _ in range(5)]
+
+    def pages(self, url, limit, query=""):
+        """Returns the ids of every record listed at a url, a page at a time, and the number of pages"""
+        ids = []
+        pages = 0
+        query = "?{}limit={}".format(query, limit)
+        first = query
+        while True:
+            response = self.app.get(url + query)
+            self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+            self.assertLessEqual(len(response.json), limit)
+            ids.extend(row["id"] for row in response.json)
+            pages += 1
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                return ids, pages
+            query = "{}&cursor={}".format(first, cursor)
+
+    def test_every_list(self):
+        """Test that paging lists every record once, in the order they were created"""
+        for url, model in [('/api/v1/users', "User"), ('/api/v1/countries', "Country"), ('/api/v1/cities', "City"),
+                           ('/api/v1/reviews', "Review"), ('/api/v1/amenities', "Amenity"),
+                           ('/api/v1/places', "Place")]:
+            records = data.model_data[model]
+            expected = [row_id for _, row_id in sorted((row["created_at"], row_id)
+                                                       for row_id, row in records.items())]
+            ids, pages = self.pages(url, 2)
+            self.assertEqual(ids, expected, url)
+            self.assertEqual(pages, max(1, -(-len(expected) // 2)), url)
+
+    def test_without_limit(self):
+        """Test that without limit or cursor the whole list is returned as before"""
+        response = self.app.get('/api/v1/amenities')
+        self.assertEqual(len(response.json), len(data.amenity_data))
+        self.assertNotIn("X-Next-Cursor", response.headers)
+
+    def test_deleted_cursor_record(self):
+        """Test that a page continues after the record in the cursor even when it was deleted"""
+        extra, _ = [self.app.post('/api/v1/amenities', json={"name": amenity_name()}).json["id"] for _ in range(2)]
+        ids, _ = self.pages('/api/v1/amenities', 1000)
+        position = ids.index(extra)
+
+        response = self.app.get('/api/v1/amenities?limit={}'.format(position + 1))
+        cursor = response.headers["X-Next-Cursor"]
+        self.assertEqual(response.json[-1]["id"], extra)
+        self.app.delete('/api/v1/amenities/{}'.format(extra))
+
+        response = self.app.get('/api/v1/amenities?limit=1000&cursor={}'.format(cursor))
+        self.assertEqual([row["id"] for row in response.json], ids[position + 1:])
+
+    def test_filtered_places(self):
+        """Test paging through the places filtered by an amenity"""
+        amenity_id = self.amenity_ids[0]
+        place_ids = [place_id for place_id, _ in sorted(data.place_data.items(), key=lambda item: item[1]["created_at"])]
+        for place_id in place_ids:
+            data.place_to_amenity_data.add(place_id, amenity_id)
+
+        ids, _ = self.pages('/api/v1/places', 1, "amenities={}&".format(amenity_id))
+        self.assertEqual(ids, place_ids)
+
+        for place_id in place_ids:
+            data.place_to_amenity_data.remove(place_id, amenity_id)
+
+    def test_bad_parameters(self):
+        """Test that an invalid limit or cursor is a 400"""
+        for query in ["limit=0", "limit=1001", "limit=ten", "cursor=nonsense", "cursor=WzEsMl0"]:
+            self.assertEqual(self.app.get('/api/v1/users?' + query).status_code, 400, query)
+
+
+
+class TestStreaming(unittest.TestCase):
+    """Test that the lists are streamed a chunk at a time"""
+
+    def test_chunks(self):
+        """Test that the chunks of a streamed list join up into the same JSON as a whole list"""
+        items = [{"id": str(i), "name": "x" * 100} for i in range(50)]
+        with mock.patch.object(app_module, "STREAM_CHUNK_SIZE", 1000):
+            chunks = list(stream_json_list(iter(items)))
+        self.assertGreater(len(chunks), 4)
+        self.assertTrue(all(len(chunk) < 1200 for chunk in chunks))
+        self.assertEqual(json.loads("".join(chunks)), items)
+        self.assertEqual(json.loads("".join(stream_json_list(iter([])))), [])
+
+    def test_streamed_list(self):
+        """Test that a list endpoint streams the same records as the data"""
+        response = app.test_client().get('/api/v1/places')
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, "application/json")
+        self.assertEqual(sorted(place["id"] for place in response.json), sorted(data.place_data))
+
+    def test_streamed_like_jsonify(self):
+        """Test that a streamed list has the same bytes as jsonify gives for the same records"""
+        response = app.test_client().get('/api/v1/users')
+        with app.app_context():
+            self.assertEqual(response.get_data(), jsonify(response.json).get_data())
+
+    def test_delete_while_streaming(self):
+        """Test that a record deleted while its list is being sent is left out"""
+        client = app.test_client()
+        amenity_id = client.post('/api/v1/amenities', json={"name": amenity_name()}).json["id"]
+
+        with app.test_request_context('/api/v1/amenities'):
+            response = app_module.amenity_get()
+        data.delete_record("Amenity", amenity_id)
+        listed = json.loads("".join(response.response))
+        self.assertEqual(len(listed), len(data.amenity_data))
+        self.assertNotIn(amenity_id, [amenity["id"] for amenity in listed])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+""" Unittests for HBnB Evolution Part 1
+
+Testing the memory-mapped place columns
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from data.file_storage import FileStorage
+from data.place_columns import ColumnarPlaceData, PlaceColumns
+
+
+class TestPlaceColumns(unittest.TestCase):
+    """Test that the columns file reads back the place data"""
+
+    def setUp(self):
+        """Write the place data to a columns file"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, "place.columns")
+        self.expected = FileStorage().load_model_data("data/place.json")
+
+        # a row with non-ASCII text and a null value
+        self.expected["x"] = dict(next(iter(self.expected.values())), id="x", name="Café Zoë", max_guests=None)
+        # a row with whole numbers, a missing field, a field of its own and values that don't fit their columns
+        self.expected["y"] = {"id": "y", "name": "Arkham", "description": None, "price_per_night": 150,
+                              "created_at": 1700000000, "latitude": "41.1", "bathrooms": True,
+                              "max_guests": 2 ** 60, "pets": {"dogs": False}}
+
+        PlaceColumns.write(self.filename, self.expected.values(), "data/place.json")
+        self.columns = PlaceColumns(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_rows(self):
+        """Test that every row and every lookup matches the JSON data"""
+        self.assertEqual(self.columns.count, len(self.expected))
+        for i, (place_id, row) in enumerate(self.expected.items()):
+            self.assertEqual(self.columns.row(i), row)
+            self.assertEqual(self.columns.find(place_id), i)
+        self.assertIsNone(self.columns.find("nowhere"))
+
+    def test_round_trip(self):
+        """Test that the rows of place.json read back with the same fields, values and types"""
+        rows = list(FileStorage().load_model_data("data/place.json").values())
+        filename = os.path.join(self.tmp_dir, "round_trip.columns")
+        PlaceColumns.write(filename, rows, "data/place.json")
+        columns = PlaceColumns(filename)
+
+        read = [columns.row(i) for i in range(columns.count)]
+        self.assertEqual(read, rows)
+        self.assertEqual([{field: type(value) for field, value in row.items()} for row in read],
+                         [{field: type(value) for field, value in row.items()} for row in rows])
+
+        row = self.columns.row(self.columns.find("y"))
+        self.assertEqual(row, self.expected["y"])
+        self.assertIs(type(row["price_per_night"]), int)
+        self.assertIs(row["bathrooms"], True)
+        self.assertNotIn("address", row)
+
+    def test_is_fresh(self):
+        """Test that the columns know which version of the source file they came from"""
+        self.assertTrue(PlaceColumns.is_fresh(self.filename, "data/place.json"))
+        self.assertFalse(PlaceColumns.is_fresh(self.filename, "data/city.json"))
+        self.assertFalse(PlaceColumns.is_fresh(os.path.join(self.tmp_dir, "missing"), "data/place.json"))
+
+    def test_place_data_changes(self):
+        """Test that writes go to memory and are read back over the columns"""
+        place_data = ColumnarPlaceData(self.columns)
+        self.assertEqual(dict(place_data.items()), self.expected)
+
+        place_id = next(iter(self.expected))
+        row = place_data[place_id]
+        row["name"] = "Wayne Manor"
+        place_data[place_id] = row
+        place_data["new"] = {"id": "new", "name": "Batcave"}
+        del place_data["x"]
+
+        self.assertEqual(place_data[place_id]["name"], "Wayne Manor")
+        self.assertEqual(place_data.get("new"), {"id": "new", "name": "Batcave"})
+        self.assertNotIn("x", place_data)
+        self.assertEqual(len(place_data), len(self.expected))
+        self.assertEqual(list(place_data)[-1], "new")
+        self.assertEqual(place_data.take_changes(), ({"new"}, {place_id}, {"x"}))
+
+        # a deleted place can be added back
+        place_data["x"] = self.expected["x"]
+        self.assertEqual(place_data["x"], self.expected["x"])
+        self.assertEqual(place_data.take_changes(), ({"x"}, set(), set()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,9 +5,26 @@ Testing all PUT methods
 """
 
 import unittest
+import data
 from app import app
 
 
+def new_review(client, code):
+    """Posts a country with the code and a city, user, place and review of its own. Returns the place and the review"""
+    country = client.post('/api/v1/countries', json={"name": "Wakanda", "code": code}).json
+    city = client.post('/api/v1/cities', json={"name": "Birnin Zana", "country_id": country["id"]}).json
+    user = client.post('/api/v1/users', json={"first_name": "Shuri", "last_name": "Udaku",
+                                              "email": "shuri@{}.wakanda.com".format(code.lower()),
+                                              "password": "vibranium"}).json
+    place = client.post('/api/v1/places', json={
+        "name": "Golden City", "description": "Hidden", "address": "Wakanda", "latitude": 1.5,
+        "longitude": 30.5, "number_of_rooms": 3, "bathrooms": 2, "price_per_night": 90, "max_guests": 4,
+        "host_user_id": user["id"], "city_id": city["id"]}).json
+    review = client.post('/api/v1/reviews', json={"feedback": "Wakanda forever", "rating": 5,
+                                                 "commentor_user_id": user["id"], "place_id": place["id"]}).json
+    return place, review
+
+
 # --- USER PUT --- #
 class TestUsersPut(unittest.TestCase):
     """Test the '/api/v1/users/<user_id>' PUT endpoint"""
@@ -207,7 +224,7 @@ class TestReviewsPut(unittest.TestCase):
             "feedback": "The place stinks and the floor is dirty",
             "commentor_user_id": "0215a722-a3fc-4f08-9120-f8621147f2be",
             "place_id": "cee845de-c341-4f5a-a0c5-2ca1f4c327b2",
-            "rating": 0.35,                    
+            "rating": 4,
         }
 
         # Send a PUT request to the '/api/v1/reviews/<review_id>' endpoint
@@ -223,7 +240,7 @@ class TestReviewsPut(unittest.TestCase):
         self.assertEqual(review_data["feedback"], "The place stinks and the floor is dirty")
         self.assertEqual(review_data["commentor_user_id"], "0215a722-a3fc-4f08-9120-f8621147f2be")
         self.assertEqual(review_data["place_id"], "cee845de-c341-4f5a-a0c5-2ca1f4c327b2")
-        self.assertEqual(review_data["rating"], 0.35)
+        self.assertEqual(review_data["rating"], 4)
 
     def test_reviews_put_invalid_id(self):
         """Test PUT request with invalid review id"""
@@ -255,6 +272,17 @@ class TestReviewsPut(unittest.TestCase):
         response = self.app.put(f'/api/v1/reviews/{review_id}', json=data)
         self.assertEqual(response.status_code, 400)
 
+    def test_reviews_put_invalid_values(self):
+        """Test PUT request with a place and user that don't exist or a bad rating"""
+        _, review = new_review(self.app, "WA")
+        review_id = review["id"]
+        before = dict(data.review_data[review_id])
+        for values in ({"place_id": "ghost"}, {"commentor_user_id": "ghost"}, {"rating": "bad"}, {"rating": 9},
+                       {"place_id": ["ghost"]}):
+            response = self.app.put(f'/api/v1/reviews/{review_id}', json=values)
+            self.assertEqual(response.status_code, 400, values)
+        self.assertEqual(data.review_data[review_id], before)
+
 
 # --- AMENITY PUT --- #
 class TestAmenitiesPut(unittest.TestCase):
@@ -403,5 +431,16 @@ class TestPlacesPut(unittest.TestCase):
         response = self.app.put(f'/api/v1/places/{place_id}', json=data)
         self.assertEqual(response.status_code, 400)
 
+    def test_places_put_invalid_values(self):
+        """Test PUT request with a host and city that don't exist or values that aren't numbers"""
+        place_id = new_review(self.app, "WB")[0]["id"]
+        before = dict(data.place_data[place_id])
+        for values in ({"city_id": "nope"}, {"host_user_id": "ghost"}, {"price_per_night": "cheap"},
+                       {"latitude": "x"}, {"max_guests": True}, {"name": "  "},
+                       {"name": 7}, {"city_id": ["nope"]}):
+            response = self.app.put(f'/api/v1/places/{place_id}', json=values)
+            self.assertEqual(response.status_code, 400, values)
+        self.assertEqual(data.place_data[place_id], before)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+""" Unittests for HBnB Evolution Part 1
+
+Testing the hash-sharded model files
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from data.file_storage import FileStorage
+from data.shards import read_manifest, reshard, shard_for
+from data.tracked_dict import TrackedDict
+
+
+class TestShards(unittest.TestCase):
+    """Test splitting, loading and saving sharded models"""
+
+    def setUp(self):
+        """Shard a copy of the place data"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.place_filename = os.path.join(self.tmp_dir, "place.json")
+        shutil.copy("data/place.json", self.place_filename)
+        self.manifest_filename = reshard(self.place_filename, 3)
+        self.expected = FileStorage().load_model_data("data/place.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_reshard(self):
+        """Test that every row ends up in the shard its id hashes to"""
+        manifest = read_manifest(self.manifest_filename)
+        self.assertEqual(self.manifest_filename, os.path.join(self.tmp_dir, "place.manifest.json"))
+        self.assertEqual(manifest["model"], "Place")
+        self.assertEqual(len(manifest["shards"]), 3)
+
+        for i, shard_filename in enumerate(manifest["shards"]):
+            for place_id in FileStorage().load_model_data(shard_filename):
+                self.assertEqual(shard_for(place_id, 3), i)
+
+    def test_load(self):
+        """Test that the shards load back into the same data"""
+        storage = FileStorage()
+        self.assertEqual(storage.load_model_data(self.manifest_filename), self.expected)
+        loaded = storage.load_all({"Place": (self.manifest_filename, "model")})
+        self.assertEqual(loaded["Place"], self.expected)
+        self.assertEqual(list(storage.load_timings), ["Place"])
+
+    def test_save_only_changed_shards(self):
+        """Test that saving rewrites just the shard of the changed id"""
+        manifest = read_manifest(self.manifest_filename)
+        place_id = next(iter(self.expected))
+        changed_shard = manifest["shards"][shard_for(place_id, 3)]
+        mtimes = {shard: os.stat(shard).st_mtime_ns for shard in manifest["shards"]}
+
+        place_data = TrackedDict("Place", self.expected)
+        place_data[place_id] = dict(place_data[place_id], name="Wayne Manor")
+
+        storage = FileStorage(journal_filename=os.path.join(self.tmp_dir, "journal.log"))
+        storage.register(place_data, self.manifest_filename)
+        storage.flush()
+        storage.checkpoint()
+
+        for shard in manifest["shards"]:
+            if shard == changed_shard:
+                self.assertNotEqual(os.stat(shard).st_mtime_ns, mtimes[shard])
+            else:
+                self.assertEqual(os.stat(shard).st_mtime_ns, mtimes[shard])
+
+        self.assertEqual(read_manifest(self.manifest_filename)["generation"], 1)
+        self.assertEqual(FileStorage().load_model_data(self.manifest_filename)[place_id]["name"], "Wayne Manor")
+
+    def test_reshard_to_fewer(self):
+        """Test that re-sharding a manifest removes the shards no longer used"""
+        reshard(self.manifest_filename, 1)
+        self.assertEqual(len(read_manifest(self.manifest_filename)["shards"]), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, "place.2.json")))
+        self.assertEqual(FileStorage().load_model_data(self.manifest_filename), self.expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+#!/usr/bin/python3
+""" Unittests for HBnB Evolution Part 1
+
+Testing the SQLite storage engine
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from data.file_storage import FileStorage
+from data.indexes import AmenityBitmapIndex, PlaceAmenityIndex, SortedIndex, TextIndex
+from data.sqlite_storage import SQLiteStorage
+
+
+class TestSQLiteStorage(unittest.TestCase):
+    """Test that the SQLite tables behave like the dictionaries loaded from JSON"""
+
+    files = {
+        "Country": ("data/country.json", "model"),
+        "City": ("data/city.json", "model"),
+        "Place": ("data/place.json", "model"),
+        "Place_to_Amenity": ("data/place_to_amenity.json", "many_to_many")
+    }
+
+    def setUp(self):
+        """Import the JSON files into a new database"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.database = os.path.join(self.tmp_dir, "hbnb.db")
+        self.storage = SQLiteStorage(self.database)
+        self.storage.import_files(self.files)
+        self.expected = FileStorage().load_all(self.files)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_import(self):
+        """Test that the imported tables read back the same as the JSON files"""
+        self.assertEqual(dict(self.storage.table("Country")), self.expected["Country"])
+        self.assertEqual(dict(self.storage.table("Place").items()), self.expected["Place"])
+        self.assertEqual(dict(self.storage.many_to_many()), self.expected["Place_to_Amenity"])
+
+        # tables that have rows are not imported again
+        self.assertEqual(SQLiteStorage(self.database).import_files(self.files), [])
+
+    def test_lookups(self):
+        """Test point lookups and the FK style checks done by the models"""
+        country_data = self.storage.table("Country")
+        country_id = next(iter(self.expected["Country"]))
+
+        self.assertIn(country_id, country_data)
+        self.assertNotIn("616", country_data)
+        self.assertEqual(country_data.get(country_id), self.expected["Country"][country_id])
+        self.assertIsNone(country_data.get("616"))
+        self.assertEqual(len(country_data), len(self.expected["Country"]))
+
+    def test_write(self):
+        """Test inserting, updating and deleting rows"""
+        city_data = self.storage.table("City")
+        city_data["1"] = {"id": "1", "name": "Gotham", "country_id": "2", "created_at": 1.5, "updated_at": 1.5}
+
+        c = city_data["1"]
+        c["name"] = "Metropolis"
+        city_data["1"] = c
+        self.assertEqual(SQLiteStorage(self.database).table("City")["1"]["name"], "Metropolis")
+
+        del city_data["1"]
+        self.assertNotIn("1", city_data)
+        with self.assertRaises(KeyError):
+            del city_data["1"]
+
+    def test_index(self):
+        """Test looking rows up by an indexed column"""
+        country_code_index = self.storage.index("Country", "code")
+        country_id, country = next(iter(self.expected["Country"].items()))
+
+        self.assertEqual(country_code_index.find(country["code"]), country_id)
+        self.assertEqual(country_code_index.ids(country["code"]), [country_id])
+        self.assertIsNone(country_code_index.find("XX"))
+        self.assertEqual(country_code_index.ids("XX"), [])
+
+    def test_batched_lookups(self):
+        """Test looking up several rows, index values and amenity links at once"""
+        place_data = self.storage.table("Place")
+        place_ids = list(self.expected["Place"])
+        with mock.patch("data.sqlite_storage.MAX_QUERY_PARAMETERS", 2):
+            self.assertEqual(place_data.get_many(place_ids + ["616", place_ids[0]]), self.expected["Place"])
+
+            city_ids = [row["city_id"] for row in self.expected["Place"].values()] + ["616"]
+            place_city_index = self.storage.index("Place", "city_id")
+            self.assertEqual(place_city_index.ids_of(city_ids),
+                             {city_id: place_city_index.ids(city_id) for city_id in city_ids})
+
+            links = self.storage.many_to_many()
+            self.assertEqual(links.amenities_of(place_ids + ["616"]),
+                             {place_id: links.amenities(place_id) for place_id in place_ids + ["616"]})
+
+    def test_unique_index(self):
+        """Test finding records that break a unique constraint"""
+        city_data = self.storage.table("City")
+        city_index = self.storage.unique_index("City", ("country_id", "name"))
+        city_id, city = next(iter(self.expected["City"].items()))
+
+        shouting = dict(city, id="1", name=city["name"].upper())
+        self.assertEqual(city_index.conflict("1", shouting), city_id)
+        self.assertIsNone(city_index.conflict(city_id, city))
+        self.assertEqual(city_index.check(), [])
+
+        city_data["1"] = shouting
+        self.assertEqual(len(city_index.check()), 1)
+
+    def test_geo_index(self):
+        """Test the radius and nearest queries on the place coordinates"""
+        places = self.expected["Place"]
+        geo_index = self.storage.geo_index("Place")
+        place_id, place = next(iter(places.items()))
+
+        nearest = geo_index.nearest(place["latitude"], place["longitude"], len(places))
+        self.assertEqual(nearest[0], (0.0, place_id))
+        self.assertEqual(sorted(row_id for _, row_id in nearest), sorted(places))
+        self.assertEqual(geo_index.within(place["latitude"], place["longitude"], 0.001), [(0.0, place_id)])
+
+    def test_sorted_index(self):
+        """Test that the price queries match the in-memory sorted index"""
+        places = self.expected["Place"]
+        place_id, place = next(iter(places.items()))
+        expected = SortedIndex("price_per_night")
+        expected.build(places.items())
+        expected_city = SortedIndex("price_per_night", group_by="city_id")
+        expected_city.build(places.items())
+
+        price_index = self.storage.sorted_index("Place", "price_per_night")
+        self.assertEqual(price_index.range(), expected.range())
+        self.assertEqual(price_index.range(50, 150, after=place_id, limit=3),
+                         expected.range(50, 150, after=place_id, limit=3))
+        self.assertEqual(price_index.value(place_id), float(place["price_per_night"]))
+
+        city_index = self.storage.sorted_index("Place", "price_per_night", group_by="city_id")
+        self.assertEqual(city_index.range(group=place["city_id"]), expected_city.range(group=place["city_id"]))
+        with self.assertRaises(KeyError):
+            city_index.range(group="nowhere", after=place_id)
+
+    def test_text_index(self):
+        """Test that the FTS5 search finds what the in-memory text index finds"""
+        places = self.expected["Place"]
+        place_id, place = next(iter(places.items()))
+        fields = ("name", "description", "address")
+        expected = TextIndex(fields)
+        expected.build(places.items())
+
+        text_index = self.storage.text_index("Place", fields)
+        self.assertEqual(text_index.check(), [])
+        self.assertEqual(sorted(row_id for _, row_id in text_index.search(place["name"])),
+                         sorted(row_id for _, row_id in expected.search(place["name"])))
+
+        place_data = self.storage.table("Place")
+        changed = dict(place, description="Zyzzyva AND near")
+        place_data[place_id] = changed
+        text_index.update(place_id, changed)
+        self.assertEqual([row_id for _, row_id in text_index.search("zyzzyva")], [place_id])
+
+        del place_data[place_id]
+        text_index.remove(place_id)
+        self.assertEqual(text_index.search("zyzzyva"), [])
+        self.assertEqual(text_index.check(), [])
+
+    def test_amenity_index(self):
+        """Test that filtering by amenities matches the in-memory bitmaps"""
+        links = self.expected["Place_to_Amenity"]
+        expected = AmenityBitmapIndex(PlaceAmenityIndex(links))
+        expected.build(self.expected["Place"].items())
+        amenity_index = self.storage.amenity_index()
+
+        amenity_ids = next(amenity_ids for amenity_ids in links.values() if len(amenity_ids) > 1)
+        for all_of, none_of in [(amenity_ids[:1], ()), (amenity_ids[:2], ()), (amenity_ids[:1], amenity_ids[1:2]),
+                                ((), amenity_ids[:1]), (amenity_ids[:1] * 2, ())]:
+            self.assertEqual(sorted(amenity_index.matching(all_of, none_of)),
+                             sorted(expected.matching(all_of, none_of)), (all_of, none_of))
+
+    def test_many_to_many_both_ways(self):
+        """Test the place and amenity links from both sides"""
+        links = self.storage.many_to_many()
+        place_id, amenity_ids = next(iter(self.expected["Place_to_Amenity"].items()))
+
+        self.assertEqual(links.amenities(place_id), amenity_ids)
+        self.assertIn(place_id, links.places(amenity_ids[0]))
+        self.assertEqual(links.amenities("616"), [])
+
+        links.add(place_id, "sauna")
+        links.add(place_id, "sauna")
+        self.assertEqual(links.places("sauna"), [place_id])
+        self.assertTrue(links.has(place_id, "sauna"))
+
+        links.remove(place_id, "sauna")
+        self.assertFalse(links.has(place_id, "sauna"))
+
+
+if __name__ == '__main__':
+    unittest.main()